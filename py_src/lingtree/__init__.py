@@ -20,8 +20,8 @@ from builtins import open, str, bytes
 import optparse
 import sys
 import re
-from .conll import detect_encoding, encoding_equivalent, merge_trees_generic
-from itertools import chain
+from .conll import detect_encoding, encoding_equivalent, att_getter
+from xml.sax.saxutils import quoteattr
 
 def add_tree_options(oparse):
     '''
@@ -29,7 +29,8 @@ def add_tree_options(oparse):
     '''
     oparse.add_option('-F', '--fmt',
                       dest='format',
-                      choices=['json', 'export', 'export4', 'mrg', 'tigerxml'],
+                      choices=['json', 'export', 'export3', 'export4', 'mrg',
+                               'spmrl', 'tigerxml', 'index'],
                       default=None)
     oparse.add_option('-I',
                       help='assume that input file(s) is in this encoding',
@@ -37,6 +38,17 @@ def add_tree_options(oparse):
                       default=None)
     oparse.add_option('--fold', dest='foldspec',
                       help='selected range/fold, e.g. 1-40000 or trainfinal1/5')
+    oparse.add_option('--filter', dest='filterspec',
+                      help='select sentences before parsing them, '
+                      'e.g. len(,40);doc(1,2);match(/^Der /)')
+    oparse.add_option('--shard', dest='shard', metavar='I/N',
+                      help='only read the I-th of N shards of the input')
+    oparse.add_option('--shard-by', dest='shard_by',
+                      choices=['bytes', 'hash'], default='bytes',
+                      help='make shards from byte ranges of the file, '
+                      'which needs Export, JSON or SPMRL input, or from '
+                      'a hash of the sentence number (default: bytes, '
+                      'with hash for other formats)')
 
 default_oparse = optparse.OptionParser()
 add_tree_options(default_oparse)
@@ -44,12 +56,13 @@ default_opts = default_oparse.parse_args([])[0]
 
 stag_re = re.compile('<s(?: ([0-9a-z]+))?> *')
 
-def read_mrg_trees(fname, encoding=None):
+def mrg_lines(f):
+    '''
+    yields (sent_no, line) pairs for a file with bracketed trees,
+    taking sentence numbers from <s ID> tags if present
+    '''
     sent_no = 1
-    if encoding is None:
-        encoding = detect_encoding(fname)
-    for l in open(fname, 'r', encoding=encoding):
-        from . import penn, tree
+    for l in f:
         if l[:2] == '<s':
             m = stag_re.match(l)
             assert m, l
@@ -58,48 +71,57 @@ def read_mrg_trees(fname, encoding=None):
             l = l[m.end():].strip()
             if l.endswith(' </s>'):
                 l = l[:-4]
-        n = penn.line2parse(l)
-        t = tree.Tree()
-        penn.number_ids(t, n)
-        t.roots = n.children
-        for nn in n.children:
-            nn.parent = None
-        t.sent_no = sent_no
+        yield (sent_no, l)
         sent_no += 1
-        yield t
 
-def read_trees(fname, opts=None):
-    """
-    reads trees in a particular format (SPMRL, Export etc.)
-
-    ``fname`` -- the name of the input file
-
-    ``opts`` (default: ``None``)
-    an options object that contains additional information
+def decode_mrg(data):
+    from . import penn, tree
+    sent_no, l, projection = data
+    if projection is not None:
+        t = penn.line2terminals(l, projection)
+        t.sent_no = sent_no
+        return t
+    n = penn.line2parse(l)
+    t = tree.Tree()
+    penn.number_ids(t, n)
+    t.roots = n.children
+    for nn in n.children:
+        nn.parent = None
+    t.sent_no = sent_no
+    return t
 
-    The :func:`add_tree_options` function offers a convenent way to add such
-    options to an existing OptionParser object::
+def mrg_words(data):
+    from . import penn
+    return [x[1] for x in penn.preterminal_re.findall(data[1])]
 
-        oparse = OptionParser()
-        add_tree_options(oparse)
-        oparse.add_option('--frobnicate', action='store_true',
-                          help='Another interesting option')
+def read_mrg_trees(fname, encoding=None, projection=None):
+    if encoding is None:
+        encoding = detect_encoding(fname)
+    for sent_no, l in mrg_lines(open(fname, 'r', encoding=encoding)):
+        yield decode_mrg((sent_no, l, projection))
 
+def read_mrg_raw(fname, encoding=None, projection=None):
+    from .folds import RawSentence
+    if encoding is None:
+        encoding = detect_encoding(fname)
+    for sent_no, l in mrg_lines(open(fname, 'r', encoding=encoding)):
+        yield RawSentence(sent_no, None, (sent_no, l, projection),
+                          decode_mrg, mrg_words)
 
-    returns an iterator over the trees of the treebank (i.e., read_trees
-    has to be called again or the sequence has to be put into a list if you
-    want to be able to jump back and forth within the sequence.
-    """
-    if opts is None:
-        opts = default_oparse.parse_args([])[0]
+def guess_format(fname, opts, guess_version=True):
+    '''
+    returns the input format given in opts, or guesses it from
+    the file name (and, for Negra Export, from the content, unless
+    guess_version is False, in which case it returns 'export')
+    '''
     opt_format = opts.format
     if opt_format is None:
         if fname.endswith('.export3'):
-            opt_format = 'export'
-        elif fname.endswith('.export'):
-            opt_format = 'export_guess'
+            opt_format = 'export3'
         elif fname.endswith('.export4'):
             opt_format = 'export4'
+        elif fname.endswith('.export'):
+            opt_format = 'export_guess'
         elif fname.endswith('.xml'):
             opt_format = 'tigerxml'
         elif fname.endswith('.mrg'):
@@ -108,48 +130,224 @@ def read_trees(fname, opts=None):
             opt_format = 'spmrl'
         elif fname.endswith('.json'):
             opt_format = 'json'
+        elif fname.endswith('.idx'):
+            opt_format = 'index'
         else:
             raise ValueError("Can't guess format for %s (specify -F ...)"%(fname,))
+    if opt_format == 'export':
+        opt_format = 'export3'
     if opt_format == 'export_guess':
+        if not guess_version:
+            return 'export'
         from . import export
         opt_format = export.guess_format_version(fname)
         print("%s: guessed %s"%(fname, opt_format), file=sys.stderr)
-    if opt_format == 'export3':
-        from . import export
-        inputenc = opts.inputenc
-        if inputenc is None:
-            inputenc = detect_encoding(fname)
-        trees = export.read_trees(open(fname, 'r', encoding=inputenc),
-                                  fmt=3)
-    elif opt_format == 'export4':
+    return opt_format
+
+def open_sentences(fname, opts, projection=None, raw=False, want_meta=False):
+    '''
+    opens a treebank file and returns a (meta, sentences) pair, where
+    meta is the header information (for Negra Export, if want_meta is
+    set) or None. With raw=True, the sentences are
+    :class:`lingtree.folds.RawSentence` objects that can be selected
+    before they are parsed.
+    '''
+    opt_format = guess_format(fname, opts)
+    meta = None
+    if opt_format in ['export3', 'export4']:
         from . import export
+        fmt = int(opt_format[-1])
         inputenc = opts.inputenc
         if inputenc is None:
             inputenc = detect_encoding(fname)
-        trees = export.read_trees(open(fname, 'r', encoding=inputenc), fmt=4)
+        f = open(fname, 'r', encoding=inputenc)
+        bos_l = None
+        if want_meta:
+            meta, bos_l = export.read_export_header(f, fmt=fmt)
+            fmt = meta['FMT']
+        shard = shard_lines(fname, opts, opt_format, inputenc)
+        if shard is not None:
+            f.close()
+            f = export.LineReader(shard[0], fname)
+            bos_l = None
+        if raw:
+            trees = export.read_raw_sentences(f, fmt, bos_l, projection)
+        else:
+            trees = export.read_trees(f, fmt, bos_l, projection)
     elif opt_format == 'spmrl':
         from . import spmrl
-        trees = spmrl.read_spmrl(open(fname, 'r', encoding='UTF-8'))
+        f = open(fname, 'r', encoding='UTF-8')
+        first_line = 0
+        shard = shard_lines(fname, opts, opt_format)
+        if shard is not None:
+            f.close()
+            f, first_line = shard
+        if raw:
+            trees = spmrl.read_raw_spmrl(f, projection=projection,
+                                         first_line=first_line)
+        else:
+            trees = spmrl.read_spmrl(f, projection=projection)
     elif opt_format == 'tigerxml':
         from . import tigerxml
-        trees = tigerxml.read_trees(fname)
+        if raw:
+            trees = tigerxml.read_raw_sentences(fname, projection)
+        else:
+            trees = tigerxml.read_trees(fname, projection)
     elif opt_format == 'json':
-        if opts.tree_enc is None:
-            opts.tree_enc = 'UTF-8'
         from . import export
-        trees = export.read_trees_json(open(fname, 'r', encoding='UTF-8'))
+        f = open(fname, 'r', encoding='UTF-8')
+        first_line = 0
+        shard = shard_lines(fname, opts, opt_format)
+        if shard is not None:
+            f.close()
+            f, first_line = shard
+        if raw:
+            trees = export.read_raw_json(f, projection=projection,
+                                         first_line=first_line)
+        else:
+            trees = export.read_trees_json(f, projection=projection,
+                                           first_line=first_line)
     elif opt_format == 'mrg':
-        trees = read_mrg_trees(fname, opts.inputenc)
+        if raw:
+            trees = read_mrg_raw(fname, opts.inputenc, projection)
+        else:
+            trees = read_mrg_trees(fname, opts.inputenc, projection)
+    elif opt_format == 'index':
+        from .index import load_index, read_indexed
+        index = load_index(fname)
+        if want_meta and index.fmt in ['export3', 'export4']:
+            from . import export
+            with open(index.data_fname, 'r', encoding=index.encoding) as f:
+                meta = export.read_export_header(f, fmt=int(index.fmt[-1]))[0]
+        trees = read_indexed(index, projection)
+        if not raw:
+            from .folds import parse_raw
+            trees = parse_raw(trees)
     else:
         print("Input format %s not supported."%(opt_format,), file=sys.stderr)
         sys.exit(1)
-    if opts.foldspec:
-        from .folds import parse_foldspec
-        folder = parse_foldspec(opts.foldspec)
-        trees = folder.apply_filter(trees)
-    return trees
+    return (meta, trees)
+
+def shard_lines(fname, opts, fmt, encoding='UTF-8'):
+    '''
+    returns the lines of the byte range for the --shard option in
+    opts and the number of lines before them, or None if the input
+    is not split by byte ranges. The line count lets JSON and SPMRL
+    sentences keep the line numbers of the whole file.
+    '''
+    from .index import byte_range_formats, shard_range, range_lines, \
+        count_lines_before
+    spec = getattr(opts, 'shard', None)
+    if (spec is None or getattr(opts, 'shard_by', 'bytes') != 'bytes' or
+            fmt not in byte_range_formats):
+        return None
+    from .folds import parse_shardspec
+    shard, n_shards = parse_shardspec(spec)
+    start, end = shard_range(fname, shard, n_shards)
+    first_line = 0
+    if fmt in ['json', 'spmrl']:
+        first_line = count_lines_before(fname, start)
+    return (range_lines(fname, fmt, start, end, encoding), first_line)
+
+def filter_sentences(fname, opts, sents):
+    '''
+    applies the --shard (if it is not done with byte ranges) and
+    --filter selections to a sequence of raw sentences
+    '''
+    from .folds import parse_filterspec, parse_shardspec, shard_filter
+    from .index import byte_range_formats
+    spec = getattr(opts, 'shard', None)
+    if spec is not None:
+        shard, n_shards = parse_shardspec(spec)
+        if (getattr(opts, 'shard_by', 'bytes') != 'bytes' or
+                guess_format(fname, opts, False) not in byte_range_formats):
+            sents = shard_filter(shard, n_shards).apply_filter(sents)
+    filterspec = getattr(opts, 'filterspec', None)
+    if filterspec:
+        sent_filter = parse_filterspec(filterspec)
+        if sent_filter.uses_docs and guess_format(fname, opts, False) not in [
+                'export', 'export3', 'export4', 'index']:
+            raise ValueError('%s: doc() only works for Negra Export files, '
+                             'which have document numbers'%(fname,))
+        sents = sent_filter.apply_filter(sents)
+    return sents
+
+def select_trees(fname, opts, projection=None, want_meta=False, raw=False):
+    '''
+    returns (meta, trees), applying the --shard, --filter and --fold
+    selections from opts. Selection happens on the raw sentences, so
+    that sentences that are not selected are never parsed. With
+    raw=True, the selected sentences are returned without parsing them.
+    '''
+    filterspec = getattr(opts, 'filterspec', None)
+    foldspec = getattr(opts, 'foldspec', None)
+    shardspec = getattr(opts, 'shard', None)
+    if not (raw or filterspec or foldspec or shardspec):
+        return open_sentences(fname, opts, projection, False, want_meta)
+    from .folds import parse_foldspec, parse_raw
+    meta, sents = open_sentences(fname, opts, projection, True, want_meta)
+    sents = filter_sentences(fname, opts, sents)
+    if foldspec:
+        def count():
+            return count_selected(fname, opts, projection)
+        sents = parse_foldspec(foldspec).apply_filter(sents, count)
+    if raw:
+        return (meta, sents)
+    return (meta, parse_raw(sents))
+
+def count_selected(fname, opts, projection=None):
+    '''
+    returns the number of sentences in a file that pass the --shard
+    and --filter selections in opts. Without them, the count comes
+    from the sentence index, or from the sentence boundaries in the
+    file; otherwise the raw sentences are read once more and filtered.
+    '''
+    filterspec = getattr(opts, 'filterspec', None)
+    if not (filterspec or getattr(opts, 'shard', None)):
+        from .index import count_sentences
+        n = count_sentences(fname, guess_format(fname, opts, False))
+        if n is not None:
+            return n
+    sents = open_sentences(fname, opts, projection, True)[1]
+    sents = filter_sentences(fname, opts, sents)
+    n = 0
+    for sent in sents:
+        n += 1
+    return n
+
+def read_trees(fname, opts=None, projection=None):
+    """
+    reads trees in a particular format (SPMRL, Export etc.)
 
-def read_trees_meta(fname, opts=None):
+    ``fname`` -- the name of the input file
+
+    ``opts`` (default: ``None``)
+    an options object that contains additional information
+
+    ``projection`` (default: ``None``)
+    with 'terminals' or a list of terminal attributes (e.g.
+    ``['word', 'cat']``), the readers skip all nonterminal structure
+    and yield :class:`lingtree.tree.Sentence` objects that only have
+    a list of terminals.
+
+    The :func:`add_tree_options` function offers a convenent way to add such
+    options to an existing OptionParser object::
+
+        oparse = OptionParser()
+        add_tree_options(oparse)
+        oparse.add_option('--frobnicate', action='store_true',
+                          help='Another interesting option')
+
+
+    returns an iterator over the trees of the treebank (i.e., read_trees
+    has to be called again or the sequence has to be put into a list if you
+    want to be able to jump back and forth within the sequence.
+    """
+    if opts is None:
+        opts = default_oparse.parse_args([])[0]
+    return select_trees(fname, opts, projection)[1]
+
+def read_trees_meta(fname, opts=None, projection=None):
     """
     reads trees in a particular format (SPMRL, Export etc.),
     returning both metadata and a sequence of trees
@@ -174,184 +372,365 @@ def read_trees_meta(fname, opts=None):
     """
     if opts is None:
         opts = default_oparse.parse_args([])[0]
-    opt_format = opts.format
-    if opt_format is None:
-        if fname.endswith('.export3'):
-            opt_format = 'export'
-        elif fname.endswith('.export4'):
-            opt_format = 'export4'
-        elif fname.endswith('.export'):
-            opt_format = 'export_guess'
-        elif fname.endswith('.xml'):
-            opt_format = 'tigerxml'
-        elif fname.endswith('.mrg'):
-            opt_format = 'mrg'
-        elif fname.endswith('.ptb'):
-            opt_format = 'spmrl'
-        elif fname.endswith('.json'):
-            opt_format = 'json'
-        else:
-            raise ValueError("Can't guess format for %s (specify -F ...)"%(fname,))
-    if opt_format == 'export_guess':
-        from . import export
-        opt_format = export.guess_format_version(fname)
-        print("%s guessed %s"%(fname, opt_format), file=sys.stderr)
-    meta = None
-    if opt_format == 'export4':
-        from . import export
-        if opts.inputenc is None:
-            opts.inputenc = detect_encoding(fname)
-        f = open(fname, 'r', encoding=opts.inputenc)
-        meta, bos_l = export.read_export_header(f, fmt=4,)
-        trees = export.read_trees(f, fmt=meta['FMT'], last_bos=bos_l)
-    elif opt_format == 'export3':
-        from . import export
-        if opts.inputenc is None:
-            opts.inputenc = detect_encoding(fname)
-        f = open(fname, 'r', encoding=opts.inputenc)
-        meta, bos_l = export.read_export_header(f, fmt=3)
-        trees = export.read_trees(f, fmt=3, last_bos=bos_l)
-    elif opts.format == 'spmrl':
-        from . import spmrl
-        trees = spmrl.read_spmrl(open(fname, 'r', encoding='UTF-8'))
-    elif opts.format == 'tigerxml':
-        from . import tigerxml
-        trees = tigerxml.read_trees(fname)
-    elif opts.format == 'json':
-        from . import export
-        trees = export.read_trees_json(open(fname, 'r', encoding='UTF-8'))
-    elif opts.format == 'mrg':
-        trees = read_mrg_trees(fname, opts.inputenc)
-    else:
-        print("Input format %s not supported."%(opts.format,), file=sys.stderr)
-        sys.exit(1)
-    if opts.foldspec:
-        from .folds import parse_foldspec
-        folder = parse_foldspec(opts.foldspec)
-        trees = folder.apply_filter(trees)
-    return (meta, trees)
+    return select_trees(fname, opts, projection, want_meta=True)
 
 def write_trees_meta(fname, trees, meta=None, fmt=None, **kw):
-    if fmt == 'tigerxml':
-        from . import tigerxml
-        with open(fname, 'w', encoding='UTF-8') as f_out:
-            tigerxml.write_tiger_file(f_out, trees, meta)
-    else:
-        from . import export
-        with open(fname, 'w', encoding='UTF-8') as f_out:
-            if fmt in ['export3', 'export4']:
-                export.write_export_file(f_out, trees, meta, fmt)
-            else:
-                export.write_json_file(f_out, trees)
+    '''
+    writes trees to a file in the given format (default: json),
+    with the header information in meta for Export and TigerXML
+    '''
+    from .pipeline import TreeFileWriter
+    with open(fname, 'w', encoding='UTF-8') as f_out:
+        w = TreeFileWriter(f_out, fmt, meta)
+        for t in trees:
+            w.write_tree(t)
+        w.close()
 
-oparse_convert = optparse.OptionParser(usage='%prog [options] input out.json')
+oparse_convert = optparse.OptionParser(
+    usage='%prog [options] input out.json\n'
+    '       %prog [options] input... (outdir/ | template)',
+    description='With a directory or a template such as '
+    '"out/{name}.{ext}" as the last argument, all input files, '
+    'directories and glob patterns are converted, with --jobs '
+    'files at a time.')
 add_tree_options(oparse_convert)
 oparse_convert.add_option('--outfmt', dest='outfmt',
                           help='output format (default:json)',
                           default='json',
                           choices=['json', 'export', 'export4', 'mrg',
-                                   'tigerxml', 'pml'])
+                                   'spmrl', 'ptb', 'tigerxml', 'pml'])
 oparse_convert.add_option('--preproc', dest='preproc',
                           help='file with preprocessing')
 oparse_convert.add_option('--preproc-fmt', dest='preproc_fmt',
                           help='file format of preprocessed data',
                           default='plain',
                           choices=['plain', 'conllx', 'conll09'])
+oparse_convert.add_option('--xform', dest='xforms', action='append',
+                          metavar='NAME',
+                          help='apply a registered tree transform, e.g. '
+                          'secedge2nonprojective (can be repeated)')
+oparse_convert.add_option('--jobs', '-j', dest='jobs', type='int',
+                          help='number of worker processes that parse, '
+                          'transform and format the sentences, or convert '
+                          'files in bulk mode (default: 1)',
+                          default=1)
+oparse_convert.add_option('--force', dest='force', action='store_true',
+                          default=False,
+                          help='in bulk mode, also convert files whose '
+                          'output is newer than the input')
 
-def transformed_trees(trees, xforms):
+def transformed_trees(trees, xforms, num_workers=None, timer=None):
     '''
-    takes a tree iterator and yields transformed trees
+    takes a tree iterator and yields transformed trees. ``xforms``
+    are functions or names of registered transforms (see
+    :mod:`lingtree.xforms`); with ``num_workers``, they are applied
+    in a pool of worker processes, keeping the order of the trees.
     '''
-    for t in trees:
-        for xform in xforms:
-            xform(t)
-        yield t
+    from .xforms import transform_trees
+    return transform_trees(trees, xforms, num_workers, timer=timer)
 
 def convert_main(argv=None):
-    from . import export
+    from .pipeline import convert_file, convert_many, \
+        expand_inputs, is_bulk_target, is_bulk_input
+    from .xforms import XformChain
     opts, args = oparse_convert.parse_args(argv)
-    if len(args) != 2:
+    if len(args) < 2:
         oparse_convert.print_help()
         sys.exit(1)
-    meta, trees = read_trees_meta(args[0], opts)
-    if opts.preproc is not None:
-        trees = merge_trees_generic(trees, opts.preproc, opts.preproc_fmt)
-    write_trees_meta(args[1], trees, meta, opts.outfmt,
-                     **opts.__dict__)
+    xforms = XformChain(opts.xforms or [])
+    try:
+        xforms.resolve()
+    except KeyError as ex:
+        print("Unknown transform: %s" % (ex.args[0],), file=sys.stderr)
+        sys.exit(1)
+    if len(args) == 2 and not is_bulk_target(args[1]) and \
+       not is_bulk_input(args[0]):
+        stats = convert_file(args[0], args[1], opts, xforms,
+                             num_workers=opts.jobs)
+        print("%s: %s" % (args[1], stats.summary()), file=sys.stderr)
+        for line in stats.timer.summary():
+            print("  %s" % (line,), file=sys.stderr)
+        return
+    if not is_bulk_target(args[-1]):
+        print("With several inputs, directories or patterns, the "
+              "output must be a directory "
+              "or a template such as out/{name}.{ext}", file=sys.stderr)
+        sys.exit(1)
+    inputs = expand_inputs(args[:-1])
+    if not inputs:
+        print("No input files found", file=sys.stderr)
+        sys.exit(1)
+    try:
+        stats = convert_many(inputs, args[-1], opts, xforms,
+                             num_workers=opts.jobs, force=opts.force)
+    except ValueError as ex:
+        print(ex, file=sys.stderr)
+        sys.exit(1)
+    print(stats.summary(), file=sys.stderr)
+    if stats.failed:
+        sys.exit(1)
 
 def merge_meta(all_meta):
-    return all_meta[0]
+    '''merges the header information of several treebanks'''
+    from .export import merge_export_headers
+    return merge_export_headers(all_meta)
+
+oparse_join = optparse.OptionParser(usage='%prog [options] input... output')
+add_tree_options(oparse_join)
+oparse_join.add_option('--outfmt', dest='outfmt',
+                       help='output format (default:export)',
+                       default='export',
+                       choices=['json', 'export', 'export4', 'mrg',
+                                'spmrl', 'ptb', 'tigerxml'])
+oparse_join.add_option('--jobs', '-j', dest='jobs', type='int',
+                       help='number of worker processes (default: 1)',
+                       default=1)
+oparse_join.add_option('--keep-ids', dest='renumber', action='store_false',
+                       default=True,
+                       help='keep the sentence and document numbers '
+                       'of the inputs')
+oparse_join.add_option('--no-index', dest='make_index', action='store_false',
+                       default=True,
+                       help='do not write a sentence index (output.idx)')
 
 def join_main(argv=None):
     '''
     merge several treebanks into a single file.
     '''
-    opts, args = oparse_convert.parse_args(argv)
+    from .pipeline import join_files
+    opts, args = oparse_join.parse_args(argv)
     if len(args) < 2:
-        oparse_convert.print_help()
+        oparse_join.print_help()
+        sys.exit(1)
+    stats = join_files(args[:-1], args[-1], opts, num_workers=opts.jobs,
+                       renumber=opts.renumber, make_index=opts.make_index)
+    print("%s: %s" % (args[-1], stats.summary()), file=sys.stderr)
+
+oparse_split = optparse.OptionParser(
+    usage='%prog [options] input [template]',
+    description='Writes the train and test sets of all cross-validation '
+    'folds (as with --fold trainfinal1/10, testfinal1/10, traindev1/10 and '
+    'testdev1/10 for all folds) in a single pass over the input. The '
+    'template for the output names has the fields {split} and {fold} '
+    '(default: {split}{fold}).')
+add_tree_options(oparse_split)
+oparse_split.add_option('--outfmt', dest='outfmt',
+                        help='output format (default:json)',
+                        default='json',
+                        choices=['json', 'export', 'export4', 'mrg',
+                                 'spmrl', 'ptb', 'tigerxml'])
+oparse_split.add_option('-n', '--folds', dest='n_folds', type='int',
+                        default=10,
+                        help='number of folds (default: 10)')
+oparse_split.add_option('--index-only', dest='index_only',
+                        action='store_true', default=False,
+                        help='only write sentence indexes (NAME.idx) '
+                        'that point into the input')
+oparse_split.add_option('--jobs', '-j', dest='jobs', type='int',
+                        help='number of worker processes (default: 1)',
+                        default=1)
+
+def split_main(argv=None):
+    '''
+    writes all cross-validation folds of a treebank at once.
+    '''
+    from .pipeline import split_folds
+    opts, args = oparse_split.parse_args(argv)
+    if len(args) not in [1, 2]:
+        oparse_split.print_help()
+        sys.exit(1)
+    if len(args) == 2:
+        template = args[1]
+    else:
+        template = '{split}{fold}'
+    try:
+        counts = split_folds(args[0], opts.n_folds, template, opts,
+                             num_workers=opts.jobs,
+                             index_only=opts.index_only)
+    except ValueError as ex:
+        print(ex, file=sys.stderr)
         sys.exit(1)
-    all_meta = []
-    all_trees = []
-    for arg in args[:-1]:
-        meta, trees = read_trees_meta(arg, opts)
-        all_meta.append(meta)
-        all_trees.append(trees)
-    meta = merge_meta(all_meta)
-    trees = chain(*all_trees)
-    write_trees_meta(args[-1], trees, meta, opts.outfmt,
-                     **opts.__dict__)
-
-oparse_totext = optparse.OptionParser(usage='%prog [options] input out.json')
+    for name in sorted(counts):
+        print("%s: %d sentences"%(name, counts[name]), file=sys.stderr)
+
+class TextEmitter(object):
+    '''
+    base class for the output formats of lingtree_totext. An emitter
+    turns each tree into strings that it appends to a list of pieces;
+    the subclasses only set separators and provide headers and footers.
+    ``token_attrs`` are the terminal attributes that the emitter reads.
+    '''
+    field_sep = '\t'
+    token_sep = '\n'
+    sent_end = '\n\n'
+
+    def __init__(self, attrs):
+        self.node_values = att_getter(attrs)
+        self.token_attrs = ['word', 'start'] + list(attrs)
+
+    def header(self, t):
+        return None
+
+    def footer(self, t):
+        return None
+
+    def token_fields(self, n):
+        return (n.word,) + self.node_values(n)
+
+    def emit(self, t, pieces):
+        items = []
+        header = self.header(t)
+        if header is not None:
+            items.append(header)
+        field_sep = self.field_sep
+        token_fields = self.token_fields
+        items += [field_sep.join(token_fields(n)) for n in t.terminals]
+        footer = self.footer(t)
+        if footer is not None:
+            items.append(footer)
+        pieces.append(self.token_sep.join(items))
+        pieces.append(self.sent_end)
+
+    def finish(self, pieces):
+        pass
+
+class LineEmitter(TextEmitter):
+    '''one sentence per line, attributes separated by underscores'''
+    field_sep = '_'
+    token_sep = ' '
+    sent_end = '\n'
+
+class CQPEmitter(TextEmitter):
+    '''one token per line with <s> tags, as used by the CWB/CQP'''
+    sent_end = '\n'
+
+    def header(self, t):
+        if hasattr(t, 'sent_no'):
+            return '<s id="%s">'%(t.sent_no,)
+        return '<s>'
+
+    def footer(self, t):
+        return '</s>'
+
+class ChunkEmitter(LineEmitter):
+    '''one sentence per line with <s> tags'''
+    def header(self, t):
+        if hasattr(t, 'sent_no'):
+            return '<s %s>'%(t.sent_no,)
+        return '<s>'
+
+    def footer(self, t):
+        return '</s>'
+
+class CoNLLEmitter(TextEmitter):
+    '''token number, word and attributes'''
+    def token_fields(self, n):
+        return (str(n.start+1), n.word) + self.node_values(n)
+
+class CoNLLUEmitter(TextEmitter):
+    '''
+    CoNLL-U, with lemma, cpos, cat, morph and the dependency
+    columns filled from the tree. Additional attributes go into
+    the MISC column.
+    '''
+    def __init__(self, attrs):
+        self.node_values = att_getter(['lemma', 'cpos', 'cat', 'morph'])
+        self.token_attrs = ['word', 'start', 'lemma', 'cpos', 'cat', 'morph',
+                            'syn_parent', 'syn_label'] + list(attrs)
+        self.extra_names = list(attrs)
+        self.extra_values = att_getter(attrs, None)
+
+    def header(self, t):
+        if hasattr(t, 'sent_no'):
+            return '# sent_id = %s'%(t.sent_no,)
+        return None
+
+    def token_fields(self, n):
+        parent = getattr(n, 'syn_parent', None)
+        if parent is None:
+            head = '0'
+        else:
+            head = str(parent.start + 1)
+        label = getattr(n, 'syn_label', None) or '_'
+        misc = ['%s=%s'%(k, v)
+                for (k, v) in zip(self.extra_names, self.extra_values(n))
+                if v is not None]
+        return ((str(n.start+1), n.word) + self.node_values(n) +
+                (head, label, '_', '|'.join(misc) or '_'))
+
+    def emit(self, t, pieces):
+        if not t.terminals:
+            return
+        TextEmitter.emit(self, t, pieces)
+
+class VerticalEmitter(CQPEmitter):
+    '''
+    CWB vertical format with structural attributes: <text> regions
+    for documents (if the trees have a doc_no) and <s> regions with
+    id and length
+    '''
+    def __init__(self, attrs):
+        CQPEmitter.__init__(self, attrs)
+        self.doc_no = None
+
+    def header(self, t):
+        s_attrs = ' len="%d"'%(len(t.terminals),)
+        if hasattr(t, 'sent_no'):
+            s_attrs = ' id=%s%s'%(quoteattr(str(t.sent_no)), s_attrs)
+        doc_no = getattr(t, 'doc_no', None)
+        if doc_no is None or doc_no == self.doc_no:
+            return '<s%s>'%(s_attrs,)
+        if self.doc_no is None:
+            text_start = ''
+        else:
+            text_start = '</text>\n'
+        self.doc_no = doc_no
+        return '%s<text id=%s>\n<s%s>'%(
+            text_start, quoteattr(str(doc_no)), s_attrs)
+
+    def finish(self, pieces):
+        if self.doc_no is not None:
+            pieces.append('</text>\n')
+
+totext_emitters = {
+    'txt': TextEmitter,
+    'line': LineEmitter,
+    'cqp': CQPEmitter,
+    'chk': ChunkEmitter,
+    'conll': CoNLLEmitter,
+    'conllu': CoNLLUEmitter,
+    'vrt': VerticalEmitter,
+}
+
+oparse_totext = optparse.OptionParser(usage='%prog [options] input out.txt')
 add_tree_options(oparse_totext)
 oparse_totext.add_option('-P', dest='attrs',
                          help='additional attribute',
-                         default=[], action='append')
+                         action='append')
 oparse_totext.add_option('--outfmt', dest='outfmt',
                          help='output format (default:txt)',
                          default='txt',
-                         choices=['txt', 'line', 'cqp', 'chk', 'conll'])
+                         choices=sorted(totext_emitters.keys()))
 
 def totext_main(argv=None):
     opts, args = oparse_totext.parse_args(argv)
     if len(args) != 2:
         oparse_totext.print_help()
         sys.exit(1)
-    if opts.outfmt in ['line', 'chk']:
-        field_sep = '_'
-        line_sep = ' '
+    emitter = totext_emitters[opts.outfmt](opts.attrs or [])
+    # Token only has a fixed set of attributes
+    from .tree import Token
+    if set(emitter.token_attrs).issubset(Token.__slots__):
+        projection = 'terminals'
     else:
-        field_sep = '\t'
-        line_sep = '\n'
-    trees = read_trees(args[0], opts)
+        projection = None
+    trees = read_trees(args[0], opts, projection=projection)
     with open(args[1], 'w', encoding='UTF-8') as f_out:
+        pieces = []
         for t in trees:
-            lines = []
-            if opts.outfmt == 'cqp':
-                if hasattr(t, 'sent_no'):
-                    lines.append('<s id="%s">'%(t.sent_no))
-                else:
-                    lines.append('<s>')
-            elif opts.outfmt == 'chk':
-                if hasattr(t, 'sent_no'):
-                    lines.append('<s %s>'%(t.sent_no))
-                else:
-                    lines.append('<s>')
-            for n in t.terminals:
-                w = n.word
-                if opts.outfmt == 'conll':
-                    cols = [str(n.start+1), n.word]
-                else:
-                    cols = [n.word]
-                for col in opts.attrs:
-                    col_val = getattr(n, col, '_')
-                    if col_val is None:
-                        col_val = '_'
-                    cols.append(col_val)
-                lines.append(field_sep.join(cols))
-            if opts.outfmt in ['cqp', 'chk']:
-                lines.append('</s>')
-            f_out.write(line_sep.join(lines))
-            if opts.outfmt in ['line', 'cqp', 'chk']:
-                f_out.write('\n')
-            elif opts.outfmt in ['txt', 'conll']:
-                f_out.write('\n\n')
+            emitter.emit(t, pieces)
+            if len(pieces) >= 8192:
+                f_out.write(''.join(pieces))
+                pieces = []
+        emitter.finish(pieces)
+        f_out.write(''.join(pieces))
@@ -0,0 +1,315 @@
+# Copyright 2008-2020 Yannick Versley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+# TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+# CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+'''
+converts batches of trees into padded NumPy arrays (and back),
+as needed for training and running neural parsers.
+
+A batch is a dictionary with the following arrays, where B is the
+number of trees, L the maximal number of tokens and M the maximal
+number of nonterminal nodes:
+
+* ``lengths`` [B]: number of tokens
+* ``words``, ``tags``, ``term_edges`` [B, L]: ids of word, POS tag and
+  edge label of each token (0 is padding)
+* ``term_parents`` [B, L]: index of the parent nonterminal, -1 for roots
+* ``heads`` [B, L]: dependency head (1-based, 0 for the root), from
+  syn_parent; -1 for padding and tokens without syn_parent
+* ``n_spans`` [B]: number of nonterminals
+* ``span_starts``, ``span_ends`` [B, M]: token span of each nonterminal
+* ``span_labels``, ``span_edges`` [B, M]: ids of category and edge label
+* ``span_parents`` [B, M]: index of the parent nonterminal, -1 for roots
+
+Nonterminals are listed top-down, so that parents come before their
+children. Because terminals and nonterminals point to their parents,
+discontinuous trees survive the round trip.
+
+This module needs numpy.
+'''
+from __future__ import print_function
+from itertools import chain
+import numpy as np
+from .tree import Tree, TerminalNode, NontermNode
+
+PAD = '<PAD>'
+UNK = '<UNK>'
+
+
+class Vocabulary(object):
+    '''
+    interns strings as consecutive integer ids, with 0 for padding
+    and 1 for unknown items. Once frozen, new strings map to the
+    unknown id instead of being added.
+    '''
+    def __init__(self, items=(), frozen=False):
+        self.words = [PAD, UNK]
+        self.ids = {PAD: 0, UNK: 1}
+        for item in items:
+            self.add(item)
+        self.frozen = frozen
+
+    def add(self, item):
+        try:
+            return self.ids[item]
+        except KeyError:
+            idx = len(self.words)
+            self.ids[item] = idx
+            self.words.append(item)
+            return idx
+
+    def __getitem__(self, item):
+        try:
+            return self.ids[item]
+        except KeyError:
+            if self.frozen:
+                return 1
+            return self.add(item)
+
+    def __len__(self):
+        return len(self.words)
+
+    def freeze(self):
+        self.frozen = True
+
+    def lookup(self, items):
+        '''returns the ids of a sequence of strings'''
+        ids = self.ids
+        if self.frozen:
+            return [ids.get(x, 1) for x in items]
+        getitem = self.__getitem__
+        return [getitem(x) for x in items]
+
+    def decode(self, ids):
+        '''returns the strings for a sequence of ids'''
+        words = self.words
+        return [words[i] for i in ids]
+
+
+def make_vocabs():
+    '''
+    returns a dictionary with empty vocabularies for words,
+    POS tags, nonterminal labels and edge labels
+    '''
+    return dict([(k, Vocabulary()) for k in ['word', 'tag', 'label', 'edge']])
+
+
+def pad_sequences(seqs, fill=0, dtype=np.int32):
+    '''
+    turns a list of integer sequences into a padded 2D array,
+    with a single scatter over the whole batch
+    '''
+    lengths = np.array([len(x) for x in seqs], dtype=np.int64)
+    n_rows = len(seqs)
+    out = np.full((n_rows, max(int(lengths.max()) if n_rows else 0, 1)),
+                  fill, dtype=dtype)
+    total = int(lengths.sum())
+    if total:
+        flat = np.fromiter(chain.from_iterable(seqs), dtype=dtype, count=total)
+        rows = np.repeat(np.arange(n_rows), lengths)
+        offsets = np.cumsum(lengths) - lengths
+        cols = np.arange(total) - np.repeat(offsets, lengths)
+        out[rows, cols] = flat
+    return out
+
+
+def nonterminals_topdown(t):
+    '''returns the nonterminals of a tree, parents before children'''
+    result = []
+    stack = list(reversed(t.roots))
+    while stack:
+        n = stack.pop()
+        if not n.isTerminal():
+            result.append(n)
+            stack.extend(reversed(n.children))
+    return result
+
+
+def trees_to_arrays(trees, vocabs=None, chart=False):
+    '''
+    converts a batch of trees into a dictionary of padded arrays
+    (see the module documentation). ``vocabs`` is a dictionary of
+    :class:`Vocabulary` objects as returned by :func:`make_vocabs`,
+    which is extended unless the vocabularies are frozen.
+
+    With chart=True, the result also contains ``chart`` [B, L, L],
+    which has the label id of the topmost nonterminal spanning tokens
+    i..j at position (i, j-1), and 0 elsewhere.
+    '''
+    if vocabs is None:
+        vocabs = make_vocabs()
+    words = []
+    tags = []
+    term_edges = []
+    term_parents = []
+    heads = []
+    starts = []
+    ends = []
+    labels = []
+    edges = []
+    parents = []
+    for t in trees:
+        terms = t.terminals
+        nts = nonterminals_topdown(t) if isinstance(t, Tree) else []
+        nt_idx = dict([(id(n), i) for i, n in enumerate(nts)])
+        words.append([n.word for n in terms])
+        tags.append([n.cat for n in terms])
+        term_edges.append([n.edge_label for n in terms])
+        term_parents.append([-1 if n.parent is None else nt_idx[id(n.parent)]
+                             for n in terms])
+        t_heads = []
+        for n in terms:
+            try:
+                head = n.syn_parent
+            except AttributeError:
+                t_heads.append(-1)
+                continue
+            t_heads.append(0 if head is None else head.start + 1)
+        heads.append(t_heads)
+        starts.append([n.start for n in nts])
+        ends.append([n.end for n in nts])
+        labels.append([n.cat for n in nts])
+        edges.append([n.edge_label for n in nts])
+        parents.append([-1 if n.parent is None else nt_idx[id(n.parent)]
+                        for n in nts])
+
+    def lookup(vocab, seqs):
+        # one lookup over the flattened batch, then split again
+        flat = vocab.lookup(list(chain.from_iterable(seqs)))
+        result = []
+        pos = 0
+        for seq in seqs:
+            result.append(flat[pos:pos + len(seq)])
+            pos += len(seq)
+        return result
+    result = {
+        'lengths': np.array([len(x) for x in words], dtype=np.int32),
+        'words': pad_sequences(lookup(vocabs['word'], words)),
+        'tags': pad_sequences(lookup(vocabs['tag'], tags)),
+        'term_edges': pad_sequences(lookup(vocabs['edge'], term_edges)),
+        'term_parents': pad_sequences(term_parents, -1),
+        'heads': pad_sequences(heads, -1),
+        'n_spans': np.array([len(x) for x in labels], dtype=np.int32),
+        'span_starts': pad_sequences(starts),
+        'span_ends': pad_sequences(ends),
+        'span_labels': pad_sequences(lookup(vocabs['label'], labels)),
+        'span_edges': pad_sequences(lookup(vocabs['edge'], edges)),
+        'span_parents': pad_sequences(parents, -1),
+    }
+    if chart:
+        result['chart'] = spans_to_chart(result)
+    return result
+
+
+def spans_to_chart(arrays):
+    '''
+    builds the [B, L, L] label chart from the span arrays. Spans are
+    written in reverse order, so that for unary chains the topmost
+    label wins.
+    '''
+    n_spans = arrays['n_spans']
+    n_batch = len(arrays['lengths'])
+    max_len = arrays['words'].shape[1]
+    chart = np.zeros((n_batch, max_len, max_len), dtype=np.int32)
+    mask = np.arange(arrays['span_labels'].shape[1])[None, :] < n_spans[:, None]
+    rows, cols = np.nonzero(mask[:, ::-1])
+    cols = mask.shape[1] - 1 - cols
+    chart[rows, arrays['span_starts'][rows, cols],
+          arrays['span_ends'][rows, cols] - 1] = arrays['span_labels'][rows, cols]
+    return chart
+
+
+def arrays_to_trees(arrays, vocabs):
+    '''
+    decodes a dictionary of (possibly predicted) arrays back into
+    trees. Only ``lengths``, ``words`` and ``tags`` are required;
+    nonterminals are built if the span arrays are present, and
+    dependencies if ``heads`` is present.
+    '''
+    w_vocab = vocabs['word']
+    t_vocab = vocabs['tag']
+    l_vocab = vocabs['label']
+    e_vocab = vocabs['edge']
+    lengths = np.asarray(arrays['lengths']).tolist()
+    words = np.asarray(arrays['words']).tolist()
+    tags = np.asarray(arrays['tags']).tolist()
+    term_edges = arrays.get('term_edges')
+    term_parents = arrays.get('term_parents')
+    heads = arrays.get('heads')
+    n_spans = arrays.get('n_spans')
+    has_spans = n_spans is not None and term_parents is not None
+    if has_spans:
+        n_spans = np.asarray(n_spans).tolist()
+        term_parents = np.asarray(term_parents).tolist()
+        span_labels = np.asarray(arrays['span_labels']).tolist()
+        span_parents = np.asarray(arrays['span_parents']).tolist()
+        span_edges = arrays.get('span_edges')
+        if span_edges is not None:
+            span_edges = np.asarray(span_edges).tolist()
+    if term_edges is not None:
+        term_edges = np.asarray(term_edges).tolist()
+    if heads is not None:
+        heads = np.asarray(heads).tolist()
+    trees = []
+    for i, n_tok in enumerate(lengths):
+        t = Tree()
+        w_row = w_vocab.decode(words[i][:n_tok])
+        t_row = t_vocab.decode(tags[i][:n_tok])
+        if term_edges is not None:
+            e_row = e_vocab.decode(term_edges[i][:n_tok])
+        else:
+            e_row = [None] * n_tok
+        for j in range(n_tok):
+            n = TerminalNode(t_row[j], w_row[j], e_row[j])
+            n.start = j
+            n.end = j + 1
+            t.terminals.append(n)
+        if has_spans:
+            n_nt = n_spans[i]
+            labels = l_vocab.decode(span_labels[i][:n_nt])
+            if span_edges is not None:
+                nt_edges = e_vocab.decode(span_edges[i][:n_nt])
+            else:
+                nt_edges = [None] * n_nt
+            nts = [NontermNode(labels[k], nt_edges[k]) for k in range(n_nt)]
+            for n, parent_idx in zip(nts, span_parents[i][:n_nt]):
+                if parent_idx < 0:
+                    t.roots.append(n)
+                else:
+                    nts[parent_idx].append(n)
+            for n, parent_idx in zip(t.terminals, term_parents[i][:n_tok]):
+                if parent_idx < 0:
+                    t.roots.append(n)
+                else:
+                    nts[parent_idx].append(n)
+            # drop predicted nonterminals that did not receive any tokens
+            for n in reversed(nts):
+                if not n.children:
+                    if n.parent is None:
+                        t.roots.remove(n)
+                    else:
+                        n.parent.children.remove(n)
+        else:
+            t.roots = t.terminals[:]
+        if heads is not None:
+            for n, head in zip(t.terminals, heads[i][:n_tok]):
+                if head > 0:
+                    n.syn_parent = t.terminals[head - 1]
+                elif head == 0:
+                    n.syn_parent = None
+        t.determine_tokenspan_all()
+        t.renumber_ids()
+        trees.append(t)
+    return trees
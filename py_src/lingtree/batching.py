@@ -0,0 +1,109 @@
+# Copyright 2008-2020 Yannick Versley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+# TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+# CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+'''
+groups trees of similar length into batches, e.g. for
+training neural parsers, without reading the whole
+treebank into memory
+'''
+from __future__ import print_function
+import random
+from operator import itemgetter
+from .parallel import chunked, ordered_map
+
+
+def sent_length(sent):
+    '''
+    number of tokens of a raw sentence or a tree
+    '''
+    try:
+        return sent.n_tokens()
+    except AttributeError:
+        return len(sent.terminals)
+
+
+def token_budget_batches(pairs, max_tokens):
+    '''
+    cuts a sequence of (length, sentence) pairs, sorted by length,
+    into batches where the number of sentences times the length of
+    the longest one (i.e., the size of a padded batch) stays within
+    max_tokens. A sentence that is longer than max_tokens gets a
+    batch of its own.
+    '''
+    batch = []
+    max_len = 0
+    for n, sent in pairs:
+        new_max = max(max_len, n)
+        if batch and new_max * (len(batch) + 1) > max_tokens:
+            yield batch
+            batch = []
+            new_max = n
+        batch.append(sent)
+        max_len = new_max
+    if batch:
+        yield batch
+
+
+def bucket_batches(sents, max_tokens=4096, buffer_size=10000, seed=0,
+                   shuffle=True, length=sent_length):
+    '''
+    groups sentences into batches of similar length.
+
+    Sentences are read into a buffer of ``buffer_size`` sentences,
+    which is sorted by length and cut into batches of at most
+    ``max_tokens`` (padded) tokens. With shuffle=True, sentences of
+    equal length and the batches of each buffer are shuffled, using
+    a random generator seeded with ``seed`` so that the batches are
+    the same for each run.
+    '''
+    rng = random.Random(seed)
+    for pool in chunked(sents, buffer_size):
+        pairs = [(length(sent), sent) for sent in pool]
+        if shuffle:
+            rng.shuffle(pairs)
+        pairs.sort(key=itemgetter(0))
+        batches = list(token_budget_batches(pairs, max_tokens))
+        if shuffle:
+            rng.shuffle(batches)
+        for batch in batches:
+            yield batch
+
+
+def parse_batch(batch):
+    return [raw.parse() for raw in batch]
+
+
+def batched_trees(fname, opts=None, max_tokens=4096, buffer_size=10000,
+                  seed=0, shuffle=True, num_workers=None, prefetch=4,
+                  projection=None):
+    '''
+    reads a treebank and yields lists of trees of similar length.
+
+    The sentences are bucketed by their token count before they are
+    parsed (see :func:`bucket_batches`), and with ``num_workers`` the
+    parsing happens in a pool of worker processes, with up to
+    ``prefetch`` batches per worker prepared ahead of the consumer.
+    '''
+    from . import select_trees, default_oparse
+    if opts is None:
+        opts = default_oparse.parse_args([])[0]
+    raw_sents = select_trees(fname, opts, projection, raw=True)[1]
+    batches = bucket_batches(raw_sents, max_tokens, buffer_size, seed, shuffle)
+    if num_workers and num_workers > 1:
+        max_pending = prefetch * num_workers
+    else:
+        max_pending = None
+    return ordered_map(parse_batch, batches, num_workers, 1, max_pending)
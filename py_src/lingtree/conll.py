@@ -17,11 +17,16 @@
 
 from __future__ import print_function
 import sys
+import os
 import re
 import codecs
+import io
 import optparse
+import tempfile
+from operator import attrgetter
+from collections import deque
+from difflib import SequenceMatcher
 from gzip import GzipFile
-from six.moves import zip_longest
 from .tree import Tree, TerminalNode
 from .folds import do_recombine
 
@@ -352,11 +357,50 @@ def from_unicode(s, encoding):
     else:
         return s.encode(encoding)
 
+def open_output(fname, encoding='UTF-8'):
+    '''
+    opens a file for writing text, compressing it if the
+    name ends in .gz
+    '''
+    if fname.endswith('.gz'):
+        return io.TextIOWrapper(GzipFile(fname, 'wb'), encoding=encoding)
+    else:
+        return io.open(fname, 'w', encoding=encoding)
+
+def att_getter(atts, default='_', replace_empty=False):
+    '''
+    returns a function that maps a node to the tuple of its values
+    for the attributes in atts, with missing or None values (and
+    empty strings, with ``replace_empty``) replaced by default
+    '''
+    atts = list(atts)
+    if not atts:
+        return lambda n: ()
+    get_atts = attrgetter(*atts)
+    if len(atts) == 1:
+        get_one = get_atts
+        get_atts = lambda n: (get_one(n),)
+    def node_values(n):
+        try:
+            vals = get_atts(n)
+        except AttributeError:
+            vals = tuple([getattr(n, att, None) for att in atts])
+        if None in vals:
+            vals = tuple([(default if x is None else x) for x in vals])
+        if replace_empty and '' in vals:
+            vals = tuple([(default if x == '' else x) for x in vals])
+        return vals
+    return node_values
+
 class TabularWriter(object):
     '''
     writes dependency trees in CoNLL format. In contrast to
     pytree_totext, this can also write the dependency column
     and not just text attributes...
+
+    The column specification is turned into a single format
+    string once, and each sentence is written with one call
+    to ``f.write``.
     '''
     def __init__(self, f, att_columns, dep_idx=None,
                  id_idx=0):
@@ -368,51 +412,106 @@ class TabularWriter(object):
         self.dep_idx = dep_idx
         self.id_idx = id_idx
         self.n_cols = n_cols
+        # {0} is the token number, {1} the head, {2}... the attributes
+        fields = []
+        atts = []
+        for i in range(n_cols):
+            if i == id_idx:
+                fields.append('{0}')
+            elif i == dep_idx:
+                fields.append('{1}')
+            elif dep_idx is not None and i == dep_idx + 1:
+                fields.append('{%d}' % (len(atts) + 2,))
+                atts.append('syn_label')
+            elif i >= len(att_columns) or att_columns[i] is None:
+                fields.append('_')
+            else:
+                fields.append('{%d}' % (len(atts) + 2,))
+                atts.append(att_columns[i])
+        self.atts = atts
+        self.format_row = ('\t'.join(fields) + '\n').format
+        # CoNLL has no empty fields
+        self.node_values = att_getter(atts, replace_empty=True)
+
+    def __getstate__(self):
+        # the row format and attribute getter are rebuilt after unpickling
+        return (self.att_columns, self.dep_idx, self.id_idx)
+
+    def __setstate__(self, state):
+        att_columns, dep_idx, id_idx = state
+        self.__init__(None, att_columns, dep_idx, id_idx)
+
     def write_tree(self, t):
         '''
         writes one tree in the selected format
         '''
-        encoding = t.encoding
-        nodes = t.terminals
-        cols = []
-        id_idx = self.id_idx
-        dep_idx = self.dep_idx
-        att_columns = self.att_columns
-        f = self.f
-        for i in range(self.n_cols):
-            if i == id_idx:
-                cols.append([str(j+1) for j in range(len(nodes))])
-            elif i == dep_idx:
-                parents = []
-                for n in nodes:
-                    if n.syn_parent is None:
-                        parents.append('0')
-                    else:
-                        parents.append(str(n.syn_parent.start + 1))
-                cols.append(parents)
-            elif i == dep_idx + 1:
-                dep_labels = [from_unicode(getattr(n, 'syn_label', '_'), encoding)
-                              for n in nodes]
-                cols.append(dep_labels)
+        self.f.write(self.format_tree(t))
+
+    def format_tree(self, t):
+        '''
+        returns the text for one tree in the selected format,
+        including the empty line after it
+        '''
+        format_row = self.format_row
+        node_values = self.node_values
+        rows = []
+        for i, n in enumerate(t.terminals):
+            parent = getattr(n, 'syn_parent', None)
+            if parent is None:
+                head = 0
             else:
-                att = att_columns[i]
-                if att is None:
-                    cols.append(['_' for n in nodes])
-                else:
-                    cols.append([from_unicode(getattr(n, att, '_'), encoding) for n in nodes])
-        for row in zip(*cols):
-            try:
-                print('\t'.join(row), file=f)
-            except:
-                print(row, file=sys.stderr)
-                raise
-        print(file=f)
+                head = parent.start + 1
+            rows.append(format_row(i + 1, head, *node_values(n)))
+        rows.append('\n')
+        return ''.join(rows)
+
+    def write_columns(self, cols):
+        '''
+        writes one sentence given in columnar form, see
+        :meth:`format_columns`
+        '''
+        self.f.write(self.format_columns(cols))
+
+    def format_columns(self, cols):
+        '''
+        returns the text for one sentence given in columnar form,
+        i.e., as a dictionary that maps attribute names to lists of
+        values, with the (1-based) head positions under 'head'.
+        Missing columns, None values and empty strings are written
+        as _, missing
+        heads as 0, so that the result is the same as for
+        :meth:`format_tree` on the corresponding tree.
+        Raises ValueError if the columns differ in length.
+        '''
+        lengths = set([len(x) for x in cols.values()])
+        if len(lengths) > 1:
+            raise ValueError('Columns of different lengths: %s' % (
+                ', '.join(['%s=%d' % (k, len(cols[k]))
+                           for k in sorted(cols)]),))
+        n_tokens = lengths.pop() if lengths else 0
+        lists = [range(1, n_tokens + 1), cols.get('head', [0] * n_tokens)]
+        for att in self.atts:
+            col = cols.get(att)
+            if col is None:
+                col = ['_'] * n_tokens
+            elif None in col or '' in col:
+                col = ['_' if x is None or x == '' else x for x in col]
+            lists.append(col)
+        format_row = self.format_row
+        rows = [format_row(*vals) for vals in zip(*lists)]
+        rows.append('\n')
+        return ''.join(rows)
+
     def write_trees(self, trees):
         '''
         writes a number of trees in the selected format
         '''
+        write_tree = self.write_tree
         for t in trees:
-            self.write_tree(t)
+            write_tree(t)
+
+    def close(self):
+        self.f.close()
 
 def read_generic(fname, encoding=None,
                  tree_encoding=None,
@@ -449,60 +548,274 @@ def read_generic(fname, encoding=None,
     if lines:
         yield lines
 
+def read_blocks(fname, bufsize=1<<20):
+    '''
+    reads a tabular file in large chunks and yields the lines of
+    each sentence as one byte string, without decoding or splitting
+    the lines
+    '''
+    if fname.endswith('.gz'):
+        f = GzipFile(fname, 'rb')
+    else:
+        f = open(fname, 'rb', buffering=bufsize)
+    with f:
+        lines = []
+        for l in f:
+            if l.strip():
+                lines.append(l)
+            elif lines:
+                yield b''.join(lines)
+                lines = []
+        if lines:
+            if not lines[-1].endswith(b'\n'):
+                lines.append(b'\n')
+            yield b''.join(lines)
+
 def write_generic_single(f, lines):
     for line in lines:
         f.write('\t'.join(line)+'\n')
     f.write('\n')
 
 
-def do_merge(fname_orig, fname_merge, preproc_atts,
-             cpos_map=None, use_words=False, fmt_orig=None):
-    #print("fmt_orig:", fmt_orig, file=sys.stderr)
-    trees_orig = read_conll(fname_orig, use_fmt=fmt_orig)
-    trees_merge = read_tabular(fname_merge, preproc_atts)
+def sentence_hash(terminals):
+    '''hash of the word sequence of a sentence'''
+    return hash(tuple([n.word for n in terminals]))
+
+class MergeReport(object):
+    '''
+    counts how the sentences of two files could be matched up in
+    :func:`align_sentences`, and prints the first ``max_messages``
+    problems to stderr
+    '''
+    def __init__(self, max_messages=20, quiet_differ=False):
+        self.max_messages = max_messages
+        self.quiet_differ = quiet_differ
+        self.n_messages = 0
+        self.n_matched = 0
+        self.n_differ = 0
+        self.n_realigned = 0
+        self.n_unmatched = 0
+        self.n_extra = 0
+
+    def message(self, msg):
+        self.n_messages += 1
+        if self.n_messages <= self.max_messages:
+            print(msg, file=sys.stderr)
+        elif self.n_messages == self.max_messages + 1:
+            print("(further mismatches are not shown)", file=sys.stderr)
+
+    def differ(self, words1, words2):
+        self.n_differ += 1
+        if not self.quiet_differ:
+            self.message("Sequences differ: %s vs %s"%(words1, words2))
+
+    def unmatched(self, words1):
+        self.n_unmatched += 1
+        self.message("no match for sentence in original: %s"%(words1,))
+
+    def extra(self, words2):
+        self.n_extra += 1
+        self.message("no match for sentence in merge: %s"%(words2,))
+
+    def ok(self):
+        return self.n_unmatched == 0 and self.n_extra == 0
+
+    def summary(self):
+        return ('%d sentences matched, %d with different words, '
+                '%d realigned, %d unmatched in original, '
+                '%d unmatched in merge')%(
+                    self.n_matched, self.n_differ, self.n_realigned,
+                    self.n_unmatched, self.n_extra)
+
+def _align_region(region_a, region_b, report):
+    '''
+    pairs up the sentences between two matching stretches, by
+    aligning their tokens. Returns a list of (t_orig, merge terminals
+    or None) pairs.
+    '''
+    terms_b = []
+    owner_b = []
+    for k, (h, t) in enumerate(region_b):
+        terms_b += t.terminals
+        owner_b += [k] * len(t.terminals)
+    words_a = [n.word for h, t in region_a for n in t.terminals]
+    target = [None] * len(words_a)
+    matcher = SequenceMatcher(None, words_a, [n.word for n in terms_b],
+                              autojunk=False)
+    for i, j, size in matcher.get_matching_blocks():
+        target[i:i + size] = range(j, j + size)
+    used_b = [False] * len(region_b)
+    found = []
+    pos = 0
+    for h, t in region_a:
+        idx = target[pos:pos + len(t.terminals)]
+        pos += len(t.terminals)
+        if None in idx:
+            found.append(None)
+        else:
+            # all tokens found, possibly in a split or joined sentence
+            found.append(idx)
+            for x in idx:
+                used_b[owner_b[x]] = True
+    same_count = (len(region_a) == len(region_b))
+    result = []
+    for k, (h, t) in enumerate(region_a):
+        idx = found[k]
+        if idx is not None:
+            report.n_realigned += 1
+            result.append((t, [terms_b[x] for x in idx]))
+        elif same_count and not used_b[k] and \
+                len(t.terminals) == len(region_b[k][1].terminals):
+            # same position and length, but different words
+            t_b = region_b[k][1]
+            report.differ([n.word for n in t.terminals],
+                          [n.word for n in t_b.terminals])
+            result.append((t, t_b.terminals))
+            used_b[k] = True
+        else:
+            report.unmatched([n.word for n in t.terminals])
+            result.append((t, None))
+    for k, (h, t) in enumerate(region_b):
+        if not used_b[k]:
+            report.extra([n.word for n in t.terminals])
+    return result
+
+def align_sentences(trees_orig, trees_merge, report=None, window=64):
+    '''
+    matches up the sentences of two streams of trees and yields,
+    for each tree in trees_orig, a pair of the tree and the terminals
+    that correspond to it in trees_merge (or None if there are none).
+
+    Sentences are compared by the hash of their words. Where the
+    hashes diverge, up to ``window`` sentences of each stream are
+    read ahead and realigned by a diff over their hash sequences, so
+    that dropped, added, split or joined sentences only affect the
+    sentences around them. Problems are counted and reported in
+    ``report`` (a :class:`MergeReport`).
+    '''
+    if report is None:
+        report = MergeReport()
+    iter_a = iter(trees_orig)
+    iter_b = iter(trees_merge)
+    buf_a = deque()
+    buf_b = deque()
+
+    def fill(buf, it, n):
+        while len(buf) < n:
+            try:
+                t = next(it)
+            except StopIteration:
+                return False
+            buf.append((sentence_hash(t.terminals), t))
+        return True
+    while True:
+        fill(buf_a, iter_a, 1)
+        fill(buf_b, iter_b, 1)
+        if not buf_a or not buf_b:
+            break
+        if buf_a[0][0] == buf_b[0][0]:
+            report.n_matched += 1
+            t_a = buf_a.popleft()[1]
+            t_b = buf_b.popleft()[1]
+            yield (t_a, t_b.terminals)
+            continue
+        fill(buf_a, iter_a, window)
+        fill(buf_b, iter_b, window)
+        hashes_a = [h for h, t in buf_a]
+        hashes_b = [h for h, t in buf_b]
+        matcher = SequenceMatcher(None, hashes_a, hashes_b, autojunk=False)
+        i, j, size = matcher.find_longest_match(0, len(hashes_a),
+                                                0, len(hashes_b))
+        if size == 0:
+            # nothing matches within the window, go on one at a time
+            i = j = 1
+        else:
+            # start from the first matching sentence
+            for block in matcher.get_matching_blocks():
+                if block[2] > 0:
+                    i, j = block[0], block[1]
+                    break
+        region_a = [buf_a.popleft() for k in range(i)]
+        region_b = [buf_b.popleft() for k in range(j)]
+        for pair in _align_region(region_a, region_b, report):
+            yield pair
+    for h, t in buf_a:
+        report.unmatched([n.word for n in t.terminals])
+        yield (t, None)
+    for t in iter_a:
+        report.unmatched([n.word for n in t.terminals])
+        yield (t, None)
+    for h, t in buf_b:
+        report.extra([n.word for n in t.terminals])
+    for t in iter_b:
+        report.extra([n.word for n in t.terminals])
+
+def copy_columns(terms_orig, terms_merge, atts):
+    '''
+    copies the attributes in atts from one list of terminals to
+    another, one attribute at a time
+    '''
+    for att in atts:
+        values = list(map(attrgetter(att), terms_merge))
+        for n, val in zip(terms_orig, values):
+            setattr(n, att, val)
+
+def merge_annotations(trees_orig, trees_merge, preproc_atts,
+                      use_words=False, cpos_map=None, fill_cpos=True,
+                      report=None):
+    '''
+    copies the attributes in preproc_atts (without 'word', unless
+    use_words is set) from trees_merge to the matching sentences of
+    trees_orig (see :func:`align_sentences`) and yields the trees of
+    trees_orig. cpos is set from cat through cpos_map if it is given,
+    and otherwise copied from cat if fill_cpos is set and cpos is
+    not among the merged attributes, or if fill_cpos is not set and
+    the terminal already has a cpos.
+    '''
+    atts = [att for att in preproc_atts
+            if att is not None and (att != 'word' or use_words)]
     need_cpos = not ('cpos' in preproc_atts)
-    for t_orig, t_merge in zip_longest(trees_orig, trees_merge):
-        if t_orig is None:
-            words2 = [n.word for n in t_merge.terminals]
-            print("more trees in merge: %s"%(
-                words2,), file=sys.stderr)
-            sys.exit(1)
-        elif t_merge is None:
-            words1 = [n.word for n in t_orig.terminals]
-            print("more trees in original: %s"%(
-                words1,), file=sys.stderr)
-            sys.exit(1)
-        words1 = [n.word for n in t_orig.terminals]
-        words2 = [n.word for n in t_merge.terminals]
-        if len(words1) != len(words2):
-            print("Sequences do not match: %s vs %s"%(
-                words1, words2), file=sys.stderr)
-            sys.exit(1)
-        elif words1 != words2:
-            print("Sequences differ: %s vs %s"%(
-                words1, words2), file=sys.stderr)
-        for n, n_merge in zip(t_orig.terminals, t_merge.terminals):
-            for att in preproc_atts:
-                if att is not None:
-                    if att != 'word' or use_words==True:
-                        setattr(n, att, getattr(n_merge, att))
-            # assign cpos if a pos map is given
-            if cpos_map is not None:
+    for t_orig, terms_merge in align_sentences(trees_orig, trees_merge,
+                                               report):
+        terms = t_orig.terminals
+        if terms_merge is not None:
+            copy_columns(terms, terms_merge, atts)
+        # assign cpos if a pos map is given
+        if cpos_map is not None:
+            for n in terms:
                 n.cpos = cpos_map.get(n.cat, n.cat)
-            elif need_cpos:
-                n.cpos = n.cat
+        elif fill_cpos:
+            if need_cpos:
+                for n in terms:
+                    n.cpos = n.cat
+        else:
+            for n in terms:
+                if hasattr(n, 'cpos'):
+                    n.cpos = n.cat
         yield t_orig
 
+def do_merge(fname_orig, fname_merge, preproc_atts,
+             cpos_map=None, use_words=False, fmt_orig=None, report=None):
+    '''
+    reads a CoNLL file and yields its trees with the attributes in
+    preproc_atts merged in from the tabular file fname_merge
+    (see :func:`merge_annotations`)
+    '''
+    trees_orig = read_conll(fname_orig, use_fmt=fmt_orig)
+    trees_merge = read_tabular(fname_merge, preproc_atts)
+    return merge_annotations(trees_orig, trees_merge, preproc_atts,
+                             use_words, cpos_map, True, report)
+
+
+conllx_columns = [None, 'word', 'lemma', 'cpos', 'cat', 'morph',
+                  None, 'syn_label', None, None]
 
 def make_conllx_writer(fname):
     '''
     creates a TabularWriter instance suitable for writing CoNLL-X format.
     '''
-    f = open(fname, 'w')
-    w = TabularWriter(f,
-                      [None, 'word', 'lemma', 'cpos', 'cat', 'morph',
-                       None, 'syn_label', None, None],
-                      dep_idx=6)
+    f = open_output(fname)
+    w = TabularWriter(f, conllx_columns, dep_idx=6)
     return w
 
 def read_mapping(fname, encoding='UTF-8'):
@@ -545,58 +858,119 @@ def merge_main(argv=None):
         cpos_map = None
     else:
         cpos_map = read_mapping(opts.cpos_map)
+    report = MergeReport()
     trees = do_merge(args[0], args[1], preproc_atts,
                      fmt_orig=opts.fmt_orig,
-                     cpos_map=cpos_map)
+                     cpos_map=cpos_map, report=report)
     # TODO: heuristic fix for tag assignment?
     # TODO: add word-specific part of uniset features
     # TODO: add generic filtering mechanism
     w = make_conllx_writer(args[2])
     w.write_trees(trees)
+    w.close()
+    print(report.summary(), file=sys.stderr)
 
 def merge_trees_generic(trees, fname_merge,
                         fmt_preproc='conllx',
                         fmt_orig=None,
                         use_words=False,
-                        cpos_map=None):
+                        cpos_map=None,
+                        report=None):
+    '''
+    merges the attributes of a tabular file in format fmt_preproc
+    into a sequence of trees (see :func:`merge_annotations`)
+    '''
     preproc_atts = PREPROC_COLUMNS[fmt_preproc]
     trees_merge = read_tabular(fname_merge, preproc_atts)
-    for t_orig, t_merge in zip_longest(trees, trees_merge):
-        if t_orig is None:
-            words2 = [n.word for n in t_merge.terminals]
-            print("more trees in merge: %s"%(
-                words2,), file=sys.stderr)
-            sys.exit(1)
-        elif t_merge is None:
-            words1 = [n.word for n in t_orig.terminals]
-            print("more trees in original: %s"%(
-                words1,), file=sys.stderr)
-            sys.exit(1)
-        words1 = [n.word for n in t_orig.terminals]
-        words2 = [n.word for n in t_merge.terminals]
-        if len(words1) != len(words2):
-            print("Sequences do not match: %s vs %s"%(
-                words1, words2), file=sys.stderr)
-            sys.exit(1)
-        elif words1 != words2:
-            pass
-            #print >>sys.stderr, "Sequences differ: %s vs %s"%(
-            #    words1, words2)
-        for n, n_merge in zip(t_orig.terminals, t_merge.terminals):
-            for att in preproc_atts:
-                if att is not None:
-                    if att != 'word' or use_words==True:
-                        setattr(n, att, getattr(n_merge, att))
-            # assign cpos if a pos map is given
-            if cpos_map is not None:
-                n.cpos = cpos_map.get(n.cat, n.cat)
-            elif hasattr(n, 'cpos'):
-                n.cpos = n.cat
-        yield t_orig
+    if report is None:
+        report = MergeReport(quiet_differ=True)
+    return merge_annotations(trees, trees_merge, preproc_atts,
+                             use_words, cpos_map, False, report)
+
 
+def recombine_files(fnames, fname_out, init=1, make_index=False,
+                    sent_ids=None):
+    '''
+    recombines the tabular files of the folds given in fnames (which
+    were distributed round-robin, see :func:`lingtree.folds.do_recombine`)
+    into fname_out, copying the sentences without parsing them.
+
+    With make_index, the sentence index of the output is written to
+    fname_out + '.idx' (see :mod:`lingtree.index`). Sentences are
+    named by their position in the original treebank, or by the
+    corresponding entry of ``sent_ids``, e.g. the sent_nos of the
+    index of the original treebank.
+    Returns the number of sentences.
+    '''
+    from .index import SentenceIndex, index_name
+    blocks = do_recombine([read_blocks(fname) for fname in fnames], init)
+    index = None
+    if make_index:
+        index = SentenceIndex(fname_out, 'conll')
+    offset = 0
+    n_sents = 0
+    # write to temporary files next to the outputs so that an error
+    # does not leave a partial dest.conll or .idx behind
+    tmp_out = _make_temp(fname_out)
+    tmp_idx = None
+    try:
+        with open(tmp_out, 'wb') as f_out:
+            for block in blocks:
+                f_out.write(block)
+                f_out.write(b'\n')
+                if index is not None:
+                    if sent_ids is None:
+                        sent_no = n_sents + 1
+                    elif n_sents < len(sent_ids):
+                        sent_no = sent_ids[n_sents]
+                    else:
+                        n_sents += 1 + sum(1 for block in blocks)
+                        break
+                    index.add(sent_no, offset, len(block))
+                    offset += len(block) + 1
+                n_sents += 1
+        if sent_ids is not None and n_sents != len(sent_ids):
+            raise ValueError('%d sentences recombined, but %d sentence ids'
+                             ' given'%(n_sents, len(sent_ids)))
+        if index is not None:
+            tmp_idx = _make_temp(index_name(fname_out))
+            index.save(tmp_idx)
+        os.replace(tmp_out, fname_out)
+        if tmp_idx is not None:
+            os.replace(tmp_idx, index_name(fname_out))
+    except BaseException:
+        for tmp_name in [tmp_out, tmp_idx]:
+            if tmp_name is not None and os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+        raise
+    return n_sents
+
+def _make_temp(fname):
+    '''
+    creates an empty temporary file in the directory of fname,
+    with the permissions of a normally created file
+    '''
+    fd, tmp_name = tempfile.mkstemp(
+        dir=os.path.dirname(fname) or '.',
+        prefix='.' + os.path.basename(fname) + '.', suffix='.tmp')
+    os.close(fd)
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_name, 0o666 & ~umask)
+    return tmp_name
 
 oparse_recombine = optparse.OptionParser(
     usage="usage: %prog [options] N_FOLDS TEMPLATE dest.conll")
+oparse_recombine.add_option('--dev', dest='init', action='store_const',
+                            const=2, default=1,
+                            help='recombine testdev folds '
+                            '(default: testfinal folds)')
+oparse_recombine.add_option('--index', dest='make_index',
+                            action='store_true', default=False,
+                            help='write a sentence index (dest.conll.idx)')
+oparse_recombine.add_option('--ids', dest='ids_fname', metavar='INDEX',
+                            help='index of the original treebank, whose '
+                            'sentence ids are used in the index')
 
 def recombine_main(argv=None):
     opts, args = oparse_recombine.parse_args(argv)
@@ -605,13 +979,19 @@ def recombine_main(argv=None):
         sys.exit(1)
     n_folds = int(args[0])
     template = args[1]
-    assert '%(fold)s' in template
-    tree_seqs = []
-    for i in range(n_folds):
-        fname = template%{'fold': i+1}
-        tree_seqs.append(read_generic(fname))
-    trees = do_recombine(tree_seqs)
-    with open(args[2], 'w', encoding='UTF-8') as f_out:
-        for lines in trees:
-            write_generic_single(f_out, lines)
-
+    if '%(fold)s' not in template:
+        print("TEMPLATE has to contain %(fold)s", file=sys.stderr)
+        sys.exit(1)
+    fnames = [template%{'fold': i+1} for i in range(n_folds)]
+    sent_ids = None
+    if opts.ids_fname is not None:
+        from .index import load_index
+        sent_ids = load_index(opts.ids_fname).sent_nos
+    try:
+        n_sents = recombine_files(fnames, args[2], opts.init,
+                                  opts.make_index or sent_ids is not None,
+                                  sent_ids)
+    except ValueError as ex:
+        print("%s: %s"%(args[2], ex), file=sys.stderr)
+        sys.exit(1)
+    print("%s: %d sentences"%(args[2], n_sents), file=sys.stderr)
@@ -17,9 +17,12 @@
 """
 Performs dependency conversion
 """
+from __future__ import print_function
 import sys
+import optparse
 from past.builtins import basestring
 from collections import defaultdict
+from . import add_tree_options
 
 messages = {
     'nolabel': "Could not determine label (%s:%s.%s %s:%s.%s)\n",
@@ -45,38 +48,83 @@ class DepsError(Exception):
         return '%s (%s)' % (self.msg, self.node)
 
 
+def compile_pattern(pat):
+    '''
+    turns a (pos, cat, edge_label) pattern of a label rule into
+    a triple of sets, or None for fields that match anything
+    '''
+    if not pat:
+        return (None, None, None)
+    return tuple([None if x is None else frozenset(get_items(x))
+                  for x in pat])
+
+
 class LabelFinder:
 
-    def __init__(self, labelRules):
+    '''
+    determines the label of a dependency from the first label rule
+    that matches the (pos, cat, edge_label) of the adjunct and the
+    (pos, cat, edge_label) of the head and its parent.
+
+    The rules are indexed by the field that most of them constrain,
+    so that only the rules that can match the value of that field
+    (or that do not constrain it) are checked, and the results are
+    cached for up to ``max_cache`` different configurations.
+    '''
+
+    def __init__(self, labelRules, max_cache=100000):
         self.labelRules = labelRules
+        self.max_cache = max_cache
+        self.cache = {}
+        self.rules = [compile_pattern(pat1) + compile_pattern(pat2) + (label,)
+                      for pat1, pat2, label in labelRules]
+        n_constrained = [sum(1 for r in self.rules if r[i] is not None)
+                         for i in range(6)]
+        self.key_field = key_field = n_constrained.index(max(n_constrained))
+        # rule numbers for each value of the key field, in rule order
+        self.any_value = [i for i, r in enumerate(self.rules)
+                          if r[key_field] is None]
+        by_value = defaultdict(list)
+        for i, r in enumerate(self.rules):
+            if r[key_field] is not None:
+                for val in r[key_field]:
+                    by_value[val].append(i)
+        self.by_value = dict([(val, sorted(rule_nos + self.any_value))
+                              for val, rule_nos in by_value.items()])
+
+    def find_label(self, config):
+        '''
+        returns the label for a (pos1, cat1, lbl1, pos2, cat2, lbl2)
+        tuple, or None if no rule matches
+        '''
+        rules = self.rules
+        for i in self.by_value.get(config[self.key_field], self.any_value):
+            rule = rules[i]
+            for j in range(6):
+                vals = rule[j]
+                if vals is not None and config[j] not in vals:
+                    break
+            else:
+                return rule[6]
+        return None
 
     def __call__(self, adjunct, headNode, parentNode):
         assert adjunct.head
         assert headNode.head
-        pos1 = adjunct.head.cat
-        cat1 = adjunct.cat
-        lbl1 = adjunct.edge_label
-        pos2 = headNode.head.cat
-        cat2 = parentNode.cat
-        lbl2 = headNode.edge_label
-        for pat1, pat2, label in self.labelRules:
-            if pat1:
-                if ((pat1[0] is None or pos1 in get_items(pat1[0])) and
-                        (pat1[1] is None or cat1 in get_items(pat1[1])) and
-                        (pat1[2] is None or lbl1 in get_items(pat1[2]))):
-                    pass
-                else:
-                    continue
-            if pat2:
-                if ((pat2[0] is None or pos2 in get_items(pat2[0])) and
-                        (pat2[1] is None or cat2 in get_items(pat2[1])) and
-                        (pat2[2] is None or lbl2 in get_items(pat2[2]))):
-                    pass
-                else:
-                    continue
-            return label
-        warning_handler('nolabel', (pos1, cat1, lbl1, pos2, cat2, lbl2))
-        return '-UNKNOWN-'
+        config = (adjunct.head.cat, adjunct.cat, adjunct.edge_label,
+                  headNode.head.cat, parentNode.cat, headNode.edge_label)
+        cache = self.cache
+        try:
+            label = cache[config]
+        except KeyError:
+            label = self.find_label(config)
+            if len(cache) >= self.max_cache:
+                cache.clear()
+            cache[config] = label
+        if label is None:
+            warning_handler('nolabel', config)
+            return '-UNKNOWN-'
+        return label
 
 
 def make_labeling_func(rules):
@@ -90,9 +138,43 @@ def get_items(setDescr):
         return setDescr
 
 
+class CatLabelIds(object):
+    '''
+    interns (cat, edge_label) pairs as small integers. The head rules
+    that use the same ids get one more entry in their tables for
+    each new pair.
+    '''
+    def __init__(self):
+        self.ids = {}
+        self.pairs = []
+        self.rules = []
+
+    def intern(self, pair):
+        '''returns the id of a (cat, edge_label) pair'''
+        try:
+            return self.ids[pair]
+        except KeyError:
+            pass
+        n = len(self.pairs)
+        self.ids[pair] = n
+        self.pairs.append(pair)
+        for rule in self.rules:
+            rule.add_pair(pair)
+        return n
+
+
 class HeadRule:
 
-    def __init__(self, ruleDescr):
+    '''
+    a head rule for one category. The rules are compiled into two
+    tables indexed by the (cat, edge_label) id of a child: ``keys``
+    holds twice the priority of the child (lower is better), and
+    ``thresholds`` the key that the next child has to be below
+    to replace this one, which is one more than the key if the rule
+    prefers the rightmost match and equal to it otherwise.
+    '''
+
+    def __init__(self, ruleDescr, cat_ids=None):
         self.table = {}
         self.table1 = {}
         self.table2 = {}
@@ -124,36 +206,70 @@ class HeadRule:
                 self.dirs.append(False)
             else:
                 assert False, descr[-1]
+        if cat_ids is None:
+            cat_ids = CatLabelIds()
+        self.cat_ids = cat_ids
+        self.keys = []
+        self.thresholds = []
+        for pair in cat_ids.pairs:
+            self.add_pair(pair)
+        cat_ids.rules.append(self)
+
+    def priority(self, cat, lbl):
+        '''
+        returns the position of the first rule that matches a child
+        with the given category and edge label (1001 if there is none)
+        '''
+        return min(self.table.get((cat, lbl), 1001),
+                   self.table1.get(cat, 1001),
+                   self.table2.get(lbl, 1001),
+                   self.default_pos)
+
+    def add_pair(self, pair):
+        pos = self.priority(pair[0], pair[1])
+        self.keys.append(2 * pos)
+        if pos < len(self.dirs) and self.dirs[pos]:
+            self.thresholds.append(2 * pos + 1)
+        else:
+            self.thresholds.append(2 * pos)
 
     def findHead(self, nodes):
-        tpos = 1000
+        ids = self.cat_ids.ids
+        keys = self.keys
+        thresholds = self.thresholds
+        best = 2000
         headPos = None
-        table = self.table
-        table1 = self.table1
-        table2 = self.table2
-        default_pos = self.default_pos
         for i, node in enumerate(nodes):
-            cat = node.cat
-            lbl = node.edge_label
-            newpos = min(table.get((cat, lbl), 1001),
-                         table1.get(cat, 1001),
-                         table2.get(lbl, 1001),
-                         default_pos)
-            if newpos < tpos or (newpos == tpos and self.dirs[newpos]):
-                tpos = newpos
+            pair = (node.cat, node.edge_label)
+            try:
+                k = ids[pair]
+            except KeyError:
+                k = self.cat_ids.intern(pair)
+            if keys[k] < best:
+                best = thresholds[k]
                 headPos = i
         return headPos
 
 
-def make_headrules(hr_table):
+def make_headrules(hr_table, cat_ids=None):
+    '''
+    returns a dictionary from categories to :class:`HeadRule` objects,
+    which share the (cat, edge_label) ids in ``cat_ids``
+    '''
+    if cat_ids is None:
+        cat_ids = CatLabelIds()
     headRules = {}
     for cats, ruleDescr in hr_table:
-        rule = HeadRule(ruleDescr)
+        rule = HeadRule(ruleDescr, cat_ids)
         for cat in get_items(cats):
             headRules[cat] = rule
     return headRules
 
 
+def no_label(adjunct, headNode, parentNode):
+    return ''
+
+
 class SimpleDepExtractor:
 
     '''
@@ -165,7 +281,7 @@ class SimpleDepExtractor:
         self.headRules = make_headrules(hr_table)
         self.punctCats = punctCats
         if determine_label == None:
-            self.determine_label = lambda adj, head, parent: ''
+            self.determine_label = no_label
         else:
             self.determine_label = determine_label
         self.root_label = root_label
@@ -188,32 +304,52 @@ class SimpleDepExtractor:
         pass
 
     def treedep(self, node):
+        '''
+        determines the heads of node and all nodes below it and
+        attaches the heads of the non-head children to the head
+        of their parent. Returns the head of node.
+
+        This works bottom-up over an explicit stack rather than
+        by recursion, so that deep trees do not hit the recursion
+        limit.
+        '''
         if node.isTerminal():
             node.head = node
             return node
-        # try head projection
-        if node.cat in self.headRules:
-            pos = self.headRules[node.cat].findHead(node.children)
-        else:
-            pos = self.headRules[None].findHead(node.children)
-        #assert pos>=0 and pos<len(node.children)
-        if pos is None or pos < 0 or pos >= len(node.children):
-            warning_handler('nohead', (node,))
-            pos = len(node.children) - 1
-        head_node = node.children[pos]
-        head = self.treedep(head_node)
-        node.head = head
-        self.attach(node.children[0:pos], head_node, node)
-        self.attach(node.children[pos + 1:], head_node, node)
-        return head
+        headRules = self.headRules
+        # nonterminals in preorder; reversed, children come before parents
+        nonterms = []
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n.isTerminal():
+                n.head = n
+            else:
+                nonterms.append(n)
+                stack.extend(n.children)
+        head_positions = []
+        for n in reversed(nonterms):
+            rule = headRules.get(n.cat)
+            if rule is None:
+                rule = headRules[None]
+            pos = rule.findHead(n.children)
+            if pos is None or pos < 0 or pos >= len(n.children):
+                warning_handler('nohead', (n,))
+                pos = len(n.children) - 1
+            n.head = n.children[pos].head
+            head_positions.append(pos)
+        for n, pos in zip(reversed(nonterms), head_positions):
+            head_node = n.children[pos]
+            self.attach(n.children[0:pos], head_node, n)
+            self.attach(n.children[pos + 1:], head_node, n)
+        return node.head
 
     def attach(self, nodes, headNode, parent):
         for n in nodes:
             self.attach1(n, headNode, parent)
 
     def attach1(self, node, headNode, parent):
-        # print "attach1(%s,%s,%s)"%(node,headNode,parent)
-        node.head = self.treedep(node)
+        # node.head and headNode.head have been set by treedep
         label = self.determine_label(node, headNode, parent)
         node.head.syn_parent = headNode.head
         node.head.syn_label = label
@@ -241,3 +377,135 @@ def read_headrules(f):
         rules_lhs.append((cats_rhs, None, direction))
     all_rules = [[[lhs], rhs] for (lhs, rhs) in rules.items()] + [[[None], [(None, 'l')]]]
     return all_rules
+
+
+class WarningCounter(object):
+    '''
+    warning handler that counts the warnings of each kind and
+    configuration instead of writing them out. Use it in place of
+    :data:`warning_handler` and call :meth:`summary` at the end.
+    '''
+    def __init__(self):
+        self.counts = {}
+
+    def __call__(self, w, args):
+        if w == 'nohead':
+            # the node itself would make every warning different
+            args = (args[0].cat,)
+        counts = self.counts.setdefault(w, {})
+        counts[args] = counts.get(args, 0) + 1
+
+    def update(self, counts):
+        '''adds the counts of another WarningCounter'''
+        for w, w_counts in counts.items():
+            own = self.counts.setdefault(w, {})
+            for args, n in w_counts.items():
+                own[args] = own.get(args, 0) + n
+
+    def total(self):
+        return sum([sum(x.values()) for x in self.counts.values()])
+
+    def summary(self, max_lines=10):
+        '''
+        returns lines with the total number of each kind of warning,
+        followed by its most frequent configurations
+        '''
+        lines = []
+        for w in sorted(self.counts):
+            counts = self.counts[w]
+            lines.append('%s: %d warnings' % (w, sum(counts.values())))
+            items = sorted(counts.items(), key=lambda x: (-x[1], x[0]))
+            for args, n in items[:max_lines]:
+                lines.append('%8d  %s' % (n, (messages[w] % args).rstrip()))
+            if len(items) > max_lines:
+                lines.append('          ... and %d more' % (
+                    len(items) - max_lines,))
+        return lines
+
+
+class DepsTask(object):
+    '''
+    parses a raw sentence, converts it with a dependency extractor
+    and formats it, returning (n_tokens, text, warning counts)
+    '''
+    def __init__(self, extractor, formatter):
+        self.extractor = extractor
+        self.formatter = formatter
+
+    def __call__(self, raw):
+        global warning_handler
+        t = raw.parse()
+        counter = WarningCounter()
+        old_handler = warning_handler
+        warning_handler = counter
+        try:
+            self.extractor(t)
+        finally:
+            warning_handler = old_handler
+        return (len(t.terminals), self.formatter(t), counter.counts)
+
+
+def convert_deps(fname_in, fname_out, extractor, opts, num_workers=None,
+                 chunksize=64):
+    '''
+    converts the trees of a treebank to dependencies and writes them
+    in CoNLL-X format, with the selections in opts (see
+    :func:`lingtree.select_trees`). Sentences are converted in
+    ``num_workers`` worker processes. Returns a
+    :class:`lingtree.pipeline.ConvertStats` and a
+    :class:`WarningCounter`.
+    '''
+    from . import select_trees
+    from .conll import open_output
+    from .parallel import ordered_map, prefetch, BackgroundWriter
+    from .pipeline import TreeFileWriter, ConvertStats
+    stats = ConvertStats()
+    warnings = WarningCounter()
+    meta, raw_sents = select_trees(fname_in, opts, raw=True)
+    f_out = open_output(fname_out)
+    if num_workers is not None and num_workers > 1:
+        raw_sents = prefetch(raw_sents, 4 * chunksize * num_workers)
+        f_out = BackgroundWriter(f_out)
+    writer = TreeFileWriter(f_out, 'conll')
+    task = DepsTask(extractor, writer.formatter)
+    try:
+        for n_tokens, text, counts in ordered_map(
+                task, raw_sents, num_workers, chunksize):
+            stats.add(n_tokens)
+            if counts:
+                warnings.update(counts)
+            writer.write_text(text)
+        writer.close()
+    finally:
+        f_out.close()
+    return stats, warnings
+
+
+oparse_deps = optparse.OptionParser(
+    usage='%prog [options] headrules input out.conll',
+    description='converts a treebank to dependencies in CoNLL-X '
+    'format, using head rules in the format of rparse or disco-dop')
+add_tree_options(oparse_deps)
+oparse_deps.add_option('--root-label', dest='root_label',
+                       help='label for the heads of the roots (default: S)')
+oparse_deps.add_option('--jobs', '-j', dest='jobs', type='int', default=1,
+                       help='number of worker processes (default: 1)')
+oparse_deps.add_option('--max-warnings', dest='max_warnings', type='int',
+                       default=10, metavar='N',
+                       help='most frequent warnings to show for each kind '
+                       '(default: 10)')
+
+
+def deps_main(argv=None):
+    opts, args = oparse_deps.parse_args(argv)
+    if len(args) != 3:
+        oparse_deps.print_help()
+        sys.exit(1)
+    with open(args[0]) as f:
+        hr_table = read_headrules(f)
+    extractor = SimpleDepExtractor(hr_table, root_label=opts.root_label)
+    stats, warnings = convert_deps(args[1], args[2], extractor, opts,
+                                   num_workers=opts.jobs)
+    print('%s: %s' % (args[2], stats.summary()), file=sys.stderr)
+    for line in warnings.summary(opts.max_warnings):
+        print(line, file=sys.stderr)
@@ -0,0 +1,98 @@
+# Copyright 2008-2020 Yannick Versley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+# TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+# CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+'''
+benchmark for the head projection of :class:`lingtree.deps.SimpleDepExtractor`,
+as ``lingtree_deps_bench``
+'''
+from __future__ import print_function
+import sys
+import time
+import optparse
+from . import add_tree_options, read_trees
+from . import deps
+from .deps import SimpleDepExtractor, WarningCounter, read_headrules
+
+# head rules in the style of the TIGER treebank, where most heads
+# have the edge label HD and the noun kernel of an NP is marked NK
+tiger_head_table = [
+    ('S', [(None, 'HD', 'l'),
+           (['VVFIN', 'VAFIN', 'VMFIN'], None, 'l'),
+           (None, 'l')]),
+    ('VP', [(None, 'HD', 'l'),
+            (['VVINF', 'VVIZU', 'VVPP', 'VAINF', 'VAPP', 'VMINF', 'VMPP'], None, 'l'),
+            (None, 'r')]),
+    (['NP', 'NM', 'MPN'], [(None, 'HD', 'l'),
+                           (['NN', 'NE', 'PPER', 'PIS', 'PDS', 'PRELS', 'PWS',
+                             'CARD', 'NP', 'MPN'], 'NK', 'r'),
+                           (None, 'NK', 'r'),
+                           (None, 'r')]),
+    ('PP', [(None, 'HD', 'l'),
+            (['APPR', 'APPRART', 'APPO', 'APZR'], None, 'l'),
+            (None, 'l')]),
+    ('AP', [(None, 'HD', 'r'), (['ADJA', 'ADJD'], None, 'r'), (None, 'r')]),
+    ('AVP', [(None, 'HD', 'r'), (['ADV'], None, 'r'), (None, 'r')]),
+    (['CS', 'CNP', 'CAP', 'CPP', 'CVP', 'CAVP', 'CAC', 'CO', 'CVZ', 'CCP'],
+     [(None, 'CJ', 'l'), (None, 'l')]),
+    (None, [(None, 'HD', 'l'), (None, 'l')]),
+]
+
+
+def headrules_benchmark_main(argv=None):
+    '''
+    times the head projection of SimpleDepExtractor on a treebank,
+    with the head rules of a rparse-style file or with
+    :data:`tiger_head_table`
+    '''
+    oparse = optparse.OptionParser(usage='%prog [options] treebank')
+    add_tree_options(oparse)
+    oparse.add_option('--rules', dest='rules',
+                      help='head rules file (default: TIGER-style rules)')
+    oparse.add_option('-n', dest='repeat', type='int', default=5,
+                      help='number of passes over the treebank')
+    opts, args = oparse.parse_args(argv)
+    if len(args) != 1:
+        oparse.print_help()
+        sys.exit(1)
+    if opts.rules:
+        with open(opts.rules) as f:
+            hr_table = read_headrules(f)
+    else:
+        hr_table = tiger_head_table
+    trees = list(read_trees(args[0], opts))
+    counter = WarningCounter()
+    old_handler = deps.warning_handler
+    deps.warning_handler = counter
+    try:
+        t0 = time.time()
+        extractor = SimpleDepExtractor(hr_table)
+        t1 = time.time()
+        for i in range(opts.repeat):
+            for t in trees:
+                extractor(t)
+        t2 = time.time()
+    finally:
+        deps.warning_handler = old_handler
+    n_trees = len(trees) * opts.repeat
+    print('set up head rules for %d categories in %.1f ms' % (
+        len(extractor.headRules), 1000.0 * (t1 - t0)))
+    print('%d trees in %.2fs (%.1f us/tree), %d warnings' % (
+        n_trees, t2 - t1, 1e6 * (t2 - t1) / max(n_trees, 1),
+        counter.total() // max(opts.repeat, 1)))
+
+
+if __name__ == '__main__':
+    headrules_benchmark_main()
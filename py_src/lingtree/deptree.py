@@ -0,0 +1,339 @@
+# Copyright 2008-2020 Yannick Versley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+# TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+# CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+'''
+dependency trees as integer arrays, for statistics over whole
+treebanks without following ``syn_parent`` references.
+
+Tokens are numbered from 1 as in CoNLL, and position 0 is the
+artificial root: ``heads[i]`` is the head of token i (0 for tokens
+attached to the root) and ``labels[i]`` the id of its label in a
+:class:`LabelTable`. Depth, ancestor and lowest-common-ancestor
+tables are computed on demand, after which path lengths and
+ancestor tests take constant time.
+'''
+from __future__ import print_function
+from array import array
+
+
+class LabelTable(object):
+    '''
+    interns dependency labels as integer ids, with 0 for tokens
+    without a label
+    '''
+    def __init__(self):
+        self.names = [None]
+        self.ids = {None: 0}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, name):
+        try:
+            return self.ids[name]
+        except KeyError:
+            idx = len(self.names)
+            self.ids[name] = idx
+            self.names.append(name)
+            return idx
+
+
+class DepTree(object):
+    '''
+    the heads and label ids of the tokens of one sentence, with
+    index 0 for the root
+    '''
+    def __init__(self, heads, labels, label_table):
+        self.heads = heads
+        self.labels = labels
+        self.label_table = label_table
+        self.depths = None
+        self.lca_table = None
+
+    def __len__(self):
+        return len(self.heads) - 1
+
+    def label(self, i):
+        return self.label_table.names[self.labels[i]]
+
+    def children_lists(self):
+        '''returns the dependents of each position, left to right'''
+        children = [[] for i in range(len(self.heads))]
+        heads = self.heads
+        for i in range(1, len(heads)):
+            children[heads[i]].append(i)
+        return children
+
+    def compute_tables(self):
+        '''
+        computes the depth and the preorder/postorder numbers of each
+        position, and the Euler tour for LCA queries. Raises ValueError
+        if the heads contain a cycle.
+        '''
+        n = len(self.heads)
+        children = self.children_lists()
+        depths = array('i', [-1]) * n
+        pre = array('i', [0]) * n
+        post = array('i', [0]) * n
+        euler = array('i')
+        first = array('i', [0]) * n
+        depths[0] = 0
+        n_pre = 0
+        n_post = 0
+        stack = [(0, 0)]
+        while stack:
+            node, k = stack.pop()
+            if k == 0:
+                pre[node] = n_pre
+                n_pre += 1
+                first[node] = len(euler)
+            euler.append(node)
+            kids = children[node]
+            if k < len(kids):
+                stack.append((node, k + 1))
+                child = kids[k]
+                depths[child] = depths[node] + 1
+                stack.append((child, 0))
+            else:
+                post[node] = n_post
+                n_post += 1
+        if n_pre != n:
+            raise ValueError('dependency cycle in %s' % (list(self.heads),))
+        self.depths = depths
+        self.pre = pre
+        self.post = post
+        self.euler = euler
+        self.first = first
+        # sparse table: lca_table[j][i] is the shallowest node in
+        # euler[i:i + 2**j]
+        table = [euler]
+        width = 1
+        while 2 * width <= len(euler):
+            prev = table[-1]
+            row = array('i', [
+                a if depths[a] <= depths[b] else b
+                for a, b in zip(prev, prev[width:])])
+            table.append(row)
+            width *= 2
+        self.lca_table = table
+
+    def depth(self, i):
+        '''number of arcs between position i and the root'''
+        if self.depths is None:
+            self.compute_tables()
+        return self.depths[i]
+
+    def is_ancestor(self, a, d):
+        '''true if a dominates d (or a == d)'''
+        if self.depths is None:
+            self.compute_tables()
+        return self.pre[a] <= self.pre[d] and self.post[d] <= self.post[a]
+
+    def lca(self, i, j):
+        '''returns the lowest common ancestor of positions i and j'''
+        if self.lca_table is None:
+            self.compute_tables()
+        a = self.first[i]
+        b = self.first[j]
+        if a > b:
+            a, b = b, a
+        level = (b - a + 1).bit_length() - 1
+        row = self.lca_table[level]
+        x = row[a]
+        y = row[b - (1 << level) + 1]
+        if self.depths[x] <= self.depths[y]:
+            return x
+        return y
+
+    def path_length(self, i, j):
+        '''number of arcs on the path between positions i and j'''
+        depths = self.depths
+        if depths is None:
+            self.compute_tables()
+            depths = self.depths
+        return depths[i] + depths[j] - 2 * depths[self.lca(i, j)]
+
+    def head_distance(self, i):
+        '''
+        signed distance from token i to its head (negative for heads
+        on the left), or 0 for tokens attached to the root
+        '''
+        h = self.heads[i]
+        if h == 0:
+            return 0
+        return h - i
+
+    def is_projective(self):
+        '''
+        true if no two arcs cross, counting arcs from the root at
+        position 0. The arcs are sorted by left end (and by right end
+        in reverse for the same left end) with two bucket passes and
+        then checked for proper nesting with a stack.
+        '''
+        heads = self.heads
+        n = len(heads)
+        by_right = [[] for i in range(n)]
+        for d in range(1, n):
+            h = heads[d]
+            if h < d:
+                by_right[d].append(h)
+            else:
+                by_right[h].append(d)
+        by_left = [[] for i in range(n)]
+        for r in range(n - 1, -1, -1):
+            for l in by_right[r]:
+                by_left[l].append(r)
+        stack = []
+        for l in range(n):
+            for r in by_left[l]:
+                while stack and stack[-1] <= l:
+                    stack.pop()
+                if stack and stack[-1] < r:
+                    return False
+                stack.append(r)
+        return True
+
+    def gap_degrees(self):
+        '''
+        returns the number of gaps in the yield of each position
+        (the position and everything it dominates). Position p starts
+        a block of its ancestors up to, but not including, the lowest
+        common ancestor of p-1 and p; summing these over subtrees
+        gives the number of blocks of every yield in linear time
+        after the LCA tables are built.
+        '''
+        if self.lca_table is None:
+            self.compute_tables()
+        heads = self.heads
+        n = len(heads)
+        blocks = [0] * n
+        if n > 1:
+            blocks[1] = 1
+        lca = self.lca
+        for p in range(2, n):
+            blocks[p] += 1
+            blocks[lca(p - 1, p)] -= 1
+        # children before parents: descending preorder numbers
+        order = [0] * n
+        for i in range(n):
+            order[self.pre[i]] = i
+        for i in reversed(order):
+            if i != 0:
+                blocks[heads[i]] += blocks[i]
+        blocks[0] = 1
+        return [x - 1 for x in blocks]
+
+    def gap_degree(self):
+        '''returns the largest gap degree of any token'''
+        # the yields of projective trees have no gaps
+        if len(self.heads) <= 1 or self.is_projective():
+            return 0
+        return max(self.gap_degrees())
+
+    def set_syn_parents(self, t):
+        '''sets syn_parent and syn_label of the terminals of t'''
+        terminals = t.terminals
+        names = self.label_table.names
+        heads = self.heads
+        labels = self.labels
+        for i, n in enumerate(terminals):
+            h = heads[i + 1]
+            if h == 0:
+                n.syn_parent = None
+            else:
+                n.syn_parent = terminals[h - 1]
+            n.syn_label = names[labels[i + 1]]
+
+
+def deptree_from_syn_parent(t, label_table=None):
+    '''
+    makes a :class:`DepTree` from the syn_parent and syn_label
+    attributes of the terminals of t, which need their start
+    positions. Tokens without syn_parent are attached to the root.
+    '''
+    if label_table is None:
+        label_table = LabelTable()
+    heads = array('i', [-1])
+    labels = array('i', [0])
+    for n in t.terminals:
+        parent = getattr(n, 'syn_parent', None)
+        if parent is None:
+            heads.append(0)
+        else:
+            heads.append(parent.start + 1)
+        labels.append(label_table[getattr(n, 'syn_label', None)])
+    return DepTree(heads, labels, label_table)
+
+
+def deptrees(trees, label_table=None):
+    '''yields a :class:`DepTree` for each tree, sharing one LabelTable'''
+    if label_table is None:
+        label_table = LabelTable()
+    for t in trees:
+        yield deptree_from_syn_parent(t, label_table)
+
+
+class DepStats(object):
+    '''
+    counts non-projective sentences, gap degrees, head distances
+    and labels over a treebank
+    '''
+    def __init__(self, max_distance=10):
+        self.max_distance = max_distance
+        self.n_sents = 0
+        self.n_tokens = 0
+        self.n_nonprojective = 0
+        self.gap_degrees = {}
+        self.distances = {}
+        self.labels = {}
+
+    def add(self, dt):
+        self.n_sents += 1
+        self.n_tokens += len(dt)
+        if not dt.is_projective():
+            self.n_nonprojective += 1
+        gd = dt.gap_degree()
+        self.gap_degrees[gd] = self.gap_degrees.get(gd, 0) + 1
+        max_distance = self.max_distance
+        distances = self.distances
+        labels = self.labels
+        names = dt.label_table.names
+        for i in range(1, len(dt.heads)):
+            dist = min(abs(dt.head_distance(i)), max_distance)
+            distances[dist] = distances.get(dist, 0) + 1
+            label = names[dt.labels[i]]
+            labels[label] = labels.get(label, 0) + 1
+
+    def summary(self):
+        lines = ['%d sentences, %d tokens, %d non-projective (%.1f%%)' % (
+            self.n_sents, self.n_tokens, self.n_nonprojective,
+            100.0 * self.n_nonprojective / max(self.n_sents, 1))]
+        for gd in sorted(self.gap_degrees):
+            lines.append('gap degree %d: %d sentences' % (
+                gd, self.gap_degrees[gd]))
+        for dist in sorted(self.distances):
+            if dist == 0:
+                name = 'root'
+            elif dist == self.max_distance:
+                name = '>=%d' % (dist,)
+            else:
+                name = str(dist)
+            lines.append('head distance %s: %d tokens' % (
+                name, self.distances[dist]))
+        for label, n in sorted(self.labels.items(),
+                               key=lambda x: (-x[1], str(x[0]))):
+            lines.append('label %s: %d tokens' % (label, n))
+        return lines
@@ -1,3 +1,5 @@
+from __future__ import print_function
+import sys
 import argparse
 from collections import defaultdict
 from lingtree import read_trees
@@ -62,20 +64,99 @@ class EvalResult:
         print("%-10s  N %5d  Prec %.3f  Recl %.3f  F1 %.4f" % ("**ALL**", tp + fn, prec, recl, f1))
 
 
+def sent_id(t, i):
+    return getattr(t, 'sent_no', None) or '#%d' % (i + 1,)
+
+
+class PairReport:
+    '''
+    counts and reports the trees that cannot be compared: trees
+    with different numbers of terminals, and trees that only one
+    of the files has
+    '''
+    def __init__(self, max_messages=20):
+        self.max_messages = max_messages
+        self.n_messages = 0
+        self.n_pairs = 0
+        self.n_length = 0
+        self.n_gold_only = 0
+        self.n_pred_only = 0
+
+    def message(self, msg):
+        self.n_messages += 1
+        if self.n_messages <= self.max_messages:
+            print(msg, file=sys.stderr)
+        elif self.n_messages == self.max_messages + 1:
+            print("(further mismatches not shown)", file=sys.stderr)
+
+    def length(self, i, t_gold, t_pred):
+        self.n_length += 1
+        self.message("tree %d: gold %s has %d terminals, predicted %s has %d" % (
+            i + 1, sent_id(t_gold, i), len(t_gold.terminals),
+            sent_id(t_pred, i), len(t_pred.terminals)))
+
+    def gold_only(self, i, t_gold):
+        if self.n_gold_only == 0:
+            self.message("predicted file ends before gold tree %d (%s)" % (
+                i + 1, sent_id(t_gold, i)))
+        self.n_gold_only += 1
+
+    def pred_only(self, i, t_pred):
+        if self.n_pred_only == 0:
+            self.message("gold file ends before predicted tree %d (%s)" % (
+                i + 1, sent_id(t_pred, i)))
+        self.n_pred_only += 1
+
+    def n_mismatches(self):
+        return self.n_length + self.n_gold_only + self.n_pred_only
+
+    def summary(self):
+        return ("%d tree pairs compared, %d with different terminals, "
+                "%d only in gold, %d only in predicted" % (
+                    self.n_pairs, self.n_length, self.n_gold_only,
+                    self.n_pred_only))
+
+
+def paired_trees(trees_gold, trees_pred, report):
+    '''
+    reads gold and predicted trees in lockstep and yields the pairs
+    that can be compared, reporting the others to a PairReport
+    '''
+    it_pred = iter(trees_pred)
+    i = 0
+    for t_gold in trees_gold:
+        t_pred = next(it_pred, None)
+        if t_pred is None:
+            report.gold_only(i, t_gold)
+        elif len(t_gold.terminals) != len(t_pred.terminals):
+            report.length(i, t_gold, t_pred)
+        else:
+            report.n_pairs += 1
+            yield t_gold, t_pred
+        i += 1
+    for t_pred in it_pred:
+        report.pred_only(i, t_pred)
+        i += 1
+
+
 aparse = argparse.ArgumentParser()
 aparse.add_argument('gold_file')
 aparse.add_argument('pred_file')
+aparse.add_argument('--max-messages', type=int, default=20,
+                    help='number of mismatched trees to show (default: 20)')
 
 def edge_eval_main(args=None):
     opts = aparse.parse_args(args)
-    trees_gold = list(read_trees(opts.gold_file))
-    trees_pred = list(read_trees(opts.pred_file))
-    assert len(trees_gold) == len(trees_pred), (len(trees_gold), len(trees_pred))
+    trees_gold = read_trees(opts.gold_file)
+    trees_pred = read_trees(opts.pred_file)
     result = EvalResult()
-    for t_gold, t_pred in zip(trees_gold, trees_pred):
-        assert len(t_gold.terminals) == len(t_pred.terminals)
+    report = PairReport(opts.max_messages)
+    for t_gold, t_pred in paired_trees(trees_gold, trees_pred, report):
         result.compare_trees(t_gold, t_pred)
     result.summarize()
+    if report.n_mismatches():
+        print(report.summary(), file=sys.stderr)
+        sys.exit(1)
 
 if __name__ == '__main__':
     edge_eval_main()
\ No newline at end of file
@@ -23,6 +23,7 @@ from __future__ import print_function, division
 import sys
 import re
 import json
+from functools import partial
 from builtins import bytes, str
 from .schema import SimpleSchema, SimpleAttribute, make_export_schema
 from . import tree
@@ -36,7 +37,30 @@ hash_token_re = re.compile('^#+\\s')
 
 kill_spaces_tr = str.maketrans(' ', '_')
 
-def read_sentence(f, format=3):
+def read_terminals(f, format=3, projection='terminals'):
+    '''
+    reads a sentence in export format from the file descriptor f,
+    skipping nonterminal nodes, secondary edges and comments,
+    and returns a :class:`lingtree.tree.Sentence`
+    '''
+    make_token = tree.token_factory(projection)
+    terminals = []
+    pos = 0
+    l = f.readline()
+    while l and not l.startswith('#EOS'):
+        if l[0] != '#' or hash_token_re.match(l):
+            fields = l.split()
+            if format == 4:
+                terminals.append(make_token(fields[0], fields[2], fields[3],
+                                            fields[1], fields[4], pos))
+            else:
+                terminals.append(make_token(fields[0], fields[1], fields[2],
+                                            None, fields[3], pos))
+            pos += 1
+        l = f.readline()
+    return tree.Sentence(terminals)
+
+def read_sentence(f, format=3, projection=None):
     '''
     reads a sentence in export format from the file descriptor f
     :param format: the Negra-Export version
@@ -45,7 +69,11 @@ def read_sentence(f, format=3):
     :param tree_encoding: passing None here means that the tree will
       contain unicode strings in the word, lemma, and comment fields,
       otherwise they will follow this encoding
+    :param projection: 'terminals' or a list of terminal attributes
+      to only read the terminals (see :func:`read_terminals`)
     '''
+    if projection is not None:
+        return read_terminals(f, format, projection)
     t = tree.Tree()
     secedges = []
     pos = 0
@@ -211,8 +239,10 @@ def reattach_secedge(n):
                     n.secedge = None
                     # print n.parent.to_penn()
                     n2.parent = n1
-                for nn in n2.children:
-                    reattach_secedge(nn)
+                    # n2 has moved, so its subtree may not be visited
+                    # otherwise (other secedges can point to ancestors)
+                    for nn in n2.children:
+                        reattach_secedge(nn)
     except AttributeError:
         pass
     for nn in n.children:
@@ -267,81 +297,100 @@ def pad_with_tabs(s, n=1):
     else:
         return s + '\t' * (n - len(s) // 8)
 
-def write_sentence_tabs(t, f, fmt=3):
-    """writes a sentence in export format
-        and does NOT write the #EOS
-    """
-    for n in t.terminals:
-        if n.parent:
-            parent_id = n.parent.id
+class TabPadder(dict):
+    '''
+    memoizing version of :func:`pad_with_tabs` for a fixed number
+    of tab stops. Lookups of strings that have been seen before
+    cost a single dictionary access.
+    '''
+    def __init__(self, n, max_size=100000):
+        dict.__init__(self)
+        self.n = n
+        self.max_size = max_size
+
+    def __missing__(self, s):
+        val = pad_with_tabs(s, self.n)
+        if len(self) < self.max_size:
+            self[s] = val
+        return val
+
+pad1 = TabPadder(1)
+pad2 = TabPadder(2)
+pad3 = TabPadder(3)
+
+def secedge_pieces(secedges, pieces):
+    for rel, tgt in secedges:
+        if tgt.isTerminal():
+            tgt_id = tgt.start
         else:
+            tgt_id = tgt.id
+        pieces.append('\t%s\t%s' % (rel, tgt_id))
+
+def sentence_pieces(t, fmt=3, pieces=None):
+    '''
+    appends the lines of a sentence in export format (without
+    #BOS and #EOS) to the list ``pieces`` and returns it.
+    '''
+    if pieces is None:
+        pieces = []
+    append = pieces.append
+    if fmt == 4:
+        nt_lemma = pad3['--']
+    for n in t.terminals:
+        parent = n.parent
+        if parent is None:
             parent_id = '0'
-        extra = ''
-        if hasattr(n, 'secedge') and n.secedge is not None:
-            for secedge in n.secedge:
-                tgt = secedge[1]
-                if tgt.isTerminal():
-                    tgt_id = tgt.start
-                else:
-                    tgt_id = tgt.id
-                extra += '\t%s\t%s' % (secedge[0], tgt_id)
-        if hasattr(n, 'comment') and n.comment:
-            if extra:
-                extra += ' '
-            else:
-                extra = '\t'
-            extra += '%% ' + n.comment
-        if fmt == 4:
-            lem = getattr(n, 'lemma', None)
-            if lem is None:
-                lem = '--'
-            lemma_column = pad_with_tabs(lem, 3)
         else:
-            lemma_column = ''
-        n_word = n.word
-        f.write('%s%s%s%s%s%s%s\n'%(pad_with_tabs(n_word, 3),
-                                    lemma_column,
-                                    pad_with_tabs(n.cat, 1),
-                                    pad_with_tabs(n.morph, 2),
-                                    pad_with_tabs(n.edge_label, 1),
-                                    parent_id, extra))
-    all_nodes = list(t.node_table.values())
-    all_nodes.sort(key=lambda n: n.id)
-    if fmt == 4:
-        lemma_column = pad_with_tabs('--', 3)
-    else:
-        lemma_column = ''
-    for n in all_nodes:
-        if n is not t.node_table[n.id]:
-            print("%s: node %s may be duplicate"%(
-                getattr(t, 'sent_no'), n.id), file=sys.stderr)
-            assert False
-        if n.parent:
-            parent_id = n.parent.id
+            parent_id = str(parent.id)
+        if fmt == 4:
+            append(pad3[n.word] + pad3[getattr(n, 'lemma', None)] +
+                   pad1[n.cat] + pad2[n.morph] + pad1[n.edge_label] +
+                   parent_id)
         else:
-            parent_id = '0'
-        extra = ''
-        if hasattr(n, 'secedge') and n.secedge is not None:
-            for secedge in n.secedge:
-                tgt = secedge[1]
-                if tgt.isTerminal():
-                    tgt_id = tgt.start
-                else:
-                    tgt_id = tgt.id
-                extra += '\t%s\t%s' % (secedge[0], tgt_id)
-        if hasattr(n, 'comment') and n.comment is not None:
-            if extra:
-                extra += ' '
+            append(pad3[n.word] + pad1[n.cat] + pad2[n.morph] +
+                   pad1[n.edge_label] + parent_id)
+        secedges = getattr(n, 'secedge', None)
+        if secedges is not None:
+            secedge_pieces(secedges, pieces)
+        comment = getattr(n, 'comment', None)
+        if comment:
+            if secedges:
+                append(' %% ')
             else:
-                extra = ' '
-            extra += '%% ' + n.comment
-        f.write('%s%s%s%s%s%s%s\n' % (pad_with_tabs('#%s' % (n.id,), 3),
-                                      lemma_column,
-                                      pad_with_tabs(n.cat, 1),
-                                      pad_with_tabs(n.attr, 2),
-                                      pad_with_tabs(n.edge_label, 1),
-                                      parent_id, extra))
+                append('\t%% ')
+            append(comment)
+        append('\n')
+    node_table = t.node_table
+    for key in sorted(node_table):
+        n = node_table[key]
+        parent = n.parent
+        if parent is None:
+            parent_id = '0'
+        else:
+            parent_id = str(parent.id)
+        if fmt == 4:
+            append(pad3['#%s' % (n.id,)] + nt_lemma +
+                   pad1[n.cat] + pad2[n.attr] + pad1[n.edge_label] +
+                   parent_id)
+        else:
+            append(pad3['#%s' % (n.id,)] +
+                   pad1[n.cat] + pad2[n.attr] + pad1[n.edge_label] +
+                   parent_id)
+        secedges = getattr(n, 'secedge', None)
+        if secedges is not None:
+            secedge_pieces(secedges, pieces)
+        comment = getattr(n, 'comment', None)
+        if comment is not None:
+            append(' %% ')
+            append(comment)
+        append('\n')
+    return pieces
 
+def write_sentence_tabs(t, f, fmt=3):
+    """writes a sentence in export format
+        and does NOT write the #EOS
+    """
+    f.write(''.join(sentence_pieces(t, fmt)))
 
 def to_json(t):
     '''
@@ -397,11 +446,24 @@ def to_json(t):
     return result
 
 
-def from_json(values):
+def from_json(values, projection=None):
     '''
     decodes a JSON-export object to a pytree Tree
     object, using the specified encoding.
+
+    With a projection ('terminals' or a list of terminal attributes),
+    only the terminals are decoded into a :class:`lingtree.tree.Sentence`
     '''
+    if projection is not None:
+        make_token = tree.token_factory(projection)
+        t = tree.Sentence([
+            make_token(fields[0], fields[1], fields[2],
+                       fields[5] if len(fields) > 5 else None,
+                       fields[3], pos)
+            for (pos, fields) in enumerate(values['terminals'])])
+        if '_id' in values:
+            t.sent_no = values['_id']
+        return t
     t = tree.Tree()
     secedges = []
     for (pos, fields) in enumerate(values['terminals']):
@@ -492,10 +554,10 @@ def transform_filter(fname, proc):
     f.close()
 
 bot_re = re.compile('^#BOT ([A-Z]+)')
-def read_export_header(f, t_schema=None, nt_schema=None, fmt=3):
+def export_tables(t_schema=None, nt_schema=None, fmt=3):
     '''
-    reads the header portion of a Negra Export file and
-    returns the header data and the first BOS line
+    returns empty header tables for a Negra Export file, where
+    the tag tables are attributes of the given schemas
     '''
     tables = {
         'ORIGIN': {},
@@ -515,6 +577,76 @@ def read_export_header(f, t_schema=None, nt_schema=None, fmt=3):
     tables['NODETAG'] = nt_schema.attribute_by_name('cat')
     tables['EDGETAG'] = nt_schema.attribute_by_name('func')
     tables['SECEDGETAG'] = nt_schema.edges[0].attributes[0]
+    return tables
+
+tag_tables = ['EDITOR', 'WORDTAG', 'MORPHTAG', 'NODETAG', 'EDGETAG',
+              'SECEDGETAG']
+
+def origin_offsets(all_meta):
+    '''
+    returns, for several Export headers, the amount by which the
+    document (origin) numbers of each file have to be shifted so
+    that they do not overlap, or None if some of the files have no
+    ORIGIN table
+    '''
+    offsets = []
+    offset = 0
+    for meta in all_meta:
+        if meta is None or not meta.get('ORIGIN'):
+            return None
+        offsets.append(offset)
+        offset += max(meta['ORIGIN']) + 1
+    return offsets
+
+def merge_export_headers(all_meta, doc_offsets=None):
+    '''
+    merges the header tables of several Negra Export files. Each
+    tag table contains the tags of all files, in the order in which
+    they first occur. With ``doc_offsets`` (see :func:`origin_offsets`),
+    the ORIGIN numbers of each file are shifted by its offset;
+    otherwise, the ORIGIN table has the origins of all files, with new
+    numbers for those that clash with the previous files.
+    Returns None if none of the headers is given.
+    '''
+    if doc_offsets is None:
+        doc_offsets = [None] * len(all_meta)
+    pairs = [(meta, off) for (meta, off) in zip(all_meta, doc_offsets)
+             if meta is not None]
+    if not pairs:
+        return None
+    result = export_tables(fmt=max([meta.get('FMT', 3) for meta, off in pairs]))
+    origins = result['ORIGIN']
+    for meta, offset in pairs:
+        for tab_name in tag_tables:
+            if tab_name not in meta:
+                continue
+            tab = meta[tab_name]
+            target = result[tab_name]
+            for name in tab.names:
+                if not target.descriptions.get(name):
+                    target.add_item(name, tab.descriptions.get(name, ''))
+        table = meta.get('ORIGIN', {})
+        if offset is not None:
+            for i in table:
+                origins[i + offset] = table[i]
+            continue
+        known = set(origins.values())
+        for i in sorted(table):
+            name = table[i]
+            if name in known:
+                continue
+            if i in origins:
+                i = max(origins) + 1
+            origins[i] = name
+            known.add(name)
+    return result
+
+def read_export_header(f, t_schema=None, nt_schema=None, fmt=3):
+    '''
+    reads the header portion of a Negra Export file and
+    returns the header data and the first BOS line
+    '''
+    tables = export_tables(t_schema, nt_schema, fmt)
     where = None
     while True:
         l = f.readline()
@@ -589,8 +721,7 @@ def write_export_header(f, meta, fmt=None):
         for i in sorted(tab.keys()):
             print("%s\t%s"%(i, tab[i]), file=f)
         print('#EOT ORIGIN', file=f)
-    for tab_name in ['EDITOR', 'WORDTAG', 'MORPHTAG', 'NODETAG', 'EDGETAG',
-                     'SECEDGETAG']:
+    for tab_name in tag_tables:
         print('#BOT %s'%(tab_name,), file=f)
         tab = meta[tab_name]
         for i, name in enumerate(tab.names):
@@ -612,19 +743,67 @@ def write_export_header(f, meta, fmt=None):
         pad_with_tabs('secedge', 1),
         'comment'))
 
-def write_bos(t, f_out):
+def bos_line(t):
     '''
-    writes a BOS line for Negra Export
+    returns the BOS line for Negra Export, including the newline
     '''
-    if hasattr(t, 'doc_no'):
-        doc_no = t.doc_no
-    else:
+    doc_no = getattr(t, 'doc_no', None)
+    if doc_no is None:
         doc_no = 0
-    if hasattr(t, 'comment') and t.comment:
-        cm = ' %% '+t.comment
+    cm = getattr(t, 'comment', None)
+    if cm:
+        if cm.startswith('%%'):
+            cm = ' '+cm
+        else:
+            cm = ' %% '+cm
     else:
         cm = ''
-    print("#BOS %s %s 0 0%s"%(t.sent_no, doc_no, cm), file=f_out)
+    # the document number is the origin field, as in bos_pattern
+    return "#BOS %s 0 0 %s%s\n"%(t.sent_no, doc_no, cm)
+
+def write_bos(t, f_out):
+    '''
+    writes a BOS line for Negra Export
+    '''
+    f_out.write(bos_line(t))
+
+class ExportWriter(object):
+    '''
+    writes trees in Negra Export format. The lines of several
+    sentences are collected in one list of string pieces, which
+    is joined and written whenever it has grown beyond
+    ``chunk_pieces`` entries, or when :meth:`flush` is called.
+    '''
+    def __init__(self, f, fmt=3, chunk_pieces=16384):
+        self.f = f
+        self.fmt = fmt
+        self.chunk_pieces = chunk_pieces
+        self.pieces = []
+
+    def write_tree(self, t):
+        '''
+        adds one tree, including #BOS and #EOS lines
+        '''
+        pieces = self.pieces
+        pieces.append(bos_line(t))
+        sentence_pieces(t, self.fmt, pieces)
+        pieces.append('#EOS %s\n' % (t.sent_no,))
+        if len(pieces) >= self.chunk_pieces:
+            self.flush()
+
+    def write_trees(self, trees):
+        '''
+        writes a number of trees and flushes the buffer
+        '''
+        write_tree = self.write_tree
+        for t in trees:
+            write_tree(t)
+        self.flush()
+
+    def flush(self):
+        if self.pieces:
+            self.f.write(''.join(self.pieces))
+            self.pieces = []
 
 def write_export_file(f_out, trees, meta=None, fmt=3):
     '''
@@ -635,23 +814,16 @@ def write_export_file(f_out, trees, meta=None, fmt=3):
     if fmt in [3, 'export3']:
         fmt = 3
         if meta is not None:
-            write_export_header(f_out, meta, 4)
+            write_export_header(f_out, meta, 3)
     elif fmt in [4, 'export4']:
         fmt = 4
         if meta is not None:
-            write_export_header(f_out, meta, 3)
+            write_export_header(f_out, meta, 4)
     #write body
-    for t in trees:
-        if fmt == 'json':
-            print(json.dumps({'release':to_json(t)}), file=f_out)
-        elif fmt == 4:
-            write_bos(t, f_out)
-            write_sentence_tabs(t, f_out, fmt=4)
-            print("#EOS %s"%(t.sent_no,), file=f_out)
-        else:
-            write_bos(t, f_out)
-            write_sentence_tabs(t, f_out)
-            print("#EOS %s"%(t.sent_no,), file=f_out)
+    if fmt == 'json':
+        write_json_file(f_out, trees)
+    else:
+        ExportWriter(f_out, fmt).write_trees(trees)
 
 def write_json_file(f_out, trees):
     '''
@@ -663,9 +835,10 @@ def write_json_file(f_out, trees):
     for t in trees:
             print(json.dumps({'release':to_json(t)}), file=f_out)
 
-def read_trees(f, fmt=3, last_bos=None):
+def read_trees(f, fmt=3, last_bos=None, projection=None):
     '''
-    reads trees from an export-format file
+    reads trees from an export-format file. With a projection,
+    only the terminals are read (see :func:`read_terminals`)
     '''
     global doc_no
     if last_bos is None:
@@ -679,7 +852,7 @@ def read_trees(f, fmt=3, last_bos=None):
         if m:
             sent_no = m.group(1)
             doc_no = m.group(2)
-            t = read_sentence(f, fmt)
+            t = read_sentence(f, fmt, projection)
             t.sent_no = sent_no
             t.doc_no = doc_no
             t.comment = m.group(3)
@@ -689,32 +862,126 @@ def read_trees(f, fmt=3, last_bos=None):
         elif l.startswith('#BOS '):
             # still do something useful with incomplete format
             sent_no = l[5:].split()[0]
-            t = read_sentence(f, fmt)
+            t = read_sentence(f, fmt, projection)
             t.sent_no = sent_no
             yield t
         l = f.readline()
     return
 
-def read_trees_json(f, want_parser=None):
-    import json
+class LineReader(object):
+    '''
+    stands in for a file object so that read_sentence can
+    parse lines that have already been read
+    '''
+    def __init__(self, lines, name='<lines>'):
+        self.readline = partial(next, iter(lines), '')
+        self.name = name
+
+    def tell(self):
+        return 0
+
+def decode_raw_sentence(data):
+    bos_line, lines, fmt, projection = data
+    t = read_sentence(LineReader(lines), fmt, projection)
+    m = bos_pattern.match(bos_line)
+    if m:
+        t.sent_no = m.group(1)
+        t.doc_no = m.group(2)
+        t.comment = m.group(3)
+        if t.comment:
+            t.comment = t.comment.lstrip()
+    else:
+        t.sent_no = bos_line[5:].split()[0]
+    return t
+
+def raw_sentence_words(data):
+    return [l.split(None, 1)[0] for l in data[1]
+            if l[0] != '#' or hash_token_re.match(l)]
+
+def read_raw_sentences(f, fmt=3, last_bos=None, projection=None):
+    '''
+    reads the sentences of an export-format file as
+    :class:`lingtree.folds.RawSentence` objects, which can be
+    filtered before they are parsed
+    '''
+    from .folds import RawSentence
+    if last_bos is None:
+        l = f.readline()
+    else:
+        l = last_bos
+    while l != '':
+        if l.strip() == '#FORMAT 4':
+            fmt = 4
+        if l.startswith('#BOS '):
+            lines = []
+            l_sent = f.readline()
+            while l_sent and not l_sent.startswith('#EOS'):
+                lines.append(l_sent)
+                l_sent = f.readline()
+            lines.append(l_sent)
+            m = bos_pattern.match(l)
+            if m:
+                sent_no = m.group(1)
+                doc_no = m.group(2)
+            else:
+                sent_no = l[5:].split()[0]
+                doc_no = None
+            yield RawSentence(sent_no, doc_no, (l, lines, fmt, projection),
+                              decode_raw_sentence, raw_sentence_words)
+        l = f.readline()
+
+def json_sentence(l, line_no, want_parser=None, warn_multiple=None):
+    '''
+    extracts sentence id and tree object from one line of
+    a JSON file
+    '''
+    obj = json.loads(l)
+    if '_id' in obj:
+        sent_id = obj['_id']
+    else:
+        sent_id = 'line_%s'%(line_no+1,)
+    if want_parser is not None and want_parser in obj:
+        obj1 = obj[want_parser]
+    else:
+        objs = [obj[k] for k in sorted(obj.keys()) if k != '_id']
+        if len(objs) > 1 and warn_multiple is not None:
+            for k in obj.keys():
+                if k not in warn_multiple:
+                    print("Warning: several keys in read_trees_json(%s)"%(k,), file=sys.stderr)
+                    warn_multiple.add(k)
+        obj1 = objs[0]
+    return sent_id, obj1
+
+def decode_raw_json(data):
+    sent_id, obj, projection = data
+    t = from_json(obj, projection)
+    if sent_id is not None:
+        t.sent_no = sent_id
+    return t
+
+def raw_json_words(data):
+    return [fields[0] for fields in data[1]['terminals']]
+
+def read_raw_json(f, want_parser=None, projection=None, first_line=0):
+    '''
+    reads the sentences of a JSON file as
+    :class:`lingtree.folds.RawSentence` objects. ``first_line``
+    is the number of lines of the file that come before the lines
+    in f, so that sentences without an id are numbered by their
+    line in the whole file.
+    '''
+    from .folds import RawSentence
     warn_multiple = set()
-    for line_no, l in enumerate(f):
-        obj = json.loads(l)
-        if '_id' in obj:
-            sent_id = obj['_id']
-        else:
-            sent_id = 'line_%s'%(line_no+1,)
-        if want_parser is not None and want_parser in obj:
-            obj1 = obj[want_parser]
-        else:
-            objs = [obj[k] for k in sorted(obj.keys()) if k != '_id']
-            if len(objs) > 1:
-                for k in obj.keys():
-                    if k not in warn_multiple:
-                        print("Warning: several keys in read_trees_json(%s)"%(k,), file=sys.stderr)
-                        warn_multiple.add(k)
-            obj1 = objs[0]
-        t = from_json(obj1)
+    for line_no, l in enumerate(f, first_line):
+        sent_id, obj = json_sentence(l, line_no, want_parser, warn_multiple)
+        yield RawSentence(sent_id, None, (sent_id, obj, projection),
+                          decode_raw_json, raw_json_words)
+
+def read_trees_json(f, want_parser=None, projection=None, first_line=0):
+    warn_multiple = set()
+    for line_no, l in enumerate(f, first_line):
+        sent_id, obj1 = json_sentence(l, line_no, want_parser, warn_multiple)
+        t = from_json(obj1, projection)
         if sent_id is not None:
             t.sent_no = sent_id
         yield t
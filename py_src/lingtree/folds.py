@@ -16,6 +16,7 @@
 # IN THE SOFTWARE.
 import re
 import sys
+import zlib
 
 class SimpleFolder(object):
     def est_length(self, n):
@@ -102,7 +103,7 @@ class FoldAlternating(SimpleFolder):
         if n[0] is None:
             return [None] * self.num_folds
         total = sum(n)
-        div = int(total) / self.num_folds
+        div = int(total) // self.num_folds
         mod = int(total) % self.num_folds
         result = []
         for i in range(self.num_folds):
@@ -125,25 +126,34 @@ class FoldSlices(SimpleFolder):
         nf = self.num_folds
         result = []
         for i in range(nf):
-            result.append((i+1)*total/nf - i*total/nf)
+            result.append((i+1)*total//nf - i*total//nf)
         return result
     def apply_filter(self, tree_no, fold_no, t):
         return (tree_no,
-                (tree_no * self.num_folds) / self.num_total,
+                (tree_no * self.num_folds) // self.num_total,
                 t)
 
 class Folder(object):
     def __init__(self):
         self.xform = []
-    def apply_filter(self, trees):
+    def apply_filter(self, trees, count=None):
+        '''
+        yields the selected trees. If a selection (such as slices())
+        needs the total number of trees, it is taken from ``count``,
+        a function that returns it, or else by putting the trees
+        into a list.
+        '''
         # first: see if we need to determine length
         est_len = [None]
         try:
             for xf in self.xform:
                 est_len = xf.est_length(est_len)
         except ValueError:
-            trees = list(trees)
-            est_len = [len(trees)]
+            if count is None:
+                trees = list(trees)
+                est_len = [len(trees)]
+            else:
+                est_len = [count()]
             for xf in self.xform:
                 est_len = xf.est_length(est_len)
         if est_len[0] is not None:
@@ -229,6 +239,169 @@ def parse_foldspec(spec):
                 idx = m.end()
     return f
 
+class RawSentence(object):
+    '''
+    a sentence that has been read from a file but not parsed yet.
+    The readers fill in sent_no and doc_no from the sentence header (if
+    any); ``data`` is the raw form of the sentence, ``decode`` turns it
+    into a tree and ``get_words`` into the list of words.
+    '''
+    __slots__ = ['sent_no', 'doc_no', 'data', 'decode', 'get_words', '_words']
+    def __init__(self, sent_no, doc_no, data, decode, get_words):
+        self.sent_no = sent_no
+        self.doc_no = doc_no
+        self.data = data
+        self.decode = decode
+        self.get_words = get_words
+        self._words = None
+    def words(self):
+        if self._words is None:
+            self._words = self.get_words(self.data)
+        return self._words
+    def n_tokens(self):
+        return len(self.words())
+    def parse(self):
+        return self.decode(self.data)
+
+def parse_raw(raw_sents):
+    '''
+    turns a sequence of RawSentence objects into trees
+    '''
+    for raw in raw_sents:
+        yield raw.parse()
+
+def as_int(val):
+    try:
+        return int(val)
+    except (TypeError, ValueError):
+        return None
+
+class SentenceFilter(object):
+    '''
+    selects sentences by number of tokens, sentence number, document
+    number or a regular expression on the words. It works on the
+    RawSentence objects that the readers produce, so that rejected
+    sentences are never parsed.
+    '''
+    def __init__(self):
+        self.preds = []
+        self.uses_docs = False
+    def accepts(self, sent):
+        for pred in self.preds:
+            if not pred(sent):
+                return False
+        return True
+    def apply_filter(self, sents):
+        accepts = self.accepts
+        for sent in sents:
+            if accepts(sent):
+                yield sent
+
+def len_pred(min_len, max_len):
+    def pred(sent):
+        n = sent.n_tokens()
+        return ((min_len is None or n >= min_len) and
+                (max_len is None or n <= max_len))
+    return pred
+
+def sent_pred(start, end):
+    def pred(sent):
+        sent_no = as_int(sent.sent_no)
+        return sent_no is not None and start <= sent_no <= end
+    return pred
+
+def doc_pred(docs):
+    def pred(sent):
+        if sent.doc_no is None:
+            raise ValueError('doc() needs document numbers, but sentence %s '
+                             'has none'%(sent.sent_no,))
+        return as_int(sent.doc_no) in docs
+    return pred
+
+def match_pred(rgx):
+    def pred(sent):
+        return rgx.search(' '.join(sent.words())) is not None
+    return pred
+
+filter_tokens = [(code, re.compile(rgx)) for
+                 (code, rgx) in [
+                     ('len', r'len\(([0-9]*),([0-9]*)\)'),
+                     ('sent', r'sent\(([0-9]+),([0-9]+)\)'),
+                     ('doc', r'doc\(([0-9]+(?:,[0-9]+)*)\)'),
+                     ('match', r'match\(/(.*?)/\)')]]
+
+shard_re = re.compile(r'([0-9]+)/([0-9]+)$')
+
+def parse_shardspec(spec):
+    '''
+    parses a shard specification such as ``3/8`` (the third of eight
+    shards) and returns the 0-based shard number and the number of
+    shards. Raises ValueError for malformed specifications.
+    '''
+    m = shard_re.match(spec)
+    if not m:
+        raise ValueError('Shard %s should look like 3/8'%(spec,))
+    shard, n_shards = int(m.group(1)), int(m.group(2))
+    if not 1 <= shard <= n_shards:
+        raise ValueError('Shard %s: shard number out of range'%(spec,))
+    return (shard - 1, n_shards)
+
+def shard_hash(sent_no):
+    '''a hash of the sentence number that is the same in every process'''
+    return zlib.crc32(str(sent_no).encode('UTF-8')) & 0xffffffff
+
+def shard_pred(shard, n_shards):
+    def pred(sent):
+        return shard_hash(sent.sent_no) % n_shards == shard
+    return pred
+
+def shard_filter(shard, n_shards):
+    '''
+    returns a :class:`SentenceFilter` that selects the sentences of
+    one shard by the hash of their sentence numbers
+    '''
+    f = SentenceFilter()
+    f.preds.append(shard_pred(shard, n_shards))
+    return f
+
+def parse_filterspec(spec):
+    '''
+    parses a filter specification such as
+    ``len(,40);doc(3,4);match(/^Der /)``, where
+
+    * ``len(MIN,MAX)`` selects sentences by number of tokens
+      (either bound may be empty)
+    * ``sent(START,END)`` selects a range of sentence numbers
+    * ``doc(D1,D2,...)`` selects documents by number (only Negra
+      Export has document numbers; other sentences raise ValueError)
+    * ``match(/RGX/)`` selects sentences where the regular
+      expression matches the words, joined by spaces
+    '''
+    f = SentenceFilter()
+    idx = 0
+    while idx < len(spec):
+        if spec[idx] in '; ':
+            idx += 1
+            continue
+        for code, rgx in filter_tokens:
+            m = rgx.match(spec, idx)
+            if m:
+                break
+        if not m:
+            raise ValueError('Cannot parse filter spec: %s'%(spec[idx:],))
+        arg = m.groups()
+        if code == 'len':
+            f.preds.append(len_pred(as_int(arg[0]), as_int(arg[1])))
+        elif code == 'sent':
+            f.preds.append(sent_pred(int(arg[0]), int(arg[1])))
+        elif code == 'doc':
+            f.uses_docs = True
+            f.preds.append(doc_pred(set([int(x) for x in arg[0].split(',')])))
+        elif code == 'match':
+            f.preds.append(match_pred(re.compile(arg[0])))
+        idx = m.end()
+    return f
+
 def do_recombine(tree_seqs, init=1):
     '''
     given trees that were distributed in round-robin fashion,
@@ -236,11 +409,26 @@ def do_recombine(tree_seqs, init=1):
 
     To combine testfinal folds, use init=1, for testdev
     folds, use init=2
+
+    Raises ValueError if the folds do not have the sizes that a
+    round-robin distribution gives, i.e. if some fold still has
+    trees when another one has run out.
     '''
     iters = [iter(trees) for trees in tree_seqs]
     n_iters = len(tree_seqs)
     i = (init + n_iters)%n_iters
+    n_trees = 0
     while True:
-        yield next(iters[i])
+        try:
+            t = next(iters[i])
+        except StopIteration:
+            break
+        yield t
+        n_trees += 1
         i = (i+1)%n_iters
-
+    for k in range(1, n_iters):
+        j = (i + k)%n_iters
+        for t in iters[j]:
+            raise ValueError(
+                'fold %d has more trees than expected: fold %d ended '
+                'after %d trees in total'%(j+1, i+1, n_trees))
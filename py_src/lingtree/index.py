@@ -0,0 +1,341 @@
+# Copyright 2008-2020 Yannick Versley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+# TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+# CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+'''
+sentence indexes for treebank files, which give the id, byte
+offset and byte length of each sentence, so that single sentences
+can be read without going through the whole file.
+
+An index is stored next to the treebank as ``<treebank>.idx``, as
+a text file with a header line and one tab-separated line per
+sentence::
+
+    #lingtree-index 1	export3	treebank.export	UTF-8
+    1	1234	567
+    2	1801	312
+
+The header gives the format, the name of the treebank file
+(relative to the directory of the index) and its encoding. Index
+files can be given to :func:`lingtree.read_trees` instead of the
+treebank, which then reads the sentences in the index.
+'''
+from __future__ import print_function
+import os
+import io
+import re
+import json
+from array import array
+from builtins import open
+
+INDEX_MAGIC = '#lingtree-index 1'
+
+
+def index_name(fname):
+    '''returns the name of the index file for a treebank file'''
+    return fname + '.idx'
+
+
+class SentenceIndex(object):
+    '''
+    sentence ids with the byte offset and length of each sentence
+    in the treebank file ``data_fname``, which has the format ``fmt``
+    and the given encoding
+    '''
+    def __init__(self, data_fname=None, fmt=None, encoding='UTF-8'):
+        self.data_fname = data_fname
+        self.fmt = fmt
+        self.encoding = encoding
+        self.sent_nos = []
+        self.offsets = array('q')
+        self.lengths = array('q')
+
+    def __len__(self):
+        return len(self.sent_nos)
+
+    def add(self, sent_no, offset, length):
+        self.sent_nos.append(sent_no)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+
+    def subset(self, positions):
+        '''returns an index with the sentences at the given positions'''
+        result = SentenceIndex(self.data_fname, self.fmt, self.encoding)
+        for i in positions:
+            result.add(self.sent_nos[i], self.offsets[i], self.lengths[i])
+        return result
+
+    def write(self, f, index_dir='.'):
+        '''
+        writes the index to a text file. The name of the treebank
+        file is written relative to ``index_dir``.
+        '''
+        data_fname = self.data_fname or ''
+        if data_fname:
+            data_fname = os.path.relpath(data_fname, index_dir)
+        f.write('%s\t%s\t%s\t%s\n' % (INDEX_MAGIC, self.fmt or '',
+                                      data_fname, self.encoding))
+        f.write(''.join(['%s\t%d\t%d\n' % x for x in zip(
+            self.sent_nos, self.offsets, self.lengths)]))
+
+    def save(self, fname=None):
+        '''
+        writes the index to ``fname`` (default: the index name
+        for the treebank file)
+        '''
+        if fname is None:
+            fname = index_name(self.data_fname)
+        with open(fname, 'w', encoding='UTF-8') as f:
+            self.write(f, os.path.dirname(os.path.abspath(fname)))
+
+    def text(self, f, i):
+        '''
+        returns the text of the i-th sentence, where f is the
+        treebank file opened in binary mode
+        '''
+        f.seek(self.offsets[i])
+        return f.read(self.lengths[i]).decode(self.encoding)
+
+
+def load_index(fname):
+    '''
+    reads an index file and returns a :class:`SentenceIndex`.
+    Raises ValueError if the file is not an index.
+    '''
+    with open(fname, 'r', encoding='UTF-8') as f:
+        header = f.readline().rstrip('\n').split('\t')
+        if header[0] != INDEX_MAGIC:
+            raise ValueError('%s is not a sentence index' % (fname,))
+        data_fname = None
+        if len(header) > 2 and header[2]:
+            data_fname = os.path.join(
+                os.path.dirname(os.path.abspath(fname)), header[2])
+        encoding = 'UTF-8'
+        if len(header) > 3 and header[3]:
+            encoding = header[3]
+        result = SentenceIndex(data_fname, header[1] or None, encoding)
+        for l in f:
+            sent_no, offset, length = l.rstrip('\n').split('\t')
+            result.add(sent_no, int(offset), int(length))
+    return result
+
+
+def find_index(fname):
+    '''
+    returns the index for a treebank file if there is one that
+    is at least as new as the file, and None otherwise
+    '''
+    idx_fname = index_name(fname)
+    try:
+        if os.path.getmtime(idx_fname) < os.path.getmtime(fname):
+            return None
+    except OSError:
+        return None
+    return load_index(idx_fname)
+
+
+def _scan_export(f):
+    offset = 0
+    start = None
+    for l in f:
+        if l.startswith(b'#BOS '):
+            start = offset
+            sent_no = l[5:].split()[0].decode('UTF-8')
+        offset += len(l)
+        if start is not None and l.startswith(b'#EOS'):
+            yield (sent_no, start, offset - start)
+            start = None
+
+
+# a sentence id at the start of the top-level object, as json_sentence uses it
+json_id_re = re.compile(b'\\{ *"_id": *"((?:[^"\\\\]|\\\\.)*)"')
+
+
+def _scan_lines(f, fmt):
+    offset = 0
+    for line_no, l in enumerate(f):
+        if fmt == 'json':
+            m = json_id_re.match(l)
+            if m:
+                sent_no = json.loads(b'"' + m.group(1) + b'"')
+            else:
+                sent_no = 'line_%s' % (line_no + 1,)
+        else:
+            sent_no = str(line_no + 1)
+        yield (sent_no, offset, len(l))
+        offset += len(l)
+
+
+def _scan_blocks(f):
+    offset = 0
+    start = None
+    n_sents = 0
+    for l in f:
+        if l.strip():
+            if start is None:
+                start = offset
+        elif start is not None:
+            n_sents += 1
+            yield (str(n_sents), start, offset - start)
+            start = None
+        offset += len(l)
+    if start is not None:
+        yield (str(n_sents + 1), start, offset - start)
+
+
+def scan_sentences(fname, fmt, bufsize=1 << 20):
+    '''
+    yields (sent_no, offset, length) for each sentence of a treebank
+    file, by looking only at the lines of the file and not parsing
+    the sentences. ``fmt`` is one of export (or export3, export4),
+    json, spmrl (one sentence per line) or conll (sentences separated
+    by empty lines); other formats raise ValueError. The file has to
+    use an ASCII-compatible encoding.
+    '''
+    with open(fname, 'rb', buffering=bufsize) as f:
+        if fmt in ['export', 'export3', 'export4']:
+            scan = _scan_export(f)
+        elif fmt in ['json', 'spmrl']:
+            scan = _scan_lines(f, fmt)
+        elif fmt == 'conll':
+            scan = _scan_blocks(f)
+        else:
+            raise ValueError('Cannot find sentence boundaries in %s files' % (fmt,))
+        for x in scan:
+            yield x
+
+
+def build_index(fname, fmt, encoding='UTF-8'):
+    '''returns a :class:`SentenceIndex` for a treebank file'''
+    result = SentenceIndex(fname, fmt, encoding)
+    add = result.add
+    for sent_no, offset, length in scan_sentences(fname, fmt):
+        add(sent_no, offset, length)
+    return result
+
+
+def count_sentences(fname, fmt):
+    '''
+    returns the number of sentences in a treebank file (or in an
+    index file, for fmt='index'), from the index if there is a current
+    one, or by counting sentence boundaries. Returns None if neither
+    is possible for the format.
+    '''
+    if fmt == 'index':
+        return len(load_index(fname))
+    index = find_index(fname)
+    if index is not None:
+        return len(index)
+    if fmt not in ['export', 'export3', 'export4', 'json', 'spmrl', 'conll']:
+        return None
+    n = 0
+    for x in scan_sentences(fname, fmt):
+        n += 1
+    return n
+
+
+byte_range_formats = ['export', 'export3', 'export4', 'json', 'spmrl']
+
+
+def shard_range(fname, shard, n_shards):
+    '''
+    returns the byte range (start, end) of the 0-based shard of a
+    file that is split into n_shards parts of equal size
+    '''
+    size = os.path.getsize(fname)
+    return (size * shard // n_shards, size * (shard + 1) // n_shards)
+
+
+def count_lines_before(fname, start, bufsize=1 << 20):
+    '''
+    returns the number of lines of a file that start before the
+    byte offset ``start``, i.e. the number of lines before the
+    first line that :func:`range_lines` looks at
+    '''
+    if start <= 0:
+        return 0
+    n_lines = 1
+    remaining = start - 1
+    with open(fname, 'rb') as f:
+        while remaining > 0:
+            data = f.read(min(bufsize, remaining))
+            if not data:
+                break
+            n_lines += data.count(b'\n')
+            remaining -= len(data)
+    return n_lines
+
+
+def range_lines(fname, fmt, start, end, encoding='UTF-8', bufsize=1 << 20):
+    '''
+    yields the lines of the sentences that start within the byte
+    range [start, end) of a treebank file, decoded with the given
+    encoding. Sentences that start before the range belong to the
+    range before it, so that ranges that cover the file without
+    gaps give every sentence exactly once. ``fmt`` has to be one of
+    :data:`byte_range_formats`.
+    '''
+    if fmt not in byte_range_formats:
+        raise ValueError('Cannot split %s files by byte ranges' % (fmt,))
+    is_export = fmt in ['export', 'export3', 'export4']
+    with open(fname, 'rb', buffering=bufsize) as f:
+        pos = 0
+        if start > 0:
+            # go to the first line that starts within the range
+            f.seek(start - 1)
+            pos = start - 1 + len(f.readline())
+        in_sentences = not (is_export and start > 0)
+        for l in f:
+            is_start = not is_export or l.startswith(b'#BOS ')
+            if is_start:
+                if pos >= end:
+                    break
+                in_sentences = True
+            if in_sentences:
+                yield l.decode(encoding)
+            pos += len(l)
+
+
+def read_indexed(index, projection=None):
+    '''
+    yields the sentences in an index as
+    :class:`lingtree.folds.RawSentence` objects, reading each of
+    them from its position in the treebank file
+    '''
+    from .folds import RawSentence
+    fmt = index.fmt
+    if fmt not in ['export3', 'export4', 'json', 'spmrl']:
+        raise ValueError('Cannot read %s files through an index' % (fmt,))
+    sent_nos = index.sent_nos
+    with open(index.data_fname, 'rb') as f:
+        for i in range(len(index)):
+            text = index.text(f, i)
+            if fmt in ['export3', 'export4']:
+                from . import export
+                for raw in export.read_raw_sentences(
+                        io.StringIO(text), int(fmt[-1]), None, projection):
+                    yield raw
+            elif fmt == 'json':
+                from . import export
+                obj = export.json_sentence(text, i)[1]
+                yield RawSentence(sent_nos[i], None,
+                                  (sent_nos[i], obj, projection),
+                                  export.decode_raw_json,
+                                  export.raw_json_words)
+            else:
+                from . import spmrl
+                yield RawSentence(sent_nos[i], None, (text, None, projection),
+                                  spmrl.decode_raw_spmrl,
+                                  spmrl.raw_spmrl_words)
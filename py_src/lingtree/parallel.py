@@ -0,0 +1,177 @@
+# Copyright 2008-2020 Yannick Versley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+# TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+# CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+'''
+helpers for running per-sentence work in a pool of worker
+processes while keeping the input order and a bounded
+amount of work in flight
+'''
+from __future__ import print_function
+import multiprocessing
+import threading
+from collections import deque
+from itertools import islice
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def chunked(items, chunksize):
+    '''
+    groups the items of an iterable into lists of at most
+    chunksize elements
+    '''
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _map_chunk(args):
+    func, chunk = args
+    return [func(x) for x in chunk]
+
+
+def ordered_map(func, items, num_workers=None, chunksize=64,
+                max_pending=None):
+    '''
+    applies func to each of the items and yields the results in
+    input order.
+
+    With num_workers of None, 0 or 1, everything happens in the
+    calling process. Otherwise, items are sent in chunks of
+    ``chunksize`` to a pool of worker processes. At most
+    ``max_pending`` chunks (default: twice the number of workers)
+    are in flight, so the input is consumed lazily and memory
+    stays bounded even for very long inputs.
+
+    func has to be picklable, i.e. a module-level function.
+    '''
+    if not num_workers or num_workers <= 1:
+        for x in items:
+            yield func(x)
+        return
+    if max_pending is None:
+        max_pending = 2 * num_workers
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        pending = deque()
+        for chunk in chunked(items, chunksize):
+            pending.append(pool.apply_async(_map_chunk, ((func, chunk),)))
+            if len(pending) >= max_pending:
+                for result in pending.popleft().get():
+                    yield result
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+_end_marker = object()
+
+
+def prefetch(items, maxsize=1024, start=False):
+    '''
+    iterates over items in a background thread, keeping up to
+    ``maxsize`` items ahead of the consumer. Useful to overlap
+    reading a file with other work. Exceptions in the background
+    thread are raised in the consumer. With start=True, the thread
+    starts reading right away rather than when the first item is
+    requested, so that several inputs can be read ahead at once.
+    '''
+    q = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def fill():
+        try:
+            for x in items:
+                if stop.is_set():
+                    return
+                q.put((x, None))
+            q.put((_end_marker, None))
+        except BaseException as e:
+            q.put((_end_marker, e))
+    thread = threading.Thread(target=fill)
+    thread.daemon = True
+    if start:
+        thread.start()
+    return _drain_queue(q, stop, thread)
+
+
+def _drain_queue(q, stop, thread):
+    if thread.ident is None:
+        thread.start()
+    try:
+        while True:
+            x, exc = q.get()
+            if x is _end_marker:
+                if exc is not None:
+                    raise exc
+                return
+            yield x
+    finally:
+        stop.set()
+        # unblock the thread if it waits for space in the queue
+        while thread.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+class BackgroundWriter(object):
+    '''
+    file-like object that passes the strings given to :meth:`write`
+    to a thread that writes them to f, with at most ``maxsize``
+    strings waiting. :meth:`close` waits for the thread and closes f.
+    '''
+    def __init__(self, f, maxsize=64):
+        self.f = f
+        self.queue = queue.Queue(maxsize)
+        self.exc = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        f = self.f
+        while True:
+            s = self.queue.get()
+            if s is None:
+                return
+            if self.exc is None:
+                try:
+                    f.write(s)
+                except BaseException as e:
+                    self.exc = e
+
+    def write(self, s):
+        if self.exc is not None:
+            raise self.exc
+        self.queue.put(s)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.f.close()
+        if self.exc is not None:
+            raise self.exc
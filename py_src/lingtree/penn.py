@@ -22,7 +22,7 @@ Utility functions to deal with normal bracketed format
 from __future__ import print_function
 import sys
 import re
-from .tree import TerminalNode, NontermNode, Tree
+from .tree import TerminalNode, NontermNode, Tree, Sentence, token_factory
 
 tokens_table = [(code, re.compile(rgx))
                 for (code, rgx) in
@@ -88,6 +88,18 @@ def node2tree(node, has_vroot=True):
     return t
 
 
+def split_label(lab):
+    '''
+    splits a label such as NP-SBJ into category and edge label
+    (None if there is none). Labels that start and end with a dash,
+    such as -LRB- or -NONE-, are categories.
+    '''
+    if '-' not in lab or (lab[0] == '-' and lab[-1] == '-'):
+        return (lab, None)
+    cat, dash, elabel = lab.partition('-')
+    return (cat, elabel or None)
+
+
 def spmrl2nodes(lst, split_dash=True):
     idx = 0
     result = []
@@ -95,8 +107,8 @@ def spmrl2nodes(lst, split_dash=True):
         code = lst[idx][0]
         if code == '(':
             lab = lst[idx][1]
-            if split_dash and '-' in lab:
-                (lab, elabel) = lab.split('-')
+            if split_dash:
+                (lab, elabel) = split_label(lab)
             else:
                 elabel = None
             if lst[idx+1][0] == 'W':
@@ -137,8 +149,172 @@ def line2parse(s):
     return node
 
 
+preterminal_re = re.compile(r'\(([^\s()]+)\s+([^\s()]+)\s*\)')
+
+
+def line2terminals(s, projection='terminals'):
+    """
+    given a line with a bracketed parse, returns a
+    :class:`lingtree.tree.Sentence` with only the terminals,
+    without building the nonterminal nodes
+    """
+    make_token = token_factory(projection)
+    terminals = []
+    for i, (lab, word) in enumerate(preterminal_re.findall(s)):
+        lab, elabel = split_label(lab)
+        terminals.append(make_token(word, lab, None, None, elabel, i))
+    return Sentence(terminals)
+
+
 def read_spmrl(f, props2morph=None):
     for l in f:
         node = spmrl2nodes(tokenize_penn(l.strip()), props2morph)
         t = node2tree(node, node.cat == 'VROOT')
         yield t
+
+
+label_escapes = [(' ', '_'), ('\t', '_')]
+bracket_escapes = [('(', '-LRB-'), (')', '-RRB-')] + label_escapes
+
+
+def escape_bracket(s, escapes=bracket_escapes):
+    '''
+    makes a word safe for bracketed output, using the
+    Penn Treebank conventions for parentheses
+    '''
+    if s is None:
+        return '--'
+    s = str(s)
+    for c, repl in escapes:
+        if c in s:
+            s = s.replace(c, repl)
+    return s
+
+
+def escape_label(s):
+    '''
+    makes a label safe for bracketed output. Parentheses are
+    left alone, as the readers take everything up to the next
+    space as the label, so that tags such as $( come back unchanged.
+    '''
+    return escape_bracket(s, label_escapes)
+
+
+class EscapeCache(dict):
+    '''
+    memoizes escape_bracket for frequently recurring strings
+    '''
+    def __init__(self, max_size=100000):
+        dict.__init__(self)
+        self.max_size = max_size
+
+    def __missing__(self, s):
+        val = escape_bracket(s)
+        if len(self) < self.max_size:
+            self[s] = val
+        return val
+
+
+no_edge_labels = frozenset([None, '', '--', '-'])
+
+
+class BracketWriter(object):
+    '''
+    writes trees in bracketed format (Penn Treebank or SPMRL),
+    one tree per line.
+
+    ``root_label`` -- label of the bracket that encloses the roots of
+    each tree. The default of '' gives PTB-style ``( (S ...) )``, SPMRL
+    uses VROOT.
+
+    ``edge_labels`` -- if True, edge labels are appended to the node
+    label with a dash (e.g. NN-SB), as the SPMRL reader expects them.
+
+    ``props`` -- if True, the ``props`` dictionary of each node is
+    written as ``##key=val|key=val##`` after the label.
+
+    Trees are traversed with an explicit stack, so that deep trees
+    do not hit the recursion limit. Terminals are written in the
+    order of the traversal, so discontinuous constituents come out
+    reordered.
+    '''
+    def __init__(self, f, root_label='', edge_labels=False, props=False,
+                 chunk_lines=1000):
+        self.f = f
+        self.root_label = root_label
+        self.edge_labels = edge_labels
+        self.props = props
+        self.chunk_lines = chunk_lines
+        self.words = EscapeCache()
+        self.labels = {}
+        self.lines = []
+
+    def node_label(self, n):
+        if self.edge_labels:
+            key = (n.cat, n.edge_label)
+        else:
+            key = (n.cat, None)
+        try:
+            label = self.labels[key]
+        except KeyError:
+            label = escape_label(key[0])
+            if key[1] not in no_edge_labels:
+                label = '%s-%s' % (label, escape_label(key[1]))
+            self.labels[key] = label
+        if self.props:
+            props = getattr(n, 'props', None)
+            if props:
+                label = '%s##%s##' % (label, '|'.join(
+                    ['%s=%s' % (k, escape_label(v))
+                     for (k, v) in props.items()]))
+        return label
+
+    def tree_line(self, t):
+        '''
+        returns the bracketed representation of a tree, without
+        a newline
+        '''
+        node_label = self.node_label
+        words = self.words
+        pieces = ['(' + self.root_label]
+        append = pieces.append
+        stack = list(reversed(t.roots))
+        while stack:
+            n = stack.pop()
+            if n is None:
+                append(')')
+            elif n.isTerminal():
+                append(' (%s %s)' % (node_label(n), words[n.word]))
+            else:
+                append(' (' + node_label(n))
+                stack.append(None)
+                stack.extend(reversed(n.children))
+        append(')')
+        return ''.join(pieces)
+
+    def write_tree(self, t):
+        self.lines.append(self.tree_line(t))
+        if len(self.lines) >= self.chunk_lines:
+            self.flush()
+
+    def write_trees(self, trees):
+        '''
+        writes a number of trees and flushes the buffer
+        '''
+        write_tree = self.write_tree
+        for t in trees:
+            write_tree(t)
+        self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.lines.append('')
+            self.f.write('\n'.join(self.lines))
+            self.lines = []
+
+
+def write_mrg_file(f_out, trees):
+    '''
+    writes trees in Penn Treebank bracketed format
+    '''
+    BracketWriter(f_out).write_trees(trees)
@@ -0,0 +1,689 @@
+# Copyright 2008-2020 Yannick Versley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+# TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+# CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+'''
+staged conversion of treebanks, as used by lingtree_convert.
+
+The stages are:
+
+* reading: the input is cut into raw (unparsed) sentences, in a
+  reader thread that stays ahead of the rest
+* parsing, transforming and formatting each sentence, in a pool of
+  worker processes (:class:`ConvertTask`)
+* writing the formatted sentences in the original order, in a
+  writer thread (:class:`TreeFileWriter`)
+
+The stages are connected by bounded queues, so that memory use
+does not depend on the size of the treebank.
+
+The reader thread runs in the main process. For Export, JSON and
+SPMRL input it only cuts the text into sentences, but TigerXML
+input is parsed there to find the sentences and parsed again in
+the workers, so the reader can limit what more workers gain. How
+the conversion scales with the number of cores has not been
+measured.
+
+For directories of treebank files, :func:`convert_many` converts
+several files at the same time, one per worker process, and
+:func:`join_files` concatenates several treebanks into one.
+'''
+from __future__ import print_function
+import os
+import sys
+import glob
+import time
+import json
+import tempfile
+import multiprocessing
+from collections import deque
+from itertools import islice
+from builtins import open
+from .parallel import ordered_map, prefetch, BackgroundWriter
+
+
+def output_format(fmt):
+    '''
+    normalizes the name of an output format. 'ptb' is the SPMRL
+    bracketed format, which the readers expect in .ptb files; use
+    'mrg' for plain Penn Treebank brackets.
+    '''
+    if fmt == 'export':
+        return 'export3'
+    elif fmt == 'ptb':
+        return 'spmrl'
+    elif fmt in ['export3', 'export4', 'mrg', 'spmrl', 'tigerxml', 'conll']:
+        return fmt
+    return 'json'
+
+
+class TreeFormatter(object):
+    '''
+    turns a tree into the text for one sentence in an output
+    format, i.e. the same text as the file writers (write_export_file,
+    write_json_file, write_mrg_file, ...) produce for it. Formatters
+    can be pickled and sent to worker processes.
+    '''
+    def __init__(self, fmt):
+        from . import penn
+        self.fmt = output_format(fmt)
+        if self.fmt == 'mrg':
+            self.brackets = penn.BracketWriter(None)
+        elif self.fmt == 'spmrl':
+            self.brackets = penn.BracketWriter(None, 'VROOT', True, True)
+        elif self.fmt == 'conll':
+            from . import conll
+            self.tabular = conll.TabularWriter(None, conll.conllx_columns,
+                                               dep_idx=6)
+
+    def __call__(self, t):
+        fmt = self.fmt
+        if fmt in ['export3', 'export4']:
+            from . import export
+            pieces = [export.bos_line(t)]
+            export.sentence_pieces(t, int(fmt[-1]), pieces)
+            pieces.append('#EOS %s\n' % (t.sent_no,))
+            return ''.join(pieces)
+        elif fmt in ['mrg', 'spmrl']:
+            return self.brackets.tree_line(t) + '\n'
+        elif fmt == 'tigerxml':
+            from . import tigerxml
+            return tigerxml.tiger_sentence_xml(t)
+        elif fmt == 'conll':
+            return self.tabular.format_tree(t)
+        else:
+            from . import export
+            return json.dumps({'release': export.to_json(t)}) + '\n'
+
+
+class TreeFileWriter(object):
+    '''
+    writes a treebank file: the header (Export and TigerXML), the
+    sentences, given as trees or as text from a :class:`TreeFormatter`,
+    and the footer. Text is collected and written in chunks of
+    ``chunk_size`` sentences.
+
+    With a :class:`lingtree.index.SentenceIndex` as ``index``, the
+    byte offset and length of each sentence are added to it; f must
+    then be a real file, as its position is needed after the header.
+    '''
+    def __init__(self, f, fmt, meta=None, chunk_size=1000, index=None):
+        self.f = f
+        self.fmt = output_format(fmt)
+        self.formatter = TreeFormatter(self.fmt)
+        self.chunk_size = chunk_size
+        self.pieces = []
+        if self.fmt in ['export3', 'export4']:
+            if meta is not None:
+                from . import export
+                # same header as write_export_file
+                export.write_export_header(
+                    f, meta, int(self.fmt[-1]))
+        elif self.fmt == 'tigerxml':
+            from . import tigerxml
+            tigerxml.write_tiger_header(f, meta)
+        self.index = index
+        if index is not None:
+            if index.fmt is None:
+                index.fmt = self.fmt
+            self.offset = f.tell()
+
+    def write_text(self, text, sent_no=None):
+        self.pieces.append(text)
+        if self.index is not None:
+            size = len(text.encode('UTF-8'))
+            self.index.add(sent_no, self.offset, size)
+            self.offset += size
+        if len(self.pieces) >= self.chunk_size:
+            self.flush()
+
+    def write_tree(self, t):
+        self.write_text(self.formatter(t), getattr(t, 'sent_no', None))
+
+    def flush(self):
+        if self.pieces:
+            self.f.write(''.join(self.pieces))
+            self.pieces = []
+
+    def close(self):
+        '''writes the rest of the sentences and the footer'''
+        self.flush()
+        if self.fmt == 'tigerxml':
+            from . import tigerxml
+            tigerxml.write_tiger_footer(self.f)
+
+
+class ConvertTask(object):
+    '''
+    turns a raw sentence into a (n_tokens, text, xform_times) triple
+    by parsing it, applying the transforms (a
+    :class:`lingtree.xforms.XformChain`) and formatting it. Without
+    a formatter, the tree is returned instead of the text.
+    '''
+    def __init__(self, formatter=None, xforms=None):
+        self.formatter = formatter
+        self.xforms = xforms
+
+    def __call__(self, raw):
+        t = raw.parse()
+        if self.xforms:
+            times = self.xforms(t)
+        else:
+            times = None
+        if self.formatter is None:
+            return (len(t.terminals), t, times)
+        return (len(t.terminals), self.formatter(t), times)
+
+
+class ConvertStats(object):
+    '''
+    counts sentences and tokens for the throughput summary, and
+    the time spent in each transform
+    '''
+    def __init__(self, xform_names=()):
+        from .xforms import XformTimer
+        self.n_sents = 0
+        self.n_tokens = 0
+        self.t_start = time.time()
+        self.timer = XformTimer(list(xform_names))
+
+    def add(self, n_tokens, xform_times=None):
+        self.n_sents += 1
+        self.n_tokens += n_tokens
+        if xform_times is not None:
+            self.timer.add(xform_times)
+
+    def summary(self):
+        elapsed = max(time.time() - self.t_start, 1e-6)
+        return '%d sentences, %d tokens in %.1fs (%.0f sentences/s, %.0f tokens/s)' % (
+            self.n_sents, self.n_tokens, elapsed,
+            self.n_sents / elapsed, self.n_tokens / elapsed)
+
+
+def convert_sentences(raw_sents, writer, xforms=(), num_workers=None,
+                      chunksize=64, preproc=None, preproc_fmt='plain',
+                      stats=None):
+    '''
+    parses, transforms and writes a sequence of raw sentences with
+    ``num_workers`` worker processes, keeping the order of the input.
+    ``xforms`` is a sequence of transforms (names or functions, see
+    :mod:`lingtree.xforms`), which are applied in the workers.
+
+    With ``preproc`` (see :func:`lingtree.conll.merge_trees_generic`),
+    the workers only parse and transform; merging and formatting then
+    happen in the calling process, as they need the trees in order.
+    '''
+    from .xforms import XformChain
+    chain = xforms if isinstance(xforms, XformChain) else XformChain(xforms)
+    chain.resolve()
+    if stats is None:
+        stats = ConvertStats(chain.names)
+    parallel = num_workers is not None and num_workers > 1
+    if parallel:
+        raw_sents = prefetch(raw_sents, 4 * chunksize * num_workers)
+    if preproc is None:
+        task = ConvertTask(writer.formatter, chain)
+    else:
+        task = ConvertTask(None, chain)
+    results = ordered_map(task, raw_sents, num_workers, chunksize)
+    if preproc is None:
+        for n_tokens, text, times in results:
+            stats.add(n_tokens, times)
+            writer.write_text(text)
+    else:
+        from .conll import merge_trees_generic
+
+        def trees():
+            for n_tokens, t, times in results:
+                stats.add(n_tokens, times)
+                yield t
+        for t in merge_trees_generic(trees(), preproc, preproc_fmt):
+            writer.write_tree(t)
+    return stats
+
+
+def convert_file(fname_in, fname_out, opts, xforms=(), num_workers=None):
+    '''
+    converts a treebank file into the format given by opts.outfmt,
+    applying the --filter and --fold selections and the
+    preprocessing merge from opts, and the transforms in xforms.
+    Returns a :class:`ConvertStats`.
+    '''
+    from . import select_trees
+    from .xforms import XformChain
+    chain = xforms if isinstance(xforms, XformChain) else XformChain(xforms)
+    chain.resolve()
+    stats = ConvertStats(chain.names)
+    meta, raw_sents = select_trees(fname_in, opts, want_meta=True, raw=True)
+    f_out = open(fname_out, 'w', encoding='UTF-8')
+    if num_workers is not None and num_workers > 1:
+        f_out = BackgroundWriter(f_out)
+    writer = TreeFileWriter(f_out, opts.outfmt, meta)
+    try:
+        convert_sentences(raw_sents, writer, chain, num_workers,
+                          preproc=getattr(opts, 'preproc', None),
+                          preproc_fmt=getattr(opts, 'preproc_fmt', 'plain'),
+                          stats=stats)
+        writer.close()
+    finally:
+        f_out.close()
+    return stats
+
+
+# bulk conversion of many files
+
+input_extensions = ['.export', '.export3', '.export4', '.xml', '.mrg',
+                    '.ptb', '.json']
+output_extensions = {'json': '.json', 'export3': '.export',
+                     'export4': '.export', 'mrg': '.mrg', 'spmrl': '.ptb',
+                     'tigerxml': '.xml', 'conll': '.conll'}
+
+
+def is_bulk_target(target):
+    '''
+    True if the output argument is a directory or a file name
+    template, i.e. lingtree_convert should run in bulk mode
+    '''
+    return os.path.isdir(target) or target.endswith(os.sep) or \
+        '{' in target
+
+
+def is_bulk_input(arg):
+    '''True if the input argument is a directory or a glob pattern'''
+    return os.path.isdir(arg) or glob.has_magic(arg)
+
+
+def expand_inputs(args):
+    '''
+    turns file names, glob patterns and directories into a list of
+    (fname, name) pairs, where name is the path relative to the
+    directory or glob base, without the extension. Directories are
+    searched recursively for files with known treebank extensions.
+    '''
+    result = []
+    for arg in args:
+        if os.path.isdir(arg):
+            for dirpath, dirnames, filenames in os.walk(arg):
+                dirnames.sort()
+                for fname in sorted(filenames):
+                    if os.path.splitext(fname)[1] in input_extensions:
+                        path = os.path.join(dirpath, fname)
+                        rel = os.path.relpath(path, arg)
+                        result.append((path, os.path.splitext(rel)[0]))
+        elif glob.has_magic(arg):
+            for path in sorted(glob.glob(arg)):
+                if os.path.isfile(path):
+                    name = os.path.basename(path)
+                    result.append((path, os.path.splitext(name)[0]))
+        else:
+            name = os.path.basename(arg)
+            result.append((arg, os.path.splitext(name)[0]))
+    return result
+
+
+def bulk_output_name(name, target, fmt):
+    '''
+    returns the output file name for an input with the relative
+    name ``name``. ``target`` is a directory or a template with the
+    fields {name} (relative path without extension), {stem} (file
+    name without extension) and {ext} (extension of the output format,
+    without the dot), e.g. ``out/{name}.{ext}``.
+    '''
+    ext = output_extensions[output_format(fmt)]
+    if '{' in target:
+        return target.format(name=name, stem=os.path.basename(name),
+                             ext=ext.lstrip('.'))
+    return os.path.join(target, name + ext)
+
+
+def is_up_to_date(fname_in, fname_out):
+    try:
+        return os.path.getmtime(fname_out) >= os.path.getmtime(fname_in)
+    except OSError:
+        return False
+
+
+def convert_atomic(job):
+    '''
+    converts one file of a bulk conversion, writing to a temporary
+    file that is renamed to the output file once it is complete.
+    Returns (fname_in, n_sents, n_tokens, error message or None).
+    '''
+    fname_in, fname_out, opts, xforms = job
+    out_dir = os.path.dirname(fname_out) or '.'
+    tmp_name = None
+    try:
+        if not os.path.isdir(out_dir):
+            try:
+                os.makedirs(out_dir)
+            except OSError:
+                # another worker may have created it in the meantime
+                if not os.path.isdir(out_dir):
+                    raise
+        fd, tmp_name = tempfile.mkstemp(
+            dir=out_dir, prefix='.' + os.path.basename(fname_out) + '.',
+            suffix='.tmp')
+        os.close(fd)
+        # mkstemp creates the file as private, give it the usual mode
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_name, 0o666 & ~umask)
+        stats = convert_file(fname_in, tmp_name, opts, xforms)
+        # unlike os.rename, this also replaces an existing output on Windows
+        os.replace(tmp_name, fname_out)
+        return (fname_in, stats.n_sents, stats.n_tokens, None)
+    except (Exception, SystemExit) as ex:
+        # the readers exit on inputs in an unknown format, which
+        # should only fail this file and not the whole run or a worker
+        if tmp_name is not None and os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        return (fname_in, 0, 0, '%s: %s' % (ex.__class__.__name__, ex))
+
+
+def convert_many(inputs, target, opts, xforms=(), num_workers=None,
+                 force=False):
+    '''
+    converts each of the (fname, name) inputs (see
+    :func:`expand_inputs`) to a file in the target directory or
+    template, with up to num_workers files converted concurrently.
+    Outputs that are newer than their input are skipped unless
+    ``force`` is set. Returns a :class:`BulkStats`.
+    '''
+    from .xforms import XformChain
+    # check the transform names before starting any work
+    chain = xforms if isinstance(xforms, XformChain) else XformChain(xforms)
+    chain.resolve()
+    stats = BulkStats()
+    jobs = []
+    seen = {}
+    for fname_in, name in inputs:
+        fname_out = bulk_output_name(name, target, opts.outfmt)
+        if fname_out in seen:
+            raise ValueError('%s and %s would both be written to %s' % (
+                seen[fname_out], fname_in, fname_out))
+        seen[fname_out] = fname_in
+        if not force and is_up_to_date(fname_in, fname_out):
+            stats.n_skipped += 1
+            continue
+        jobs.append((fname_in, fname_out, opts, chain))
+    if num_workers is not None and num_workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(num_workers, len(jobs)))
+        try:
+            results = pool.imap_unordered(convert_atomic, jobs)
+            for result in results:
+                stats.add(*result)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for job in jobs:
+            stats.add(*convert_atomic(job))
+    return stats
+
+
+class BulkStats(object):
+    '''aggregate counts for a bulk conversion'''
+    def __init__(self):
+        self.n_files = 0
+        self.n_skipped = 0
+        self.failed = []
+        self.n_sents = 0
+        self.n_tokens = 0
+        self.t_start = time.time()
+
+    def add(self, fname_in, n_sents, n_tokens, error):
+        if error is not None:
+            self.failed.append((fname_in, error))
+            print("%s: %s" % (fname_in, error), file=sys.stderr)
+            return
+        self.n_files += 1
+        self.n_sents += n_sents
+        self.n_tokens += n_tokens
+
+    def summary(self):
+        elapsed = max(time.time() - self.t_start, 1e-6)
+        return ('%d files converted, %d up to date, %d failed: '
+                '%d sentences, %d tokens in %.1fs '
+                '(%.1f files/s, %.0f sentences/s, %.0f tokens/s)') % (
+                    self.n_files, self.n_skipped, len(self.failed),
+                    self.n_sents, self.n_tokens, elapsed,
+                    self.n_files / elapsed, self.n_sents / elapsed,
+                    self.n_tokens / elapsed)
+
+
+# joining several treebanks into one
+
+class JoinTask(object):
+    '''
+    parses a raw sentence, gives it its new sentence and document
+    number (unless they are None) and formats it. Returns
+    (n_tokens, sent_no, text).
+    '''
+    def __init__(self, formatter):
+        self.formatter = formatter
+
+    def __call__(self, item):
+        raw, sent_no, doc_no = item
+        t = raw.parse()
+        if sent_no is not None:
+            t.sent_no = sent_no
+            t.doc_no = doc_no
+        return (len(t.terminals), t.sent_no, self.formatter(t))
+
+
+class Renumbering(object):
+    '''
+    numbers the sentences of several treebanks consecutively, and
+    shifts the document numbers of each treebank so that they come
+    after the documents of the previous ones. A treebank without
+    document numbers counts as one document. With ``doc_offsets``,
+    the document numbers of the i-th treebank are shifted by
+    doc_offsets[i] instead (see :func:`lingtree.export.origin_offsets`).
+    '''
+    def __init__(self, doc_offsets=None):
+        self.sent_no = 0
+        self.doc_offsets = doc_offsets
+        self.n_inputs = 0
+        self.doc_offset = 0
+        self.max_doc = 0
+
+    def next_input(self):
+        if self.doc_offsets is not None:
+            self.doc_offset = self.doc_offsets[self.n_inputs]
+        else:
+            self.doc_offset = self.max_doc
+        self.n_inputs += 1
+
+    def __call__(self, raw):
+        from .folds import as_int
+        self.sent_no += 1
+        doc_no = raw.doc_no
+        if doc_no is None:
+            doc_no = self.doc_offset + 1
+        else:
+            num = as_int(doc_no)
+            if num is None:
+                # not a number, keep it as it is
+                return (raw, self.sent_no, doc_no)
+            doc_no = num + self.doc_offset
+        self.max_doc = max(self.max_doc, doc_no)
+        return (raw, self.sent_no, doc_no)
+
+
+def read_ahead_inputs(inputs, n_ahead=2, maxsize=1024):
+    '''
+    takes a sequence of iterators and yields them in turn, while
+    up to ``n_ahead`` of them are read ahead in background threads
+    '''
+    it = iter(inputs)
+    pending = deque([prefetch(x, maxsize, start=True)
+                     for x in islice(it, n_ahead)])
+    while pending:
+        current = pending.popleft()
+        for x in islice(it, 1):
+            pending.append(prefetch(x, maxsize, start=True))
+        yield current
+
+
+def join_files(fnames, fname_out, opts, num_workers=None, renumber=True,
+               make_index=True, chunksize=64):
+    '''
+    writes the sentences of several treebank files into one file in
+    the format given by opts.outfmt, with merged header tables (see
+    :func:`lingtree.export.merge_export_headers`). The inputs are
+    read ahead in background threads, and the sentences are parsed
+    and formatted by ``num_workers`` worker processes.
+
+    With ``renumber``, sentences are numbered consecutively and
+    documents are kept apart (see :class:`Renumbering`). With
+    ``make_index``, the sentence index of the output is written to
+    ``fname_out + '.idx'`` (see :mod:`lingtree.index`).
+    Returns a :class:`ConvertStats`.
+    '''
+    from . import select_trees
+    from .export import merge_export_headers, origin_offsets
+    from .index import SentenceIndex
+    all_meta = []
+    all_sents = []
+    for fname in fnames:
+        meta, raw_sents = select_trees(fname, opts, want_meta=True, raw=True)
+        all_meta.append(meta)
+        all_sents.append(raw_sents)
+    doc_offsets = None
+    if renumber:
+        doc_offsets = origin_offsets(all_meta)
+    meta = merge_export_headers(all_meta, doc_offsets)
+    stats = ConvertStats()
+    n_ahead = max(2, num_workers or 1)
+
+    def items():
+        numbering = Renumbering(doc_offsets)
+        for raw_sents in read_ahead_inputs(all_sents, n_ahead):
+            numbering.next_input()
+            for raw in raw_sents:
+                if renumber:
+                    yield numbering(raw)
+                else:
+                    yield (raw, None, None)
+    index = None
+    if make_index:
+        index = SentenceIndex(fname_out)
+    with open(fname_out, 'w', encoding='UTF-8') as f_out:
+        writer = TreeFileWriter(f_out, opts.outfmt, meta, index=index)
+        for n_tokens, sent_no, text in ordered_map(
+                JoinTask(writer.formatter), items(), num_workers, chunksize):
+            stats.add(n_tokens)
+            writer.write_text(text, sent_no)
+        writer.close()
+    if index is not None:
+        index.save()
+    return stats
+
+
+# cross-validation folds
+
+fold_splits = ['trainfinal', 'testfinal', 'traindev', 'testdev']
+
+
+def fold_selections(n_folds, template, splits=fold_splits):
+    '''
+    returns (name, selection) pairs for the given splits of all
+    folds, where name is the template filled with {split} and {fold},
+    and the selection is the :class:`lingtree.folds.Folder` that
+    ``--fold <split><fold>/<n_folds>`` gives
+    '''
+    from .folds import parse_foldspec
+    return [(template.format(split=split, fold=fold),
+             parse_foldspec('%s%d/%d' % (split, fold, n_folds)))
+            for fold in range(1, n_folds + 1) for split in splits]
+
+
+def fold_members(selections, n_folds):
+    '''
+    for each of the n_folds positions in the round-robin cycle,
+    returns the indices of the selections that contain it
+    '''
+    return [[k for k, (name, sel) in enumerate(selections)
+             if sel.apply_all(i, 0, None) is not None]
+            for i in range(n_folds)]
+
+
+def split_folds(fname, n_folds, template, opts, num_workers=None,
+                index_only=False, splits=fold_splits):
+    '''
+    reads a treebank once and writes the train and test sets of all
+    n_folds folds, i.e. the same sentences as reading it with
+    ``--fold trainfinal1/10``, ``--fold testfinal1/10`` and so on.
+    Output names are given by the template, with the fields {split}
+    (trainfinal, testfinal, traindev or testdev) and {fold}, and
+    the extension of opts.outfmt.
+
+    With index_only, only sentence indexes (name + '.idx', see
+    :mod:`lingtree.index`) that point into the treebank are written,
+    which needs neither parsing nor copying.
+    Returns a dictionary with the number of sentences for each name.
+    '''
+    selections = fold_selections(n_folds, template, splits)
+    members = fold_members(selections, n_folds)
+    counts = dict([(name, 0) for name, sel in selections])
+    for name, sel in selections:
+        dir_name = os.path.dirname(name)
+        if dir_name and not os.path.isdir(dir_name):
+            os.makedirs(dir_name)
+    if index_only:
+        from . import guess_format
+        from .index import find_index, build_index
+        if getattr(opts, 'filterspec', None) or getattr(opts, 'foldspec', None):
+            raise ValueError('--filter and --fold cannot be used for index-only folds')
+        index = find_index(fname)
+        if index is None:
+            index = build_index(fname, guess_format(fname, opts),
+                                getattr(opts, 'inputenc', None) or 'UTF-8')
+        positions = [[] for sel in selections]
+        for i in range(len(index)):
+            for k in members[i % n_folds]:
+                positions[k].append(i)
+        for (name, sel), pos in zip(selections, positions):
+            index.subset(pos).save(name + '.idx')
+            counts[name] = len(pos)
+        return counts
+    from . import select_trees
+    meta, raw_sents = select_trees(fname, opts, want_meta=True, raw=True)
+    ext = output_extensions[output_format(opts.outfmt)]
+    files = []
+    writers = []
+    try:
+        for name, sel in selections:
+            f = open(name + ext, 'w', encoding='UTF-8')
+            files.append(f)
+            writers.append(TreeFileWriter(f, opts.outfmt, meta))
+        task = ConvertTask(writers[0].formatter)
+        if num_workers is not None and num_workers > 1:
+            raw_sents = prefetch(raw_sents)
+        n_written = [0] * len(selections)
+        for i, (n_tokens, text, times) in enumerate(
+                ordered_map(task, raw_sents, num_workers)):
+            for k in members[i % n_folds]:
+                writers[k].write_text(text)
+                n_written[k] += 1
+        for w in writers:
+            w.close()
+        for (name, sel), n in zip(selections, n_written):
+            counts[name] = n
+    finally:
+        for f in files:
+            f.close()
+    return counts
@@ -0,0 +1,346 @@
+# Copyright 2008-2020 Yannick Versley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+# TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+# CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+'''
+keeps a whole corpus in one block of shared memory, so that
+worker processes do not have to re-read the treebank or receive
+pickled trees.
+
+The parent process loads the corpus once::
+
+    corpus = SharedCorpus.create(read_trees(fname))
+    ...  # hand corpus.handle to the workers
+    corpus.unlink()
+
+and each worker attaches to it through the (small, picklable)
+handle, with :func:`get_corpus`. Word, tag and length accesses read
+the shared arrays directly; :class:`Tree` objects are only built
+when a tree is requested with ``corpus[i]``.
+
+The corpus is stored column-wise: for every node (in pre-order,
+tree after tree) the ids of id, cat, word, edge label, morph and
+lemma in a shared string table, the parent index and the token
+span. Node attributes outside these columns (secondary edges,
+syn_parent, comments, ...) are pickled per tree, with references
+to nodes replaced by node indices.
+
+This module needs Python 3.8 or later.
+'''
+from __future__ import print_function
+import pickle
+from array import array
+from multiprocessing import shared_memory
+from .tree import Tree, Node, TerminalNode, NontermNode, preorder_nodes, \
+    NodeRef, encode_value, decode_value
+
+# string ids below zero
+NONE_ID = -1
+MISSING_ID = -2
+
+# parent index of terminals that cannot be reached from the roots
+UNREACHABLE = -2
+
+str_columns = ['id', 'cat', 'word', 'edge_label', 'morph', 'lemma']
+int_columns = ['parent', 'start', 'end']
+skip_attrs = set(str_columns + int_columns + ['children'])
+
+sections = [('tree_nodes', 'q'), ('tree_terms', 'q'), ('tree_extras', 'q'),
+            ('term_idx', 'i')] + [
+    (k, 'i') for k in str_columns + int_columns] + [
+    ('str_offsets', 'q'), ('str_data', 'B'), ('extras', 'B')]
+
+
+class CorpusHandle(object):
+    '''
+    picklable reference to a :class:`SharedCorpus`: the name of the
+    shared memory block and the position of each column in it
+    '''
+    def __init__(self, name, layout):
+        self.name = name
+        self.layout = layout
+
+    def __repr__(self):
+        return 'CorpusHandle(%r)' % (self.name,)
+
+
+class CorpusBuilder(object):
+    '''collects the columns of a corpus before it is put into shared memory'''
+    def __init__(self):
+        self.columns = dict([(k, array(tc)) for (k, tc) in sections])
+        for k in ['tree_nodes', 'tree_terms', 'tree_extras', 'str_offsets']:
+            self.columns[k].append(0)
+        self.strings = {}
+        self.str_data = bytearray()
+        self.extras = bytearray()
+
+    def intern(self, s):
+        try:
+            return self.strings[s]
+        except KeyError:
+            idx = len(self.strings)
+            self.strings[s] = idx
+            self.str_data += s.encode('UTF-8')
+            self.columns['str_offsets'].append(len(self.str_data))
+            return idx
+
+    def add_tree(self, t):
+        cols = self.columns
+        nodes = preorder_nodes(t)
+        n_reachable = len(nodes)
+        index = dict([(id(n), i) for (i, n) in enumerate(nodes)])
+        for n in t.terminals:
+            if id(n) not in index:
+                index[id(n)] = len(nodes)
+                nodes.append(n)
+        intern = self.intern
+        node_extras = []
+        for i, n in enumerate(nodes):
+            d = n.__dict__
+            extra = {}
+            for k in str_columns:
+                if k not in d:
+                    val = MISSING_ID
+                elif d[k] is None:
+                    val = NONE_ID
+                elif isinstance(d[k], str):
+                    val = intern(d[k])
+                else:
+                    val = MISSING_ID
+                    extra[k] = d[k]
+                cols[k].append(val)
+            parent = n.parent
+            if i >= n_reachable:
+                cols['parent'].append(UNREACHABLE)
+            elif parent is None:
+                cols['parent'].append(-1)
+            else:
+                cols['parent'].append(index[id(parent)])
+            cols['start'].append(n.start)
+            cols['end'].append(n.end)
+            for k in d:
+                if k not in skip_attrs:
+                    extra[k] = d[k]
+            if extra:
+                node_extras.append((i, encode_value(extra, index)))
+        for n in t.terminals:
+            cols['term_idx'].append(index[id(n)])
+        tree_extras = {}
+        if t.__dict__:
+            tree_extras['attrs'] = encode_value(t.__dict__, index)
+        default_table = dict([(n.id, n) for n in nodes
+                              if not n.isTerminal() and n.id is not None])
+        if t.node_table != default_table:
+            tree_extras['node_table'] = encode_value(t.node_table, index)
+        if [n for n in nodes[:n_reachable] if n.parent is None] != t.roots:
+            tree_extras['roots'] = [index[id(n)] for n in t.roots]
+        if node_extras:
+            tree_extras['nodes'] = node_extras
+        if tree_extras:
+            self.extras += pickle.dumps(tree_extras, pickle.HIGHEST_PROTOCOL)
+        cols['tree_nodes'].append(len(cols['parent']))
+        cols['tree_terms'].append(len(cols['term_idx']))
+        cols['tree_extras'].append(len(self.extras))
+
+    def to_shared(self):
+        '''
+        copies the columns into a new block of shared memory and
+        returns the corresponding :class:`SharedCorpus`
+        '''
+        self.columns['str_data'] = self.str_data
+        self.columns['extras'] = self.extras
+        layout = {}
+        pos = 0
+        for k, tc in sections:
+            col = self.columns[k]
+            nbytes = len(col) * (1 if tc == 'B' else col.itemsize)
+            layout[k] = (pos, nbytes, tc)
+            # keep all columns 8-byte aligned
+            pos += (nbytes + 7) & ~7
+        shm = shared_memory.SharedMemory(create=True, size=max(pos, 8))
+        for k, tc in sections:
+            off, nbytes, tc = layout[k]
+            shm.buf[off:off + nbytes] = memoryview(self.columns[k]).cast('B')
+        return SharedCorpus(shm, CorpusHandle(shm.name, layout), owner=True)
+
+
+def attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # track was only added in Python 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedCorpus(object):
+    '''
+    read-only view on a corpus in shared memory. Use :meth:`create`
+    in the parent process and :meth:`attach` (or :func:`get_corpus`)
+    in the workers.
+    '''
+    def __init__(self, shm, handle, owner=False):
+        self.shm = shm
+        self.handle = handle
+        self.owner = owner
+        self.views = []
+        for k, tc in sections:
+            off, nbytes, tc = handle.layout[k]
+            view = shm.buf[off:off + nbytes]
+            if tc != 'B':
+                view = view.cast(tc)
+            self.views.append(view)
+            setattr(self, k, view)
+        self.str_cache = {}
+
+    @classmethod
+    def create(cls, trees):
+        '''loads the trees into a new shared memory block'''
+        builder = CorpusBuilder()
+        for t in trees:
+            builder.add_tree(t)
+        return builder.to_shared()
+
+    @classmethod
+    def attach(cls, handle):
+        return cls(attach_shared_memory(handle.name), handle)
+
+    def __len__(self):
+        return len(self.tree_nodes) - 1
+
+    def __getitem__(self, i):
+        return self.tree(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.tree(i)
+
+    def string(self, idx):
+        if idx < 0:
+            return None
+        try:
+            return self.str_cache[idx]
+        except KeyError:
+            offsets = self.str_offsets
+            s = bytes(self.str_data[offsets[idx]:offsets[idx + 1]]).decode('UTF-8')
+            self.str_cache[idx] = s
+            return s
+
+    def n_tokens(self, i):
+        return self.tree_terms[i + 1] - self.tree_terms[i]
+
+    def term_column(self, i, column):
+        '''returns the string values of a column for the terminals of tree i'''
+        base = self.tree_nodes[i]
+        col = getattr(self, column)
+        string = self.string
+        return [string(col[base + k])
+                for k in self.term_idx[self.tree_terms[i]:self.tree_terms[i + 1]]]
+
+    def words(self, i):
+        return self.term_column(i, 'word')
+
+    def tags(self, i):
+        return self.term_column(i, 'cat')
+
+    def tree(self, i):
+        '''builds the :class:`Tree` object for the i-th tree'''
+        start = self.tree_nodes[i]
+        end = self.tree_nodes[i + 1]
+        string = self.string
+        str_cols = [(k, getattr(self, k)) for k in str_columns]
+        parents = self.parent
+        starts = self.start
+        ends = self.end
+        t = Tree()
+        nodes = []
+        term_idx = self.term_idx[self.tree_terms[i]:self.tree_terms[i + 1]]
+        is_term = set(term_idx)
+        for k in range(start, end):
+            if k - start in is_term:
+                n = TerminalNode.__new__(TerminalNode)
+            else:
+                n = NontermNode.__new__(NontermNode)
+            d = n.__dict__
+            for name, col in str_cols:
+                idx = col[k]
+                if idx != MISSING_ID:
+                    d[name] = string(idx)
+            d['start'] = starts[k]
+            d['end'] = ends[k]
+            d['children'] = []
+            parent_idx = parents[k]
+            if parent_idx >= 0:
+                parent = nodes[parent_idx]
+                d['parent'] = parent
+                parent.children.append(n)
+            else:
+                d['parent'] = None
+                if parent_idx == -1:
+                    t.roots.append(n)
+            nodes.append(n)
+        t.terminals = [nodes[k] for k in term_idx]
+        e_start = self.tree_extras[i]
+        e_end = self.tree_extras[i + 1]
+        extras = {}
+        if e_end > e_start:
+            extras = pickle.loads(bytes(self.extras[e_start:e_end]))
+        for k, extra in extras.get('nodes', ()):
+            nodes[k].__dict__.update(decode_value(extra, nodes))
+        if 'roots' in extras:
+            t.roots = [nodes[k] for k in extras['roots']]
+        if 'node_table' in extras:
+            t.node_table = decode_value(extras['node_table'], nodes)
+        else:
+            t.node_table = dict([(n.id, n) for n in nodes
+                                 if not n.isTerminal() and n.id is not None])
+        if 'attrs' in extras:
+            t.__dict__.update(decode_value(extras['attrs'], nodes))
+        return t
+
+    def close(self):
+        for view in self.views:
+            view.release()
+        self.views = []
+        self.shm.close()
+
+    def unlink(self):
+        '''closes and frees the shared memory block (owner only)'''
+        self.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
+
+
+attached_corpora = {}
+
+
+def get_corpus(handle):
+    '''
+    returns the :class:`SharedCorpus` for a handle, attaching to
+    the shared memory only once per process
+    '''
+    try:
+        return attached_corpora[handle.name]
+    except KeyError:
+        corpus = SharedCorpus.attach(handle)
+        attached_corpora[handle.name] = corpus
+        return corpus
@@ -58,10 +58,7 @@ def spmrl2nodes(lst, props2morph=None):
         code = lst[idx][0]
         if code == '(':
             lab = lst[idx][1]
-            if '-' in lab:
-                (lab, elabel) = lab.split('-')
-            else:
-                elabel = None
+            (lab, elabel) = penn.split_label(lab)
             if lst[idx][2]:
                 props = dict([x.split('=', 1)
                               for x in lst[idx][2].split('|') if '=' in x])
@@ -102,8 +99,35 @@ def spmrl2nodes(lst, props2morph=None):
 
 
 
-def read_spmrl(f, props2morph=None):
+preterminal_re = re.compile(r'\(([^\s#()]+)(?:##(\S*?)##)?\s+([^\s()]+)\s*\)')
+
+
+def line2terminals(s, props2morph=None, projection='terminals'):
+    """
+    given a line in SPMRL format, returns a :class:`lingtree.tree.Sentence`
+    with only the terminals, without building the nonterminal nodes
+    """
+    make_token = tree.token_factory(projection)
+    terminals = []
+    for i, (lab, s_props, word) in enumerate(preterminal_re.findall(s)):
+        lab, elabel = penn.split_label(lab)
+        n = make_token(word, lab, None, None, elabel, i)
+        if s_props:
+            n.props = dict([x.split('=', 1)
+                            for x in s_props.split('|') if '=' in x])
+        else:
+            n.props = {}
+        if props2morph is not None:
+            props2morph(n)
+        terminals.append(n)
+    return tree.Sentence(terminals)
+
+
+def read_spmrl(f, props2morph=None, projection=None):
     for l in f:
+        if projection is not None:
+            yield line2terminals(l, props2morph, projection)
+            continue
         node = spmrl2nodes(tokenize_spmrl(l.strip()), props2morph)
         t = penn.node2tree(node, node.cat == 'VROOT')
         yield t
@@ -164,3 +188,35 @@ def spmrl2cqp_main(argv=None):
     (opts, args) = spmrl2cqp_opt.parse_args(argv)
     spmrl2cqp(open(args[0], 'r', encoding='UTF-8'), opts.columns, opts.want_morph,
               set(opts.columns+opts.exclude))
+
+
+def write_spmrl_file(f_out, trees, edge_labels=True, props=True):
+    '''
+    writes trees in SPMRL bracketed format, with edge labels
+    and ##feature## properties
+    '''
+    penn.BracketWriter(f_out, 'VROOT', edge_labels, props).write_trees(trees)
+
+
+def decode_raw_spmrl(data):
+    l, props2morph, projection = data
+    if projection is not None:
+        return line2terminals(l, props2morph, projection)
+    node = spmrl2nodes(tokenize_spmrl(l.strip()), props2morph)
+    return penn.node2tree(node, node.cat == 'VROOT')
+
+
+def raw_spmrl_words(data):
+    return [x[2] for x in preterminal_re.findall(data[0])]
+
+
+def read_raw_spmrl(f, props2morph=None, projection=None, first_line=0):
+    """
+    reads the lines of an SPMRL file as :class:`lingtree.folds.RawSentence`
+    objects, numbered by line. ``first_line`` is the number of lines
+    of the file that come before the lines in f.
+    """
+    from .folds import RawSentence
+    for i, l in enumerate(f, first_line):
+        yield RawSentence(i + 1, None, (l, props2morph, projection),
+                          decode_raw_spmrl, raw_spmrl_words)
@@ -0,0 +1,47 @@
+import unittest
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from lingtree.tree import Tree, TerminalNode, NontermNode
+
+
+def make_tree():
+    t = Tree()
+    for i, (w, c) in enumerate([('Das', 'PDS'), ('sehe', 'VVFIN'),
+                                ('ich', 'PPER'), ('.', '$.')]):
+        n = TerminalNode(c, w, '--')
+        n.start = i
+        n.end = i + 1
+        t.terminals.append(n)
+    s = NontermNode('S', '--')
+    vp = NontermNode('VP', 'OC')
+    vp.append(t.terminals[0])
+    s.append(vp)
+    s.append(t.terminals[1])
+    vp.append(t.terminals[2])
+    t.roots = [s, t.terminals[3]]
+    t.determine_tokenspan_all()
+    t.renumber_ids()
+    return t
+
+
+@unittest.skipIf(numpy is None, 'needs numpy')
+class TestArrays(unittest.TestCase):
+    def test_roundtrip(self):
+        from lingtree.arrays import make_vocabs, trees_to_arrays, arrays_to_trees
+        t = make_tree()
+        vocabs = make_vocabs()
+        arrays = trees_to_arrays([t, t], vocabs, chart=True)
+        self.assertEqual(arrays['words'].shape, (2, 4))
+        self.assertEqual(arrays['span_parents'][0].tolist(), [-1, 0])
+        self.assertEqual(arrays['chart'][0, 0, 2],
+                         vocabs['label'].ids['S'])
+        t2 = arrays_to_trees(arrays, vocabs)[0]
+        self.assertEqual([n.word for n in t2.terminals],
+                         ['Das', 'sehe', 'ich', '.'])
+        vp = t2.terminals[0].parent
+        self.assertEqual((vp.cat, vp.edge_label), ('VP', 'OC'))
+        self.assertTrue(t2.terminals[2].parent is vp)
+        self.assertEqual(vp.parent.cat, 'S')
+        self.assertEqual(len(t2.roots), 2)
@@ -0,0 +1,17 @@
+import unittest
+from lingtree.batching import bucket_batches, token_budget_batches
+
+class TestBatching(unittest.TestCase):
+    def test_budget(self):
+        pairs = [(n, n) for n in [1, 2, 2, 3, 5, 9]]
+        batches = list(token_budget_batches(pairs, 6))
+        self.assertEqual(batches, [[1, 2, 2], [3], [5], [9]])
+
+    def test_deterministic(self):
+        sents = list(range(1, 40)) * 3
+        b1 = list(bucket_batches(sents, 20, 50, seed=42, length=int))
+        b2 = list(bucket_batches(sents, 20, 50, seed=42, length=int))
+        self.assertEqual(b1, b2)
+        self.assertEqual(sorted(sum(b1, [])), sorted(sents))
+        for batch in b1:
+            self.assertTrue(len(batch) == 1 or len(batch) * max(batch) <= 20)
@@ -0,0 +1,144 @@
+import unittest
+import os
+import gzip
+import pickle
+import shutil
+import tempfile
+from io import StringIO
+from lingtree.tree import Tree, TerminalNode
+from lingtree.conll import align_sentences, merge_annotations, MergeReport
+
+def make_tree(words, tag=None):
+    t = Tree()
+    for i, w in enumerate(words):
+        n = TerminalNode(tag or w.upper(), w)
+        n.start = i
+        n.end = i + 1
+        t.terminals.append(n)
+    t.roots = t.terminals[:]
+    return t
+
+def make_dep_tree():
+    t = make_tree(['a', 'b', 'c'])
+    a, b, c = t.terminals
+    a.lemma = 'A'
+    a.syn_parent, a.syn_label = b, 'NK'
+    b.syn_parent, b.syn_label = None, 'ROOT'
+    c.syn_parent, c.syn_label = b, None
+    return t
+
+class TestTabular(unittest.TestCase):
+    def test_format(self):
+        from lingtree.conll import TabularWriter, conllx_columns
+        w = TabularWriter(None, conllx_columns, dep_idx=6)
+        self.assertEqual(w.format_tree(make_dep_tree()),
+                         '1\ta\tA\t_\tA\t_\t2\tNK\t_\t_\n'
+                         '2\tb\t_\t_\tB\t_\t0\tROOT\t_\t_\n'
+                         '3\tc\t_\t_\tC\t_\t2\t_\t_\t_\n\n')
+        # columns beyond the given ones, without a dependency column
+        w = TabularWriter(None, ['word', None, 'cat'], id_idx=1)
+        self.assertEqual(w.format_tree(make_tree(['x'])), 'x\t1\tX\n\n')
+        w2 = pickle.loads(pickle.dumps(w))
+        self.assertEqual(w2.format_tree(make_tree(['x'])), 'x\t1\tX\n\n')
+
+    def test_columns(self):
+        from lingtree.conll import TabularWriter, conllx_columns
+        w = TabularWriter(None, conllx_columns, dep_idx=6)
+        t = make_dep_tree()
+        cols = {'word': ['a', 'b', 'c'], 'lemma': ['A', None, None],
+                'cat': ['A', 'B', 'C'], 'syn_label': ['NK', 'ROOT', None],
+                'head': [2, 0, 2]}
+        self.assertEqual(w.format_columns(cols), w.format_tree(t))
+        f = StringIO()
+        w.f = f
+        w.write_columns(cols)
+        w.write_tree(t)
+        text = f.getvalue()
+        self.assertEqual(text[:len(text) // 2], text[len(text) // 2:])
+        self.assertEqual(w.format_columns({}), w.format_tree(make_tree([])))
+        del cols['head']
+        self.assertTrue(w.format_columns(cols).startswith(
+            '1\ta\tA\t_\tA\t_\t0\tNK'))
+        cols['cat'] = ['A', 'B']
+        self.assertRaises(ValueError, w.format_columns, cols)
+
+    def test_gzip(self):
+        from lingtree.conll import make_conllx_writer, TabularWriter, \
+            conllx_columns
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmp_dir, 'out.conll.gz')
+            w = make_conllx_writer(fname)
+            w.write_trees([make_dep_tree(), make_dep_tree()])
+            w.close()
+            self.assertTrue(w.f.closed)
+            with gzip.open(fname, 'rt') as f:
+                text = f.read()
+            expected = TabularWriter(None, conllx_columns, dep_idx=6)\
+                .format_tree(make_dep_tree())
+            self.assertEqual(text, expected * 2)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+class TestMerge(unittest.TestCase):
+    def test_align(self):
+        sents = [['a', 'b'], ['c'], ['d', 'e', 'f'], ['g'], ['h', 'i']]
+        orig = [make_tree(ws) for ws in sents]
+        # drop the second sentence, split the third
+        merge = [make_tree(ws, 'X') for ws in
+                 [sents[0], ['d'], ['e', 'f'], sents[3], sents[4], ['z']]]
+        report = MergeReport(quiet_differ=True, max_messages=0)
+        pairs = list(align_sentences(orig, merge, report))
+        self.assertEqual([t for t, terms in pairs], orig)
+        self.assertEqual(pairs[1][1], None)
+        self.assertEqual(report.n_unmatched, 1)
+        self.assertEqual(report.n_extra, 1)
+        trees = list(merge_annotations(orig, merge, ['word', 'cat'],
+                                       report=MergeReport(max_messages=0)))
+        self.assertEqual([n.cat for n in trees[2].terminals], ['X'] * 3)
+        self.assertEqual(trees[1].terminals[0].cat, 'C')
+
+    def test_recombine(self):
+        from lingtree.folds import do_recombine
+        items = list(range(11))
+        for init in [1, 2]:
+            folds = [[] for i in range(4)]
+            for i in items:
+                folds[(i + init) % 4].append(i)
+            self.assertEqual(list(do_recombine(folds, init)), items)
+        folds[0].append(99)
+        self.assertRaises(ValueError, list, do_recombine(folds, 2))
+
+    def test_recombine_files(self):
+        from lingtree.conll import recombine_files
+        from lingtree.index import load_index, index_name
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fnames = [os.path.join(tmp_dir, 'fold%d.conll' % (i,))
+                      for i in range(2)]
+            # sentences 1-3 distributed round-robin, testfinal folds
+            for fname, sents in zip(fnames, [['b'], ['a', 'c']]):
+                with open(fname, 'w') as f:
+                    for w in sents:
+                        f.write('1\t%s\t_\n\n' % (w,))
+            dest = os.path.join(tmp_dir, 'dest.conll')
+            self.assertEqual(recombine_files(fnames, dest, 1, True,
+                                             ['s10', 's20', 's30']), 3)
+            with open(dest) as f:
+                self.assertEqual([line.split('\t')[1] for line in f
+                                  if line.strip()], ['a', 'b', 'c'])
+            self.assertEqual(load_index(index_name(dest)).sent_nos,
+                             ['s10', 's20', 's30'])
+            # too few or too many ids: an error, and the old outputs stay
+            for sent_ids in [['s10', 's20'], ['s10', 's20', 's30', 's40']]:
+                with self.assertRaises(ValueError) as cm:
+                    recombine_files(fnames, dest, 1, True, sent_ids)
+                self.assertIn('3 sentences recombined, but %d' %
+                              (len(sent_ids),), str(cm.exception))
+                self.assertEqual(load_index(index_name(dest)).sent_nos,
+                                 ['s10', 's20', 's30'])
+            self.assertEqual(sorted(os.listdir(tmp_dir)),
+                             ['dest.conll', 'dest.conll.idx',
+                              'fold0.conll', 'fold1.conll'])
+        finally:
+            shutil.rmtree(tmp_dir)
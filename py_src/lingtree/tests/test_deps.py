@@ -0,0 +1,123 @@
+import unittest
+from lingtree.tree import Tree, NontermNode, TerminalNode
+from lingtree import deps
+from lingtree.deps import make_headrules, LabelFinder
+
+def make_nodes(pairs):
+    return [TerminalNode(cat, 'w', lbl) for (cat, lbl) in pairs]
+
+class TestHeadRules(unittest.TestCase):
+    def test_find_head(self):
+        rules = make_headrules([
+            ('NP', [(None, 'HD', 'l'), (['NN', 'NE'], 'NK', 'r'), (None, 'r')]),
+            (None, [(None, 'HD', 'l'), (None, 'l')])])
+        nodes = make_nodes([('ART', 'NK'), ('NN', 'NK'), ('NE', 'NK'), ('PP', 'MNR')])
+        self.assertEqual(rules['NP'].findHead(nodes), 2)
+        self.assertEqual(rules[None].findHead(nodes), 0)
+        nodes[1].edge_label = 'HD'
+        nodes[3].edge_label = 'HD'
+        self.assertEqual(rules['NP'].findHead(nodes), 1)
+        self.assertEqual(rules[None].findHead(nodes), 1)
+        self.assertEqual(rules['NP'].findHead([]), None)
+
+    def test_labels(self):
+        finder = LabelFinder([
+            ((['ART', 'PDAT'], None, None), (None, 'NP', None), 'det'),
+            ((None, None, 'SB'), None, 'subj'),
+            (None, ('NN', None, None), 'attr')])
+        configs = [('ART', 'ART', 'NK', 'NN', 'NP', 'HD'),
+                   ('ART', 'ART', 'NK', 'NN', 'PP', 'HD'),
+                   ('NE', 'NP', 'SB', 'VVFIN', 'S', 'HD'),
+                   ('NE', 'NE', 'NK', 'VVFIN', 'S', 'HD')]
+        self.assertEqual([finder.find_label(c) for c in configs],
+                         ['det', 'attr', 'subj', None])
+
+    def test_deep_tree(self):
+        t = Tree()
+        t.terminals = make_nodes([('NN', 'HD'), ('ADV', 'MO')])
+        for i, n in enumerate(t.terminals):
+            n.start = i
+        node = NontermNode('NP', 'HD')
+        node.append(t.terminals[0])
+        for i in range(5001):
+            parent = NontermNode('XP' if i % 2 else 'NP', 'HD')
+            parent.append(node)
+            node = parent
+        node.append(t.terminals[1])
+        t.roots = [node]
+        extractor = deps.SimpleDepExtractor([
+            ('NP', [(None, 'HD', 'l')]), (None, [('NN', 'l')])])
+        counter = deps.WarningCounter()
+        old_handler = deps.warning_handler
+        deps.warning_handler = counter
+        try:
+            extractor(t)
+        finally:
+            deps.warning_handler = old_handler
+        self.assertEqual(t.terminals[1].syn_parent, t.terminals[0])
+        self.assertEqual(t.terminals[0].syn_parent, None)
+        self.assertEqual(counter.counts, {'nohead': {('XP',): 2500}})
+
+sample_headrules = u"""% TIGER-style head rules
+S left-to-right VVFIN VAFIN VMFIN
+NP right-to-left NN NE PPER
+CNP left-to-right NP NN
+"""
+
+class TestDepsMain(unittest.TestCase):
+    def test_deps_main(self):
+        import os
+        import shutil
+        import tempfile
+        from lingtree.tests.test_export import sample_export
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fnames = [os.path.join(tmp_dir, x) for x in
+                      ['tiger.head', 'in.export', 'out.conll']]
+            for fname, text in zip(fnames, [sample_headrules,
+                                            sample_export * 2]):
+                with open(fname, 'w') as f:
+                    f.write(text)
+            for jobs in ['1', '2']:
+                deps.deps_main(['-j', jobs] + fnames)
+                with open(fnames[2]) as f:
+                    lines = f.read().split('\n')
+                rows = [l.split('\t') for l in lines if l]
+                self.assertEqual(len(rows), 8)
+                for row in rows:
+                    self.assertEqual(len(row), 10, row)
+                    self.assertTrue(all(row), row)
+                # und is attached to the first conjunct without a label
+                self.assertEqual(rows[1][6:8], ['1', '_'])
+                self.assertEqual(rows[3][7], 'S')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+class TestDepTree(unittest.TestCase):
+    def test_deptree(self):
+        from lingtree.deptree import deptree_from_syn_parent
+        t = Tree()
+        t.terminals = make_nodes([('PRELS', '--'), ('NN', '--'),
+                                  ('VVFIN', '--'), ('VVPP', '--')])
+        for i, n in enumerate(t.terminals):
+            n.start = i
+        # 1 <- 4, 2 <- 3, 4 <- 3, 3 is the root: 1-4 crosses 0-3
+        for n, head, label in zip(t.terminals, [4, 3, 0, 3],
+                                  ['oa', 'sb', 'S', 'oc']):
+            n.syn_parent = t.terminals[head - 1] if head else None
+            n.syn_label = label
+        dt = deptree_from_syn_parent(t)
+        self.assertEqual(list(dt.heads), [-1, 4, 3, 0, 3])
+        self.assertFalse(dt.is_projective())
+        self.assertEqual(dt.gap_degrees(), [0, 0, 0, 0, 1])
+        self.assertEqual(dt.gap_degree(), 1)
+        self.assertEqual(dt.path_length(1, 2), 3)
+        self.assertEqual(dt.lca(1, 4), 4)
+        self.assertEqual(dt.head_distance(1), 3)
+        for n in t.terminals:
+            n.syn_parent = None
+        dt.set_syn_parents(t)
+        self.assertEqual(t.terminals[0].syn_parent, t.terminals[3])
+        self.assertEqual(t.terminals[3].syn_label, 'oc')
+        dt.heads[4] = 1
+        self.assertRaises(ValueError, dt.compute_tables)
@@ -0,0 +1,22 @@
+import unittest
+from lingtree.eval.edge_eval import paired_trees, PairReport
+from lingtree.tests.test_conll import make_tree
+
+class TestPaired(unittest.TestCase):
+    def test_paired(self):
+        gold = [make_tree(ws) for ws in [['a', 'b'], ['c'], ['d']]]
+        pred = [make_tree(ws) for ws in [['a', 'b'], ['c', 'x']]]
+        report = PairReport(max_messages=0)
+        pairs = list(paired_trees(iter(gold), iter(pred), report))
+        self.assertEqual(pairs, [(gold[0], pred[0])])
+        self.assertEqual((report.n_length, report.n_gold_only,
+                          report.n_pred_only), (1, 1, 0))
+        self.assertEqual(report.n_mismatches(), 2)
+
+    def test_pred_only(self):
+        gold = [make_tree(['a'])]
+        pred = [make_tree(ws) for ws in [['a'], ['b'], ['c']]]
+        report = PairReport(max_messages=0)
+        pairs = list(paired_trees(iter(gold), iter(pred), report))
+        self.assertEqual(pairs, [(gold[0], pred[0])])
+        self.assertEqual((report.n_pairs, report.n_pred_only), (1, 2))
@@ -1,8 +1,12 @@
 import unittest
+import copy
+import pickle
 from io import StringIO
 from mock import mock_open, patch
 from lingtree.penn import line2parse, node2tree, number_nodes
-from lingtree.export import write_export_file, read_trees, copy_tree
+from lingtree.tree import Tree, NontermNode, TerminalNode
+from lingtree.export import write_export_file, read_trees, copy_tree, \
+    write_sentence_tabs
 
 test_s1 = u"(VROOT (S (NE-SB Klaus) (VVFIN-HD mag) (NN-OA Pizza)) ($. .))"
 t1 = node2tree(line2parse(test_s1))
@@ -12,6 +16,17 @@ t1.node_table = node_table
 t1.sent_no = 1
 print(t1.terminals[-1].parent)
 
+sample_export = u"""#BOS 1 0 0 0
+Pizza\t\t\tNN\tacc.sg.fem\tOA\t501\t%% LM=Pizza
+und\t\t\tKON\t--\t\tCD\t502
+Bier\t\t\tNN\tacc.sg.neut\tCJ\t502\tSB\t500
+.\t\t\t$.\t--\t\t--\t0
+#500\t\t\tS\t--\t\t--\t0
+#501\t\t\tNP\t--\t\tCJ\t502
+#502\t\t\tCNP\t--\t\tOA\t500\trefint\t501
+#EOS 1
+"""
+
 class TestExport(unittest.TestCase):
     def test_writing(self):
         f = StringIO()
@@ -36,3 +51,64 @@ class TestExport(unittest.TestCase):
         write_export_file(f, [t2, t2])
         text2 = f.getvalue()
         self.assertEqual(text1, text2)
+
+    def test_roundtrip(self):
+        m = mock_open(read_data=sample_export)
+        with m("mock-2.export", "r") as f:
+            trees = list(read_trees(f))
+        self.assertEqual(trees[0].terminals[2].secedge[0][0], 'SB')
+        f = StringIO()
+        write_export_file(f, trees)
+        self.assertEqual(f.getvalue(), sample_export)
+
+    def test_format4(self):
+        f = StringIO()
+        write_sentence_tabs(t1, f, fmt=4)
+        lines = f.getvalue().split('\n')
+        self.assertEqual(lines[0], 'Klaus\t\t\t--\t\t\tNE\t--\t\tSB\t500')
+        self.assertEqual(lines[-2], '#500\t\t\t--\t\t\tS\t--\t\t--\t0')
+
+    def test_pickle(self):
+        m = mock_open(read_data=sample_export)
+        with m("mock-4.export", "r") as f:
+            trees = list(read_trees(f))
+        t = pickle.loads(pickle.dumps(trees[0], pickle.HIGHEST_PROTOCOL))
+        self.assertTrue(t.terminals[2].secedge[0][1] is t.node_table['500'])
+        f = StringIO()
+        write_export_file(f, [t])
+        self.assertEqual(f.getvalue(), sample_export)
+        n = copy.copy(t.node_table['500'])
+        self.assertEqual(len(n.children), len(t.node_table['500'].children))
+        t2 = copy.copy(t)
+        self.assertEqual(t2.terminals[0].parent.id, '501')
+        self.assertFalse(t2.terminals[0] is t.terminals[0])
+        # deep trees do not hit the recursion limit
+        t = Tree()
+        node = NontermNode('X')
+        t.roots.append(node)
+        for i in range(5000):
+            child = NontermNode('X')
+            node.append(child)
+            node = child
+        node.append(TerminalNode('N', 'w'))
+        t.terminals.append(node.children[0])
+        t2 = pickle.loads(pickle.dumps(t, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(t2.terminals[0].parent.cat, 'X')
+        self.assertTrue(t2.roots[0].parent is None)
+
+    def test_pickle_compat(self):
+        # pickles with the (node_table, roots, terminals, __dict__) state
+        # of older versions can still be read
+        def old_getstate(self):
+            return (self.node_table, self.roots, self.terminals,
+                    self.__dict__)
+        m = mock_open(read_data=sample_export)
+        with m("mock-5.export", "r") as f:
+            t = list(read_trees(f))[0]
+        with patch.object(Tree, '__getstate__', old_getstate):
+            data = pickle.dumps(t, pickle.HIGHEST_PROTOCOL)
+        t = pickle.loads(data)
+        self.assertTrue(t.terminals[2].secedge[0][1] is t.node_table['500'])
+        f = StringIO()
+        write_export_file(f, [t])
+        self.assertEqual(f.getvalue(), sample_export)
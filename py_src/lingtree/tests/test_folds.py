@@ -0,0 +1,52 @@
+import unittest
+from lingtree.folds import RawSentence, parse_filterspec, parse_foldspec, \
+    parse_shardspec
+
+def raw_sent(sent_no, doc_no, text):
+    return RawSentence(sent_no, doc_no, text.split(), None, lambda x: x)
+
+class TestFilterSpec(unittest.TestCase):
+    def test_filterspec(self):
+        f = parse_filterspec('len(,40);doc(3,4);match(/^Der /)')
+        self.assertEqual(len(f.preds), 3)
+        self.assertTrue(f.uses_docs)
+        self.assertTrue(f.accepts(raw_sent('1', '3', 'Der Hund bellt .')))
+        self.assertTrue(f.accepts(raw_sent('2', '4', 'Der Hund .')))
+        self.assertFalse(f.accepts(raw_sent('3', '5', 'Der Hund bellt .')))
+        self.assertFalse(f.accepts(raw_sent('4', '3', 'Ein Hund bellt .')))
+        self.assertFalse(f.accepts(raw_sent('5', '3', 'Der ' * 41)))
+        f = parse_filterspec('len(2,); sent(2,3)')
+        self.assertFalse(f.uses_docs)
+        self.assertEqual([f.accepts(raw_sent(str(i), None, 'a b'))
+                          for i in range(1, 5)],
+                         [False, True, True, False])
+        self.assertFalse(f.accepts(raw_sent('2', None, 'a')))
+        self.assertEqual(len(parse_filterspec('').preds), 0)
+
+    def test_malformed(self):
+        for spec in ['len(4)', 'len(a,4)', 'doc()', 'doc(1,)', 'sent(,4)',
+                     'match(Der)', 'foo(1)', 'len(,40);bogus',
+                     'len(,40),doc(1)']:
+            self.assertRaises(ValueError, parse_filterspec, spec)
+
+    def test_no_doc_no(self):
+        f = parse_filterspec('doc(1)')
+        self.assertTrue(f.accepts(raw_sent('1', '1', 'a')))
+        self.assertRaises(ValueError, f.accepts, raw_sent('1', None, 'a'))
+
+class TestFoldSpec(unittest.TestCase):
+    def test_slices(self):
+        def items():
+            for i in range(10):
+                yield i
+        result = parse_foldspec('slices(4)only(1)').apply_filter(
+            items(), lambda: 10)
+        self.assertEqual(list(result), [3, 4])
+        # without a count, the items are put into a list
+        result = parse_foldspec('slices(4)only(1)').apply_filter(items())
+        self.assertEqual(list(result), [3, 4])
+
+class TestShardSpec(unittest.TestCase):
+    def test_shardspec(self):
+        self.assertEqual(parse_shardspec('2/8'), (1, 8))
+        self.assertRaises(ValueError, parse_shardspec, '9/8')
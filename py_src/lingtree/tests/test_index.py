@@ -0,0 +1,22 @@
+import unittest
+import os
+import tempfile
+from lingtree.index import shard_range, range_lines
+from lingtree.tests.test_export import sample_export
+
+class TestShards(unittest.TestCase):
+    def test_shard_ranges(self):
+        fd, fname = tempfile.mkstemp(suffix='.export')
+        os.close(fd)
+        try:
+            with open(fname, 'w') as f:
+                for i in range(1, 6):
+                    f.write(sample_export.replace(' 1', ' %d' % (i,)))
+            for n_shards in range(1, 8):
+                lines = []
+                for shard in range(n_shards):
+                    start, end = shard_range(fname, shard, n_shards)
+                    lines += range_lines(fname, 'export', start, end)
+                self.assertEqual(''.join(lines), open(fname).read())
+        finally:
+            os.unlink(fname)
@@ -0,0 +1,20 @@
+import unittest
+from lingtree.parallel import chunked, ordered_map
+
+class TestOrderedMap(unittest.TestCase):
+    def test_chunked(self):
+        self.assertEqual(list(chunked(range(7), 3)),
+                         [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(chunked([], 3)), [])
+
+    def test_serial(self):
+        self.assertEqual(list(ordered_map(abs, [-3, 1, -2])), [3, 1, 2])
+        self.assertEqual(list(ordered_map(abs, [-3, 1, -2], 1)), [3, 1, 2])
+
+    def test_parallel(self):
+        items = list(range(-50, 50))
+        expected = [abs(x) for x in items]
+        for chunksize, max_pending in [(1, None), (7, 1), (64, None)]:
+            result = ordered_map(abs, iter(items), 3, chunksize, max_pending)
+            self.assertEqual(list(result), expected)
+        self.assertEqual(list(ordered_map(abs, [], 2)), [])
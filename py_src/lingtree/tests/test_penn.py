@@ -1,6 +1,7 @@
 import unittest
 from mock import mock_open, patch
-from lingtree.penn import line2parse, node2tree
+from io import StringIO
+from lingtree.penn import line2parse, node2tree, BracketWriter
 from lingtree import read_mrg_trees
 
 sample_mrg = u"""(ROOT (S (NP (DT the) (NN cat)) (VBD sat) (PP (IN on) (NP (DT the) (NN mat)))) (. .))
@@ -34,3 +35,28 @@ class TestPenn(unittest.TestCase):
         self.assertEqual(term1.cat, 'NE')
         self.assertEqual(term1.edge_label, 'SB')
         self.assertEqual(t1.roots[0].edge_label, None)
+
+    def test_writing(self):
+        t1 = node2tree(line2parse(test_s1))
+        f = StringIO()
+        BracketWriter(f).write_trees([t1])
+        self.assertEqual(f.getvalue(),
+                         "( (S (NE Klaus) (VVFIN mag) (NN Pizza)) ($. .))\n")
+        f = StringIO()
+        BracketWriter(f, 'VROOT', edge_labels=True).write_trees([t1])
+        self.assertEqual(f.getvalue(), test_s1 + "\n")
+
+    def test_escapes(self):
+        from lingtree.spmrl import read_spmrl
+        from lingtree.pipeline import output_format
+        t1 = node2tree(line2parse(
+            u"(VROOT (S (NE-SB Klaus) (VVFIN-HD mag)) ($( -LRB-))"))
+        t1.terminals[-1].word = '('
+        f = StringIO()
+        BracketWriter(f, 'VROOT', edge_labels=True).write_trees([t1])
+        self.assertEqual(f.getvalue(), u"(VROOT (S (NE-SB Klaus) "
+                         u"(VVFIN-HD mag)) ($( -LRB-))\n")
+        t2 = list(read_spmrl(StringIO(f.getvalue())))[0]
+        self.assertEqual([(n.cat, n.edge_label) for n in t2.terminals],
+                         [('NE', 'SB'), ('VVFIN', 'HD'), ('$(', None)])
+        self.assertEqual(output_format('ptb'), 'spmrl')
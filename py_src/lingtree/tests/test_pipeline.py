@@ -0,0 +1,121 @@
+import unittest
+import os
+import shutil
+import tempfile
+from mock import mock_open
+from lingtree.export import read_trees
+from lingtree.tests.test_export import sample_export
+
+class TestFormatter(unittest.TestCase):
+    def test_formatter(self):
+        from lingtree.pipeline import TreeFormatter
+        m = mock_open(read_data=sample_export)
+        with m("mock-5.export", "r") as f:
+            trees = list(read_trees(f))
+        self.assertEqual(TreeFormatter('export')(trees[0]), sample_export)
+        self.assertTrue(TreeFormatter('json')(trees[0]).startswith('{"release"'))
+
+class TestBulk(unittest.TestCase):
+    def test_bulk_names(self):
+        from lingtree.pipeline import bulk_output_name
+        self.assertEqual(bulk_output_name('sub/a', 'out', 'export'),
+                         os.path.join('out', 'sub/a.export'))
+        self.assertEqual(bulk_output_name('sub/a', 'x/{stem}.{ext}', 'ptb'),
+                         'x/a.ptb')
+        self.assertEqual(bulk_output_name('sub/a', 'x/{name}.{ext}', 'json'),
+                         'x/sub/a.json')
+
+    def test_convert_many(self):
+        from lingtree import oparse_convert
+        from lingtree.pipeline import convert_many, expand_inputs
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            in_dir = os.path.join(tmp_dir, 'in')
+            os.makedirs(os.path.join(in_dir, 'sub'))
+            for name in ['a', 'sub/b']:
+                with open(os.path.join(in_dir, name + '.export'), 'w') as f:
+                    f.write(sample_export)
+            inputs = expand_inputs([in_dir])
+            self.assertEqual([name for fname, name in inputs],
+                             ['a', os.path.join('sub', 'b')])
+            target = os.path.join(tmp_dir, 'out', '{name}.{ext}')
+            opts = oparse_convert.parse_args(['--outfmt', 'export'])[0]
+            out_names = [os.path.join(tmp_dir, 'out', name + '.export')
+                         for name in ['a', 'sub/b']]
+            for jobs in [1, 2]:
+                stats = convert_many(inputs, target, opts, num_workers=jobs,
+                                     force=True)
+                self.assertEqual((stats.n_files, stats.n_skipped), (2, 0))
+                self.assertEqual(stats.n_sents, 2)
+                self.assertEqual(stats.failed, [])
+                for fname in out_names:
+                    with open(fname) as f:
+                        # the format header, then the sentence
+                        self.assertTrue(f.read().endswith(
+                            '\n' + sample_export))
+                # only the outputs are left, no temporary files
+                self.assertEqual(sorted(os.listdir(os.path.join(
+                    tmp_dir, 'out'))), ['a.export', 'sub'])
+                self.assertEqual(os.listdir(os.path.join(
+                    tmp_dir, 'out', 'sub')), ['b.export'])
+            # outputs newer than their inputs are skipped
+            stats = convert_many(inputs, target, opts, num_workers=2)
+            self.assertEqual((stats.n_files, stats.n_skipped), (0, 2))
+            # an older output is converted again
+            os.utime(out_names[0], (0, 0))
+            stats = convert_many(inputs, target, opts, num_workers=2)
+            self.assertEqual((stats.n_files, stats.n_skipped), (1, 1))
+            self.assertNotEqual(os.path.getmtime(out_names[0]), 0)
+            # a failing input leaves no output or temporary file behind
+            with open(os.path.join(in_dir, 'c.export'), 'w') as f:
+                f.write('#BOS 1\nno-eos\n')
+            stats = convert_many(expand_inputs([in_dir]), target, opts,
+                                 num_workers=2, force=True)
+            self.assertEqual((stats.n_files, len(stats.failed)), (2, 1))
+            self.assertEqual(sorted(os.listdir(os.path.join(
+                tmp_dir, 'out'))), ['a.export', 'sub'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+class TestJoin(unittest.TestCase):
+    def test_join(self):
+        from lingtree import oparse_join
+        from lingtree.pipeline import join_files
+        from lingtree.index import load_index
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fnames = []
+            for i in range(2):
+                fname = os.path.join(tmp_dir, 'in%d.export' % (i,))
+                with open(fname, 'w') as f:
+                    f.write(sample_export)
+                fnames.append(fname)
+            fname_out = os.path.join(tmp_dir, 'out.export')
+            opts = oparse_join.parse_args([])[0]
+            stats = join_files(fnames, fname_out, opts)
+            self.assertEqual(stats.n_sents, 2)
+            idx = load_index(fname_out + '.idx')
+            self.assertEqual(idx.sent_nos, ['1', '2'])
+            with open(fname_out, 'rb') as f:
+                self.assertTrue(idx.text(f, 1).startswith('#BOS 2 '))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+class TestSplit(unittest.TestCase):
+    def test_split_index(self):
+        from lingtree import oparse_split, read_trees
+        from lingtree.pipeline import split_folds
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmp_dir, 'in.export')
+            with open(fname, 'w') as f:
+                for i in range(1, 6):
+                    f.write(sample_export.replace(' 1', ' %d' % (i,)))
+            opts = oparse_split.parse_args([])[0]
+            template = os.path.join(tmp_dir, '{split}{fold}')
+            counts = split_folds(fname, 2, template, opts, index_only=True)
+            self.assertEqual(counts[template.format(split='testfinal', fold=1)], 2)
+            trees = list(read_trees(os.path.join(tmp_dir, 'trainfinal1.idx')))
+            self.assertEqual([t.sent_no for t in trees], ['1', '3', '5'])
+        finally:
+            shutil.rmtree(tmp_dir)
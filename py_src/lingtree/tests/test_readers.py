@@ -0,0 +1,201 @@
+import unittest
+import os
+import re
+import shutil
+import tempfile
+from lingtree import read_trees, write_trees_meta, default_oparse
+
+sample_mrg = u"""( (S (NP-SBJ (-NONE- *)) (VP (VBD sat) (-LRB- -LRB-) (NN mat) (-RRB- -RRB-)) (. .)) )
+(NP (JJ weird )(NN   spacing) )
+"""
+
+def make_export(n_sents):
+    '''sentences of 2 to 6 tokens, four per document'''
+    lines = []
+    for i in range(1, n_sents + 1):
+        lines.append('#BOS %d 0 0 %d' % (i, (i - 1) // 4 + 1))
+        words = ['Der' if i % 3 == 0 else 'Ein'] + [
+            'w%d_%d' % (i, j) for j in range(i % 5)] + ['.']
+        for j, w in enumerate(words[:-1]):
+            tag = 'ART' if j == 0 else ('NN' if j % 2 else 'ADJA')
+            lines.append('%s\t%s\tnom.sg\tNK\t500' % (w, tag))
+        lines.append('.\t$.\t--\t--\t0')
+        lines.append('#500\tNP\t--\t--\t0')
+        lines.append('#EOS %d' % (i,))
+    return '\n'.join(lines) + '\n'
+
+def make_opts(args=()):
+    return default_oparse.parse_args(list(args))[0]
+
+def token_fields(trees):
+    return [[(n.word, n.cat, n.morph) for n in t.terminals] for t in trees]
+
+def all_trees(fname):
+    return list(read_trees(fname, make_opts()))
+
+class TestReaders(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.fnames = {}
+        fname = cls.fname('trees.export')
+        with open(fname, 'w') as f:
+            f.write(make_export(20))
+        cls.fnames['export'] = fname
+        trees = list(read_trees(fname))
+        for fmt, ext in [('export4', 'export4'), ('json', 'json'),
+                         ('spmrl', 'ptb'), ('tigerxml', 'xml')]:
+            cls.fnames[fmt] = cls.fname('trees.' + ext)
+            write_trees_meta(cls.fnames[fmt], trees, fmt=fmt)
+        cls.fnames['mrg'] = cls.fname('trees.mrg')
+        with open(cls.fnames['mrg'], 'w') as f:
+            f.write(sample_mrg)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    @classmethod
+    def fname(cls, name):
+        return os.path.join(cls.tmpdir, name)
+
+    def test_projection(self):
+        for fmt, fname in sorted(self.fnames.items()):
+            full = list(read_trees(fname, make_opts()))
+            proj = list(read_trees(fname, make_opts(), projection='terminals'))
+            self.assertEqual(token_fields(proj), token_fields(full), fmt)
+            self.assertTrue(len(full) > 1, fmt)
+        trees = list(read_trees(self.fnames['mrg'], make_opts(),
+                                projection='terminals'))
+        self.assertEqual([n.cat for n in trees[0].terminals],
+                         ['-NONE-', 'VBD', '-LRB-', 'NN', '-RRB-', '.'])
+        self.assertEqual(trees[0].terminals[0].edge_label, None)
+
+    def test_filter_fold(self):
+        from lingtree.folds import parse_foldspec
+        rgx = re.compile('^(Der|Ein) w')
+        for fmt in ['export', 'json', 'spmrl']:
+            fname = self.fnames[fmt]
+            # the filter, applied to the parsed trees
+            selected = [t for t in read_trees(fname, make_opts())
+                        if len(t.terminals) <= 4 and
+                        rgx.search(' '.join([n.word for n in t.terminals]))]
+            self.assertTrue(len(selected) > 2, fmt)
+            for foldspec in ['2-5', 'slices(2)only(1)', 'traindev1/3']:
+                expected = list(parse_foldspec(foldspec).apply_filter(
+                    list(selected)))
+                opts = make_opts(['--filter',
+                                  'len(,4);match(/^(Der|Ein) w/)',
+                                  '--fold', foldspec])
+                trees = list(read_trees(fname, opts))
+                self.assertEqual(token_fields(trees), token_fields(expected),
+                                 (fmt, foldspec))
+
+    def test_fold_count(self):
+        from lingtree import count_selected
+        from lingtree.folds import parse_foldspec
+        from lingtree.index import build_index, count_sentences, index_name
+        fname = self.fname('indexed.export')
+        shutil.copy(self.fnames['export'], fname)
+        build_index(fname, 'export3').save()
+        self.assertEqual(count_sentences(fname, 'export3'), 20)
+        self.assertEqual(count_sentences(index_name(fname), 'index'), 20)
+        fnames = dict(self.fnames)
+        del fnames['mrg']
+        fnames['index'] = index_name(fname)
+        for fmt, fname in sorted(fnames.items()):
+            all_trees = list(read_trees(fname, make_opts()))
+            self.assertEqual(count_selected(fname, make_opts()), 20, fmt)
+            short = [t for t in all_trees if len(t.terminals) <= 3]
+            self.assertEqual(count_selected(
+                fname, make_opts(['--filter', 'len(,3)'])), len(short), fmt)
+            for n_folds in [2, 3, 7]:
+                for fold in range(n_folds):
+                    foldspec = 'slices(%d)only(%d)' % (n_folds, fold)
+                    # selecting all trees in a list, as without a count
+                    expected = parse_foldspec(foldspec).apply_filter(
+                        iter(all_trees))
+                    trees = read_trees(fname, make_opts(['--fold', foldspec]))
+                    self.assertEqual(token_fields(trees),
+                                     token_fields(expected),
+                                     (fmt, foldspec))
+
+    def test_shards(self):
+        from lingtree import select_trees
+        from lingtree.index import count_lines_before
+        self.assertEqual(count_lines_before(self.fnames['spmrl'], 0), 0)
+        self.assertEqual(count_lines_before(self.fnames['spmrl'], 1), 1)
+
+        def sentences(fname, args):
+            sents = select_trees(fname, make_opts(args), raw=True)[1]
+            return [(str(sent.sent_no), sent.words()) for sent in sents]
+        for fmt in ['export', 'export4', 'json', 'spmrl', 'tigerxml']:
+            fname = self.fnames[fmt]
+            full = sentences(fname, [])
+            self.assertEqual(len(full), 20)
+            for shard_by in ['bytes', 'hash']:
+                for n_shards in [2, 3, 7]:
+                    result = []
+                    for shard in range(1, n_shards + 1):
+                        result += sentences(fname, [
+                            '--shard', '%d/%d' % (shard, n_shards),
+                            '--shard-by', shard_by])
+                    # TigerXML is always sharded by hash
+                    if shard_by == 'hash' or fmt == 'tigerxml':
+                        result.sort(key=full.index)
+                    self.assertEqual(result, full, (fmt, shard_by, n_shards))
+                    trees = []
+                    for shard in range(1, n_shards + 1):
+                        trees += read_trees(fname, make_opts([
+                            '--shard', '%d/%d' % (shard, n_shards),
+                            '--shard-by', shard_by]))
+                    self.assertEqual(sorted(token_fields(trees)),
+                                     sorted(token_fields(all_trees(fname))))
+
+    def test_filter_docs(self):
+        opts = make_opts(['--filter', 'doc(2,4)'])
+        trees = list(read_trees(self.fnames['export'], opts))
+        self.assertEqual([t.sent_no for t in trees],
+                         ['5', '6', '7', '8', '13', '14', '15', '16'])
+        for fmt in ['json', 'spmrl', 'tigerxml', 'mrg']:
+            self.assertRaises(ValueError, read_trees, self.fnames[fmt], opts)
+
+    def test_totext_attrs(self):
+        from lingtree import totext_main
+        from lingtree.tests.test_export import sample_export
+        fname = self.fname('sample.export')
+        with open(fname, 'w') as f:
+            f.write(sample_export)
+        # comment is not a Token attribute, so the full trees are read
+        totext_main(['--outfmt', 'cqp', '-P', 'comment', fname,
+                     self.fname('out.cqp')])
+        with open(self.fname('out.cqp')) as f:
+            lines = f.read().split('\n')
+        self.assertEqual(lines[1], 'Pizza\tLM=Pizza')
+
+    def test_emitters(self):
+        from lingtree import totext_main
+        from lingtree.tests.test_export import sample_export
+        fname = self.fname('sample.export')
+        with open(fname, 'w') as f:
+            f.write(sample_export)
+        expected = {
+            'txt': 'Pizza\tNN\nund\tKON\nBier\tNN\n.\t$.\n\n',
+            'line': 'Pizza_NN und_KON Bier_NN ._$.\n',
+            'cqp': '<s id="1">\nPizza\tNN\nund\tKON\nBier\tNN\n.\t$.\n'
+                   '</s>\n',
+            'chk': '<s 1> Pizza_NN und_KON Bier_NN ._$. </s>\n',
+            'conll': '1\tPizza\tNN\n2\tund\tKON\n3\tBier\tNN\n4\t.\t$.\n\n',
+            'conllu': '# sent_id = 1\n'
+                      '1\tPizza\t_\t_\tNN\tacc.sg.fem\t0\t_\t_\tcat=NN\n'
+                      '2\tund\t_\t_\tKON\t--\t0\t_\t_\tcat=KON\n'
+                      '3\tBier\t_\t_\tNN\tacc.sg.neut\t0\t_\t_\tcat=NN\n'
+                      '4\t.\t_\t_\t$.\t--\t0\t_\t_\tcat=$.\n\n',
+            'vrt': '<text id="0">\n<s id="1" len="4">\nPizza\tNN\nund\tKON\n'
+                   'Bier\tNN\n.\t$.\n</s>\n</text>\n',
+        }
+        for fmt in sorted(expected):
+            out_fname = self.fname('out.' + fmt)
+            totext_main(['--outfmt', fmt, '-P', 'cat', fname, out_fname])
+            with open(out_fname) as f:
+                self.assertEqual(f.read(), expected[fmt], fmt)
@@ -0,0 +1,23 @@
+import unittest
+from io import StringIO
+from mock import mock_open
+from lingtree.export import write_export_file, read_trees
+from lingtree.tests.test_export import sample_export
+
+class TestShared(unittest.TestCase):
+    def test_corpus(self):
+        try:
+            from lingtree.shared import SharedCorpus
+        except ImportError:
+            self.skipTest('needs multiprocessing.shared_memory')
+        m = mock_open(read_data=sample_export)
+        with m("mock-3.export", "r") as f:
+            trees = list(read_trees(f))
+        with SharedCorpus.create(trees * 2) as corpus:
+            self.assertEqual(len(corpus), 2)
+            self.assertEqual(corpus.words(1), ['Pizza', 'und', 'Bier', '.'])
+            t = corpus[1]
+            self.assertTrue(t.terminals[2].secedge[0][1] is t.node_table['500'])
+            f = StringIO()
+            write_export_file(f, [t])
+            self.assertEqual(f.getvalue(), sample_export)
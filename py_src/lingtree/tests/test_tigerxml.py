@@ -0,0 +1,102 @@
+import unittest
+import os
+import pickle
+import shutil
+import tempfile
+from io import StringIO
+from lingtree.export import read_trees
+from lingtree.tigerxml import etree, encode_tree, read_kbest_lists, \
+    get_sent_no, read_raw_sentences, write_tiger_file
+from lingtree.tests.test_export import sample_export
+
+def sample_tree(sent_no, first_word):
+    t = list(read_trees(StringIO(sample_export)))[0]
+    t.sent_no = sent_no
+    t.terminals[0].word = first_word
+    return t
+
+def make_kbest_xml(n_sents, k):
+    '''sentences with k kbest trees each, told apart by their first word'''
+    corpus = etree.Element('corpus')
+    for i in range(1, n_sents + 1):
+        sent = etree.SubElement(corpus, 'sentence')
+        gold = etree.SubElement(sent, 'gold-tree')
+        gold.append(encode_tree(sample_tree(i, 'gold%d' % (i,))))
+        for j in range(k):
+            kbest = etree.SubElement(sent, 'kbest-tree')
+            kbest.attrib['model-score'] = str(-1.5 * j)
+            kbest.attrib['score'] = str(1.0 / (j + 1))
+            kbest.append(encode_tree(sample_tree(i, 'k%d_%d' % (i, j))))
+    return etree.tostring(corpus)
+
+def kbest_words(result):
+    return [(t_gold.terminals[0].word,
+             [(t.terminals[0].word, t.score, t.eval_score) for t in kbest])
+            for t_gold, kbest in result]
+
+class TestKbest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.fname = os.path.join(cls.tmpdir, 'kbest.xml')
+        with open(cls.fname, 'wb') as f:
+            f.write(make_kbest_xml(5, 4))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_kbest(self):
+        result = kbest_words(read_kbest_lists(self.fname))
+        self.assertEqual(len(result), 5)
+        self.assertEqual(result[2][0], 'gold3')
+        self.assertEqual(result[2][1],
+                         [('k3_%d' % (j,), -1.5 * j, 1.0 / (j + 1))
+                          for j in range(4)])
+
+    def test_max_k(self):
+        full = kbest_words(read_kbest_lists(self.fname))
+        top2 = kbest_words(read_kbest_lists(self.fname, max_k=2))
+        self.assertEqual(top2, [(gold, kbest[:2]) for gold, kbest in full])
+
+    def test_scores_only(self):
+        result = list(read_kbest_lists(self.fname, max_k=3, scores_only=True))
+        self.assertEqual([sent_no for sent_no, scores in result],
+                         [1, 2, 3, 4, 5])
+        self.assertEqual(result[0][1],
+                         [(-1.5 * j, 1.0 / (j + 1)) for j in range(3)])
+
+    def test_parallel(self):
+        serial = kbest_words(read_kbest_lists(self.fname, max_k=3))
+        parallel = kbest_words(read_kbest_lists(self.fname, max_k=3,
+                                                num_workers=2, chunksize=2))
+        self.assertEqual(parallel, serial)
+
+    def test_sent_no(self):
+        self.assertEqual(get_sent_no(etree.Element('s', id='s12')), 12)
+        self.assertEqual(get_sent_no(etree.Element('s', id='7')), 7)
+        # ids that are not numbers are passed through
+        self.assertEqual(get_sent_no(etree.Element('s', id='a1')), 'a1')
+        self.assertEqual(get_sent_no(etree.Element('s')), None)
+
+class TestRawSentences(unittest.TestCase):
+    def test_pickle(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmpdir, 'trees.xml')
+            with open(fname, 'w') as f:
+                write_tiger_file(f, [sample_tree(i, 'w%d' % (i,))
+                                     for i in range(1, 4)])
+            sents = list(read_raw_sentences(fname))
+            self.assertEqual([sent.sent_no for sent in sents], [1, 2, 3])
+            for sent in sents:
+                # no parsed elements, which lxml cannot pickle
+                self.assertTrue(isinstance(sent.data[0], bytes))
+                sent2 = pickle.loads(pickle.dumps(sent))
+                self.assertEqual(sent2.words(), sent.words())
+                t = sent2.parse()
+                self.assertEqual([n.word for n in t.terminals],
+                                 sent.words())
+            self.assertEqual(sents[1].words(), ['w2', 'und', 'Bier', '.'])
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,49 @@
+import unittest
+from mock import mock_open
+from lingtree.export import read_trees
+from lingtree.tests.test_export import sample_export
+
+# relative clause (502) attached to its antecedent (501) by a secedge
+relclause_export = u"""#BOS 2 0 0 0
+den\t\t\tART\tacc.sg.masc\t-\t501
+Mann\t\t\tNN\tacc.sg.masc\tHD\t501
+sah\t\t\tVVFIN\t3sit\tHD\t500
+ich\t\t\tPPER\tnom.sg.*1\tON\t500
+,\t\t\t$,\t--\t--\t0
+der\t\t\tPRELS\tnom.sg.masc\tON\t502
+schlief\t\t\tVVFIN\t3sit\tHD\t502
+#500\t\t\tSIMPX\t--\t--\t0
+#501\t\t\tNX\t--\tOA\t500\trefint\t502
+#502\t\t\tR-SIMPX\t--\tMOD\t500
+#EOS 2
+"""
+
+class TestXforms(unittest.TestCase):
+    def test_secedge2nonprojective(self):
+        from lingtree import transformed_trees
+        from lingtree.xforms import XformTimer, get_xform
+        m = mock_open(read_data=sample_export)
+        with m("mock-6.export", "r") as f:
+            trees = list(read_trees(f))
+        m = mock_open(read_data=relclause_export)
+        with m("mock-7.export", "r") as f:
+            trees += list(read_trees(f))
+        timer = XformTimer(['secedge2nonprojective'])
+        result = list(transformed_trees(trees, ['secedge2nonprojective'],
+                                        timer=timer))
+        self.assertEqual(len(result), 2)
+        self.assertEqual(timer.n_trees, 2)
+        t = result[1]
+        np, rel = t.node_table['501'], t.node_table['502']
+        # the antecedent and the relative clause get a new NX parent
+        new_np = np.parent
+        self.assertEqual(new_np.cat, 'NX')
+        self.assertEqual(new_np.edge_label, 'OA')
+        self.assertEqual(new_np.children, [np, rel])
+        self.assertTrue(rel.parent is new_np)
+        self.assertEqual((np.edge_label, rel.edge_label), ('HD', '-'))
+        self.assertEqual(np.secedge, None)
+        self.assertEqual((new_np.start, new_np.end), (0, 7))
+        self.assertFalse(rel in t.node_table['500'].children)
+        self.assertEqual(t.node_table['500'].children[0], new_np)
+        self.assertRaises(KeyError, get_xform, 'no-such-xform')
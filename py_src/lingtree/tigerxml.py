@@ -23,12 +23,11 @@ attributes
 from __future__ import print_function
 from builtins import str, bytes
 import sys
-from .tree import Tree, TerminalNode, NontermNode
+from .tree import Tree, TerminalNode, NontermNode, Sentence, token_factory
 try:
     from lxml import etree
-    def write_node(f_out, s_node, encoding):
-        f_out.write(etree.tostring(s_node, pretty_print=True,
-                                   encoding=encoding))
+    def node_text(s_node):
+        return etree.tostring(s_node, pretty_print=True, encoding='unicode')
 except ImportError:
     import xml.etree.cElementTree as etree
     def add_some_space(node, indent=''):
@@ -39,15 +38,12 @@ except ImportError:
                 add_some_space(n, indent+'  ')
             chlds[-1].tail = '\n'+indent
         node.tail = '\n'+indent
-    def write_node(f_out, s_node, encoding):
+    def node_text(s_node):
         # add some basic formatting
         add_some_space(s_node)
-        s_result = etree.tostring(s_node, encoding=encoding)
-        # strip xml header.
-        if '<?' in s_result:
-            idx = s_result.index('?>')
-            s_result = s_result[idx+2:]
-        f_out.write(s_result)
+        return etree.tostring(s_node, encoding='unicode')
+def write_node(f_out, s_node, encoding=None):
+    f_out.write(node_text(s_node))
 from xml.sax.saxutils import quoteattr, escape
 
 def encoded_attrib(n, att, default_val):
@@ -76,19 +72,52 @@ def get_terminals(graph, term_ref):
 
 
 
-#pylint:disable=C0103
-def tiger_sent(node):
-    'decodes the TigerXML sentence from the given XML node'
-    t = Tree()
-    term_ref = {}
-    graph = node.find('graph')
+def get_sent_no(node):
+    '''
+    extracts the sentence number from the id of an <s> node. Ids that
+    are not numbers (with or without an ``s`` prefix) are returned as
+    they are, and nodes without an id give None.
+    '''
     try:
         node_id = node.attrib['id']
         if node_id[0] == 's':
             node_id = node_id[1:]
-        t.sent_no = int(node_id)
-    except ValueError:
-        t.sent_no = node.attrib.get('id', None)
+        return int(node_id)
+    except (KeyError, ValueError):
+        return node.attrib.get('id', None)
+
+def tiger_terminals(node, projection='terminals'):
+    '''
+    decodes only the terminals of the TigerXML sentence from the
+    given XML node into a :class:`lingtree.tree.Sentence`
+    '''
+    make_token = token_factory(projection)
+    terminals = []
+    for i, n in enumerate(node.find('graph').find('terminals').findall('t')):
+        attrib = n.attrib
+        try:
+            w = attrib['word']
+        except KeyError:
+            w = attrib['orth']
+        terminals.append(make_token(w, attrib.get('pos', '--'),
+                                    attrib.get('morph'), attrib.get('lemma'),
+                                    None, i))
+    t = Sentence(terminals)
+    t.sent_no = get_sent_no(node)
+    return t
+
+#pylint:disable=C0103
+def tiger_sent(node, projection=None):
+    '''
+    decodes the TigerXML sentence from the given XML node. With a
+    projection, only the terminals are decoded (see :func:`tiger_terminals`)
+    '''
+    if projection is not None:
+        return tiger_terminals(node, projection)
+    t = Tree()
+    term_ref = {}
+    graph = node.find('graph')
+    t.sent_no = get_sent_no(node)
     t.terminals = get_terminals(graph, term_ref)
     for n in graph.find('nonterminals').findall('nt'):
         nt = NontermNode(encoded_attrib(n, 'cat', '--'))
@@ -163,42 +192,150 @@ def make_string(n, attname):
         else:
             return str(val)
 
-def read_trees(fname):
-    '''yields the sequence of trees in an XML file'''
+def iter_elements(fname, tag, clear=True):
+    '''
+    yields the elements with the given tag from an XML file. Each element
+    is detached from its parent once the caller is done with it, so that
+    the memory used stays bounded irrespective of the file size.
+    With clear=False, the element itself is left intact so that the
+    caller can keep it around.
+    '''
     #pylint:disable=W0612
-    for ev, elem in etree.iterparse(fname):
-        if elem.tag == 's':
-            yield tiger_sent(elem)
-            elem.clear()
+    stack = []
+    for ev, elem in etree.iterparse(fname, events=('start', 'end')):
+        if ev == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag == tag:
+            yield elem
+            if clear:
+                elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+
+def read_trees(fname, projection=None):
+    '''yields the sequence of trees in an XML file'''
+    for elem in iter_elements(fname, 's'):
+        yield tiger_sent(elem, projection)
+
+def decode_raw_sentence(data):
+    xml_text, projection = data
+    return tiger_sent(etree.fromstring(xml_text), projection)
 
-def read_kbest_lists(fname):
+def raw_sentence_words(data):
+    result = []
+    elem = etree.fromstring(data[0])
+    for n in elem.find('graph').find('terminals').findall('t'):
+        try:
+            result.append(n.attrib['word'])
+        except KeyError:
+            result.append(n.attrib['orth'])
+    return result
+
+def read_raw_sentences(fname, projection=None):
+    '''
+    yields the sentences in an XML file as
+    :class:`lingtree.folds.RawSentence` objects. Each sentence
+    holds its serialized XML, as lxml elements cannot be pickled
+    to worker processes, and is parsed again when it is decoded.
+    The whole file is still parsed here, in the reading process.
+    '''
+    from .folds import RawSentence
+    for elem in iter_elements(fname, 's'):
+        yield RawSentence(get_sent_no(elem), None,
+                          (etree.tostring(elem), projection),
+                          decode_raw_sentence, raw_sentence_words)
+
+def kbest_scores(node_kbest):
+    '''
+    returns the (model-score, score) pair of a kbest-tree node,
+    with None for missing attributes
     '''
-    reads kbest lists of trees
+    attrib = node_kbest.attrib
+    score = attrib.get('model-score')
+    if score is not None:
+        score = float(score)
+    eval_score = attrib.get('score')
+    if eval_score is not None:
+        eval_score = float(eval_score)
+    return (score, eval_score)
+
+def decode_kbest(item):
+    '''
+    turns the (gold, [(kbest, model_score, eval_score), ...]) tuples
+    produced by :func:`read_kbest_lists` into trees. The nodes may be
+    either XML elements or their serialized form, which is what gets
+    sent to worker processes.
+    '''
+    node_gold, kbest_nodes = item
+    if isinstance(node_gold, bytes):
+        node_gold = etree.fromstring(node_gold)
+    t_gold = tiger_sent(node_gold)
+    kbest = []
+    for node_kbest_s, score, eval_score in kbest_nodes:
+        if isinstance(node_kbest_s, bytes):
+            node_kbest_s = etree.fromstring(node_kbest_s)
+        t = tiger_sent(node_kbest_s)
+        if score is not None:
+            t.score = score
+        if eval_score is not None:
+            t.eval_score = eval_score
+        kbest.append(t)
+    return (t_gold, kbest)
+
+def read_kbest_lists(fname, max_k=None, scores_only=False,
+                     num_workers=None, chunksize=16):
+    '''
+    reads kbest lists of trees, yielding a (gold tree, kbest trees)
+    pair for each sentence.
+
+    ``max_k`` -- if given, only the top max_k trees of each list
+    are decoded.
+
+    ``scores_only`` -- if True, no trees are built and the reader yields
+    (sent_no, [(model_score, score), ...]) pairs instead.
+
+    ``num_workers`` -- if larger than one, the trees are decoded in that
+    many worker processes, each receiving ``chunksize`` sentences at
+    a time. The output order is the same as in the file.
     '''
-    for ev, elem in etree.iterparse(fname):
-        if elem.tag == 'sentence':
-            node_gold = elem.find('gold-tree')
-            node_gold_s = node_gold.find('s')
-            t_gold = tiger_sent(node_gold_s)
-            kbest = []
-            for node_kbest in elem.findall('kbest-tree'):
-                node_kbest_s = node_kbest.find('s')
-                assert node_kbest_s is not None, node_kbest
-                t = tiger_sent(node_kbest_s)
-                if 'model-score' in node_kbest.attrib:
-                    t.score = float(node_kbest.attrib['model-score'])
-                if 'score' in node_kbest.attrib:
-                    t.eval_score = float(node_kbest.attrib['score'])
-                kbest.append(t)
-            yield (t_gold, kbest)
-            elem.clear()
+    items = _kbest_items(fname, max_k, scores_only, num_workers)
+    if scores_only:
+        return items
+    from .parallel import ordered_map
+    return ordered_map(decode_kbest, items, num_workers, chunksize)
+
+def _kbest_items(fname, max_k, scores_only, num_workers):
+    serialize = num_workers is not None and num_workers > 1
+    for elem in iter_elements(fname, 'sentence'):
+        node_gold_s = elem.find('gold-tree').find('s')
+        kbest_nodes = []
+        for node_kbest in elem.findall('kbest-tree'):
+            if max_k is not None and len(kbest_nodes) >= max_k:
+                break
+            score, eval_score = kbest_scores(node_kbest)
+            if scores_only:
+                kbest_nodes.append((score, eval_score))
+                continue
+            node_kbest_s = node_kbest.find('s')
+            assert node_kbest_s is not None, node_kbest
+            if serialize:
+                node_kbest_s = etree.tostring(node_kbest_s)
+            kbest_nodes.append((node_kbest_s, score, eval_score))
+        if scores_only:
+            yield (get_sent_no(node_gold_s), kbest_nodes)
+        elif serialize:
+            yield (etree.tostring(node_gold_s), kbest_nodes)
+        else:
+            yield (node_gold_s, kbest_nodes)
 
 def encode_tree(t, encoding=None, always_vroot=True,
                 id_suffix='', extra_term_att=None,
                 extra_nt_att=None):
     '''returns an XML node describing a tree'''
     if encoding is None:
-        encoding = t.encoding
+        encoding = getattr(t, 'encoding', None)
     assign_node_ids(t, suffix=id_suffix)
     s_node = etree.Element('s')
     s_node.attrib['id'] = t.xml_id
@@ -258,7 +395,7 @@ def describe_schema(f_out, schema, domain, encoding):
             for name in attr.names:
                 print('      <value name=%s>%s</value>'%(
                     quoteattr(name),
-                    escape(attr.descriptions[name].encode(encoding))), file=f_out)
+                    escape(attr.descriptions[name])), file=f_out)
             if attr.name == 'func':
                 print('    </edgelabel>', file=f_out)
             else:
@@ -267,8 +404,8 @@ def describe_schema(f_out, schema, domain, encoding):
             print('    <feature name="%s" domain="%s"/>'%(
                 attr.name, domain), file=f_out)
 
-def write_tiger_file(f_out, trees, meta=None, encoding="UTF-8",
-                     corpus_id="pytree_output"):
+def write_tiger_header(f_out, meta=None, encoding="UTF-8",
+                       corpus_id="pytree_output"):
     print('<?xml version="1.0" encoding="%s" standalone="yes"?>'%(encoding,), file=f_out)
     print('<corpus id="%s">'%(corpus_id,), file=f_out)
     print('<head>', file=f_out)
@@ -283,12 +420,22 @@ def write_tiger_file(f_out, trees, meta=None, encoding="UTF-8",
         print('  </annotation>', file=f_out)
     print('</head>', file=f_out)
     print('<body>', file=f_out)
-    for t in trees:
-        s_node = encode_tree(t, None)
-        write_node(f_out, s_node, encoding)
+
+def write_tiger_footer(f_out):
     print("</body>", file=f_out)
     print("</corpus>", file=f_out)
 
+def tiger_sentence_xml(t):
+    '''returns the (indented) TigerXML text for one sentence'''
+    return node_text(encode_tree(t, None))
+
+def write_tiger_file(f_out, trees, meta=None, encoding="UTF-8",
+                     corpus_id="pytree_output"):
+    write_tiger_header(f_out, meta, encoding, corpus_id)
+    for t in trees:
+        f_out.write(tiger_sentence_xml(t))
+    write_tiger_footer(f_out)
+
 
 def tiger2export_main(args):
     '''converts one file into .export format (body only)'''
@@ -69,13 +69,16 @@ class Tree(object):
     __slots__ = ['node_table', 'roots', 'terminals', '__dict__']
 
     def __getstate__(self):
-        return (self.node_table,
-                self.roots,
-                self.terminals,
-                self.__dict__)
+        # a flat record instead of the node graph, so that pickling
+        # does not recurse on deep trees
+        return tree_record(self)
 
     def __setstate__(self, state):
-        self.node_table, self.roots, self.terminals, self.__dict__ = state
+        if len(state) == 4:
+            # (node_table, roots, terminals, __dict__) from older versions
+            self.node_table, self.roots, self.terminals, self.__dict__ = state
+        else:
+            set_tree_record(self, state)
     """represents a syntax tree"""
 
     def __init__(self):
@@ -271,3 +274,191 @@ class TerminalNode(Node):
             a = a+"=#i[%s]" % (' '.join(pairs))
         a += " %s)" % (escape_mrg(self.word),)
         return a
+
+
+class Token(object):
+    """
+    lightweight terminal as produced by the terminals-only projection
+    of the readers. Attributes that a reader does not fill are None.
+    """
+    __slots__ = ['word', 'cat', 'morph', 'lemma', 'edge_label',
+                 'start', 'end', 'props', 'syn_parent', 'syn_label']
+    parent = None
+    children = ()
+
+    def __init__(self, word, cat, morph=None, lemma=None,
+                 edge_label=None, start=-1):
+        self.word = word
+        self.cat = cat
+        self.morph = morph
+        self.lemma = lemma
+        self.edge_label = edge_label
+        self.start = start
+        self.end = start + 1
+
+    def __repr__(self):
+        return '<%s/%s(%d) at %s>' % (self.word, self.cat, self.start,
+                                      hex(id(self)))
+
+    def isTerminal(self):
+        return True
+
+
+class Sentence(object):
+    """
+    lightweight sentence that only contains a sequence of terminals,
+    as produced by the terminals-only projection of the readers.
+    """
+    __slots__ = ['terminals', 'sent_no', 'doc_no', 'comment']
+
+    def __init__(self, terminals=None):
+        if terminals is None:
+            terminals = []
+        self.terminals = terminals
+
+    @property
+    def roots(self):
+        return self.terminals
+
+    def __iter__(self):
+        return iter(self.terminals)
+
+
+def token_factory(projection):
+    """
+    returns a function with the signature of the :class:`Token`
+    constructor. If projection is a list of field names, fields
+    not in that list are dropped.
+    """
+    if projection is None or projection == 'terminals':
+        return Token
+    wanted = set(projection)
+    keep = [x in wanted for x in ['morph', 'lemma', 'edge_label']]
+
+    def make_token(word, cat, morph=None, lemma=None, edge_label=None,
+                   start=-1):
+        return Token(word if 'word' in wanted else None,
+                     cat if 'cat' in wanted else None,
+                     morph if keep[0] else None,
+                     lemma if keep[1] else None,
+                     edge_label if keep[2] else None,
+                     start)
+    return make_token
+
+
+def preorder_nodes(t):
+    """
+    returns the nodes reachable from the roots in pre-order,
+    without recursion
+    """
+    result = []
+    stack = list(reversed(t.roots))
+    while stack:
+        n = stack.pop()
+        result.append(n)
+        if n.children:
+            stack.extend(reversed(n.children))
+    return result
+
+
+class NodeRef(int):
+    '''node index that stands in for a node reference in a flat record'''
+    pass
+
+
+def encode_value(v, index):
+    if isinstance(v, Node):
+        try:
+            return NodeRef(index[id(v)])
+        except KeyError:
+            return v
+    elif isinstance(v, list):
+        return [encode_value(x, index) for x in v]
+    elif isinstance(v, tuple):
+        return tuple([encode_value(x, index) for x in v])
+    elif isinstance(v, dict):
+        return dict([(k, encode_value(x, index)) for (k, x) in v.items()])
+    return v
+
+
+def decode_value(v, nodes):
+    if isinstance(v, NodeRef):
+        return nodes[v]
+    elif isinstance(v, list):
+        return [decode_value(x, nodes) for x in v]
+    elif isinstance(v, tuple):
+        return tuple([decode_value(x, nodes) for x in v])
+    elif isinstance(v, dict):
+        return dict([(k, decode_value(x, nodes)) for (k, x) in v.items()])
+    return v
+
+
+RECORD_VERSION = 1
+link_attrs = frozenset(['parent', 'children'])
+plain_types = frozenset([str, int, float, bool])
+
+
+def tree_record(t):
+    """
+    returns the flat record that a tree is pickled as: the class
+    and attributes of each node (without parent and children, and
+    with other node references replaced by :class:`NodeRef`), the
+    parent and children of each node as indices, and the terminals,
+    roots, node table and tree attributes.
+    """
+    nodes = preorder_nodes(t)
+    index = dict([(id(n), i) for (i, n) in enumerate(nodes)])
+    # nodes that cannot be reached from the roots
+    todo = list(t.terminals) + list(t.node_table.values())
+    while todo:
+        n = todo.pop()
+        if not isinstance(n, Node) or id(n) in index:
+            continue
+        index[id(n)] = len(nodes)
+        nodes.append(n)
+        todo.extend(n.children)
+        if n.parent is not None:
+            todo.append(n.parent)
+    states = []
+    parents = []
+    children = []
+    for n in nodes:
+        d = n.__dict__
+        state = {}
+        for k, v in d.items():
+            if v is None or type(v) in plain_types:
+                state[k] = v
+            elif k not in link_attrs:
+                state[k] = encode_value(v, index)
+        states.append((n.__class__, state))
+        parent = d.get('parent')
+        parents.append(-1 if parent is None else index[id(parent)])
+        kids = d.get('children')
+        if kids:
+            children.append([index[id(c)] for c in kids])
+        else:
+            children.append(None)
+    return (RECORD_VERSION, states, parents, children,
+            [index[id(n)] for n in t.terminals],
+            [index[id(n)] for n in t.roots],
+            encode_value(t.node_table, index),
+            encode_value(t.__dict__, index))
+
+
+def set_tree_record(t, record):
+    """sets up a tree from the result of :func:`tree_record`"""
+    (version, states, parents, children, term_idx, root_idx,
+     node_table, attrs) = record
+    nodes = [cls.__new__(cls) for (cls, d) in states]
+    for n, (cls, d), parent_idx, child_idx in zip(
+            nodes, states, parents, children):
+        for k, v in d.items():
+            if not (v is None or type(v) in plain_types):
+                d[k] = decode_value(v, nodes)
+        n.__dict__ = d
+        n.parent = None if parent_idx < 0 else nodes[parent_idx]
+        n.children = [] if child_idx is None else [nodes[i] for i in child_idx]
+    t.terminals = [nodes[i] for i in term_idx]
+    t.roots = [nodes[i] for i in root_idx]
+    t.node_table = decode_value(node_table, nodes)
+    t.__dict__ = decode_value(attrs, nodes)
@@ -0,0 +1,141 @@
+# Copyright 2008-2020 Yannick Versley
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial
+# portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED
+# TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF
+# CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+'''
+registry of tree transforms, i.e. functions that modify a tree
+in place, as used by ``lingtree_convert --xform NAME``.
+
+Besides the built-in transforms in :data:`builtin_xforms`, other
+packages can provide transforms through entry points in the
+``lingtree.xforms`` group. As with :func:`lingtree.util.load_plugin`,
+the entry point is called without arguments and returns the
+transform::
+
+    entry_points={'lingtree.xforms': [
+        'my_xform = mypackage.xforms:make_my_xform']}
+'''
+from __future__ import print_function
+import time
+from .export import secedge2nonprojective
+
+XFORM_GROUP = 'lingtree.xforms'
+
+builtin_xforms = {
+    'secedge2nonprojective': secedge2nonprojective,
+}
+
+
+def get_xform(name):
+    '''
+    returns the transform with the given name, from the built-in
+    transforms or from the ``lingtree.xforms`` entry points.
+    Raises KeyError for unknown names.
+    '''
+    try:
+        return builtin_xforms[name]
+    except KeyError:
+        from .util import load_plugin
+        return load_plugin(XFORM_GROUP, name)
+
+
+class XformChain(object):
+    '''
+    applies a sequence of transforms, given by name or as
+    functions, and measures the time that each of them takes.
+    Transforms given by name are looked up (again) after the
+    chain has been sent to a worker process.
+    '''
+    def __init__(self, xforms):
+        self.specs = list(xforms)
+        self.names = [x if isinstance(x, str) else getattr(x, '__name__', repr(x))
+                      for x in self.specs]
+        self.funcs = None
+
+    def __getstate__(self):
+        return (self.specs, self.names)
+
+    def __setstate__(self, state):
+        self.specs, self.names = state
+        self.funcs = None
+
+    def __len__(self):
+        return len(self.specs)
+
+    def resolve(self):
+        '''looks up the transforms (raises KeyError for unknown names)'''
+        if self.funcs is None:
+            self.funcs = [get_xform(x) if isinstance(x, str) else x
+                          for x in self.specs]
+        return self.funcs
+
+    def __call__(self, t):
+        '''transforms t and returns the time taken by each transform'''
+        times = []
+        for func in self.resolve():
+            t0 = time.time()
+            func(t)
+            times.append(time.time() - t0)
+        return times
+
+
+class XformTimer(object):
+    '''adds up the times taken by the transforms of an XformChain'''
+    def __init__(self, names):
+        self.names = names
+        self.seconds = [0.0] * len(names)
+        self.n_trees = 0
+
+    def add(self, times):
+        self.n_trees += 1
+        seconds = self.seconds
+        for i, x in enumerate(times):
+            seconds[i] += x
+
+    def summary(self):
+        '''returns one line per transform with its total time'''
+        total = max(sum(self.seconds), 1e-9)
+        return ['%s: %.2fs (%.0f%%, %.0f us/tree)' % (
+            name, secs, 100.0 * secs / total,
+            1e6 * secs / max(self.n_trees, 1))
+                for (name, secs) in zip(self.names, self.seconds)]
+
+
+class XformTask(object):
+    '''transforms one tree (in a worker) and returns it with the timings'''
+    def __init__(self, chain):
+        self.chain = chain
+
+    def __call__(self, t):
+        return (t, self.chain(t))
+
+
+def transform_trees(trees, xforms, num_workers=None, chunksize=64,
+                    timer=None):
+    '''
+    applies the transforms to each tree and yields the transformed
+    trees in the original order. With ``num_workers``, the trees are
+    transformed in a pool of worker processes. If a
+    :class:`XformTimer` is given, the time of each transform is
+    added to it.
+    '''
+    from .parallel import ordered_map
+    chain = xforms if isinstance(xforms, XformChain) else XformChain(xforms)
+    chain.resolve()
+    for t, times in ordered_map(XformTask(chain), trees, num_workers,
+                                chunksize):
+        if timer is not None:
+            timer.add(times)
+        yield t
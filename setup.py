@@ -13,10 +13,15 @@ setup(name='LingTree',
       packages=['lingtree', 'lingtree.eval'],
       package_dir={'':'py_src'},
       install_requires=['future', 'PyYAML', 'mock >= 2.0.0'],
+      extras_require={'arrays': ['numpy']},
       entry_points={
             'console_scripts': [
                   'lingtree_convert=lingtree:convert_main',
                   'lingtree_totext=lingtree:totext_main',
+                  'lingtree_join=lingtree:join_main',
+                  'lingtree_split=lingtree:split_main',
+                  'lingtree_deps=lingtree.deps:deps_main',
+                  'lingtree_deps_bench=lingtree.deps_bench:headrules_benchmark_main',
                   'lingtree_merge=lingtree.conll:merge_main',
                   'lingtree_recombine=lingtree.conll:recombine_main',
                   'lingtree_html=lingtree.csstree:csstree_main'